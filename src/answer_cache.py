@@ -0,0 +1,84 @@
+from __future__ import annotations
+from typing import List, Dict, Any, Optional, Iterable
+import threading
+import time
+from qdrant_client.http.models import Filter, FieldCondition, MatchValue, MatchAny, Range
+
+from vectorstore import VectorStore, ANSWER_CACHE_SCHEMA
+from config import qdrant_config, app_config
+
+class SemanticAnswerCache:
+	"""Answer cache keyed on the query embedding, stored in its own vector-store collection.
+
+	A lookup hits when the nearest cached query is within `threshold` cosine
+	similarity, younger than `ttl_s`, and every source point it cited still
+	exists. Re-ingestion deletes or replaces changed chunks (ids are
+	content-addressed), so a stale answer fails that check; entries are also
+	dropped eagerly via invalidate_sources().
+	"""
+
+	def __init__(self, store: VectorStore, vector_size: int, collection: str | None = None, threshold: float | None = None, ttl_s: float | None = None):
+		self.store = store
+		self.collection = collection or qdrant_config.answer_cache_collection
+		self.threshold = app_config.answer_cache_threshold if threshold is None else threshold
+		self.ttl_s = app_config.answer_cache_ttl_s if ttl_s is None else ttl_s
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+		self.store.ensure_collection(self.collection, vector_size, payload_schema=ANSWER_CACHE_SCHEMA)
+
+	def _count(self, hit: bool) -> None:
+		with self._lock:
+			if hit:
+				self.hits += 1
+			else:
+				self.misses += 1
+
+	def lookup(self, query_vec: List[float], target_collection: str | None = None) -> Optional[Dict[str, Any]]:
+		"""Return the cached entry payload (answer, docs, judgment, ...) or None."""
+		target = target_collection or qdrant_config.collection
+		filter_ = Filter(must=[
+			FieldCondition(key="collection", match=MatchValue(value=target)),
+			FieldCondition(key="created_at", range=Range(gte=time.time() - self.ttl_s)),
+		])
+		hits = self.store.query(self.collection, query_vec, top_k=1, filter_=filter_)
+		if not hits or hits[0]["score"] < self.threshold:
+			self._count(False)
+			return None
+		entry = hits[0]["payload"]
+		point_ids = entry.get("point_ids", [])
+		if point_ids and len(self.store.existing_ids(target, point_ids)) != len(set(point_ids)):
+			# A cited chunk was deleted or re-ingested with new content
+			self.store.delete(self.collection, [hits[0]["id"]])
+			self._count(False)
+			return None
+		self._count(True)
+		return entry | {"similarity": hits[0]["score"]}
+
+	def store_answer(self, query: str, query_vec: List[float], answer: str, docs: List[Dict[str, Any]], judgment: Optional[Dict[str, Any]] = None, target_collection: str | None = None) -> None:
+		target = target_collection or qdrant_config.collection
+		payload = {
+			"query": query,
+			"answer": answer,
+			"judgment": judgment,
+			"collection": target,
+			"created_at": time.time(),
+			"point_ids": [str(pid) for d in docs for pid in d.get("ids", [d["id"]])],
+			"sources": sorted({d.get("payload", {}).get("source", "unknown") for d in docs}),
+			# Only what the app needs to render the sources list
+			"docs": [{"id": str(d["id"]), "payload": {k: v for k, v in d.get("payload", {}).items() if k != "text"}} for d in docs],
+		}
+		self.store.upsert(self.collection, [query_vec], [payload])
+		self.purge_expired()
+
+	def invalidate_sources(self, sources: Iterable[str]) -> None:
+		sources = list(sources)
+		if sources:
+			self.store.delete_where(self.collection, Filter(must=[FieldCondition(key="sources", match=MatchAny(any=sources))]))
+
+	def purge_expired(self) -> None:
+		self.store.delete_where(self.collection, Filter(must=[FieldCondition(key="created_at", range=Range(lt=time.time() - self.ttl_s))]))
+
+	def stats(self) -> Dict[str, float]:
+		total = self.hits + self.misses
+		return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
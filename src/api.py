@@ -0,0 +1,239 @@
+from __future__ import annotations
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Union
+from contextlib import asynccontextmanager
+from datetime import datetime
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict
+
+from batching import Overloaded
+from embeddings import BatchedEmbeddingService
+from reranker import BatchedReranker
+from retrieval import AsyncRetriever
+from vectorstore import AsyncQdrantStore, ThreadedAsyncStore, make_async_store, document_filter
+from llm import LLMService
+from registry import registry
+from metrics import metrics
+from config import api_config
+
+class QueryRequest(BaseModel):
+	query: str
+	top_k: int = 20
+	mmr_k: int = 8
+	mmr_lambda: Optional[float] = None
+	collection: Optional[str] = None
+	# Search-time recall/latency knobs (default: QDRANT_SEARCH_HNSW_EF and the collection profile)
+	hnsw_ef: Optional[int] = None
+	oversampling: Optional[float] = None
+	# Metadata filters, applied inside the vector search: any of these sources/symbols, chunks overlapping [start, end]
+	sources: Optional[List[str]] = None
+	symbols: Optional[List[str]] = None
+	start: Optional[datetime] = None
+	end: Optional[datetime] = None
+
+	def search_filter(self):
+		return document_filter(self.sources, self.symbols, self.start, self.end)
+
+class CandidatePayload(BaseModel):
+	model_config = ConfigDict(extra="allow")
+	text: str
+
+class RerankCandidate(BaseModel):
+	"""A /retrieve doc; scores and other payload fields pass through untouched."""
+	model_config = ConfigDict(extra="allow")
+	id: Union[str, int]
+	payload: CandidatePayload
+
+class RerankRequest(BaseModel):
+	query: str
+	candidates: List[RerankCandidate]
+
+class AnswerRequest(QueryRequest):
+	history: List[Dict[str, str]] = []
+	stream: bool = True
+
+
+class QueryService:
+	"""Shared state behind the HTTP API: async vector store, micro-batched models, LLM and admission limits."""
+
+	def __init__(self, store: AsyncQdrantStore | ThreadedAsyncStore | None = None, embedder: BatchedEmbeddingService | None = None, reranker: BatchedReranker | None = None, llm: LLMService | None = None):
+		self.store = store or make_async_store(registry.store)
+		# The registry's embedder/reranker are the same micro-batched instances the Streamlit app uses
+		self.embedder = embedder or registry.embedder()
+		self.reranker = reranker or registry.reranker()
+		self.retriever = AsyncRetriever(self.store, self.embedder, self.reranker)
+		self.llm = llm or LLMService()
+		self.inflight = 0
+		self.rejected = 0
+		self._llm_slots: asyncio.Semaphore | None = None
+
+	def admit(self) -> None:
+		if self.inflight >= api_config.max_inflight:
+			self.rejected += 1
+			raise HTTPException(status_code=429, detail="Too many requests in flight", headers={"Retry-After": "1"})
+		self.inflight += 1
+
+	def release(self) -> None:
+		self.inflight -= 1
+
+	async def acquire_llm(self) -> None:
+		if self._llm_slots is None:
+			self._llm_slots = asyncio.Semaphore(api_config.llm_concurrency)
+		try:
+			await asyncio.wait_for(self._llm_slots.acquire(), api_config.llm_wait_s)
+		except asyncio.TimeoutError:
+			raise HTTPException(status_code=503, detail="LLM busy", headers={"Retry-After": "5"})
+
+	def release_llm(self) -> None:
+		self._llm_slots.release()
+
+	async def close(self) -> None:
+		await self.store.close()
+
+	def stats(self) -> Dict[str, Any]:
+		return {
+			"inflight": self.inflight,
+			"rejected": self.rejected,
+			"embed_batches": self.embedder.batch_stats(),
+			"rerank_batches": self.reranker.batch_stats(),
+		}
+
+
+class _ReleasingStream(StreamingResponse):
+	"""StreamingResponse that calls `on_close` when the response ends, even if the body was never iterated.
+
+	A client that disconnects before the first chunk cancels the stream before
+	the body generator starts, so a `finally` inside the generator never runs.
+	"""
+
+	def __init__(self, content: AsyncIterator[str], on_close: Callable[[], None], **kwargs):
+		super().__init__(content, **kwargs)
+		self.on_close = on_close
+
+	async def __call__(self, scope, receive, send) -> None:
+		try:
+			await super().__call__(scope, receive, send)
+		finally:
+			self.on_close()
+
+
+def _doc(d: Dict[str, Any]) -> Dict[str, Any]:
+	return {k: d[k] for k in ("id", "ids", "score", "rrf_score", "rerank_score", "payload") if k in d} | {"id": str(d["id"])}
+
+
+def create_app(service: QueryService | None = None) -> FastAPI:
+	"""Build the API. Without `service`, one is created on startup from the shared registry."""
+
+	@asynccontextmanager
+	async def lifespan(app: FastAPI):
+		app.state.service = service or QueryService()
+		yield
+		await app.state.service.close()
+
+	app = FastAPI(title="RAG query API", lifespan=lifespan)
+
+	@app.exception_handler(Overloaded)
+	async def overloaded(request: Request, exc: Overloaded):
+		return JSONResponse({"detail": str(exc)}, status_code=429, headers={"Retry-After": "1"})
+
+	@app.get("/healthz")
+	async def healthz():
+		return {"status": "ok"}
+
+	@app.get("/metrics")
+	async def prometheus():
+		return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+	@app.get("/stats")
+	async def stats(request: Request):
+		return request.app.state.service.stats()
+
+	@app.post("/retrieve")
+	async def retrieve(req: QueryRequest, request: Request):
+		svc: QueryService = request.app.state.service
+		svc.admit()
+		try:
+			timings: Dict[str, Any] = {}
+			docs = await svc.retriever.retrieve(req.query, req.top_k, req.mmr_k, filter_=req.search_filter(), collection=req.collection, mmr_lambda=req.mmr_lambda, timings=timings, hnsw_ef=req.hnsw_ef, oversampling=req.oversampling)
+			return {"docs": [_doc(d) for d in docs], "timings": timings}
+		finally:
+			svc.release()
+
+	@app.post("/rerank")
+	async def rerank(req: RerankRequest, request: Request):
+		svc: QueryService = request.app.state.service
+		svc.admit()
+		try:
+			timings: Dict[str, Any] = {}
+			docs = await svc.retriever.rerank(req.query, [c.model_dump() for c in req.candidates], timings)
+			return {"docs": [_doc(d) for d in docs], "timings": timings}
+		finally:
+			svc.release()
+
+	@app.post("/answer")
+	async def answer(req: AnswerRequest, request: Request):
+		svc: QueryService = request.app.state.service
+		svc.admit()
+		try:
+			start = time.perf_counter()
+			timings: Dict[str, Any] = {}
+			docs = await svc.retriever.search(req.query, req.top_k, req.mmr_k, filter_=req.search_filter(), collection=req.collection, mmr_lambda=req.mmr_lambda, timings=timings, hnsw_ef=req.hnsw_ef, oversampling=req.oversampling)
+			history, _, docs, timings["context"] = svc.llm.fit_context(req.query, req.history, [], docs)
+			messages = svc.llm.build_messages(req.query, history, [], docs)
+			timings["retrieval_s"] = time.perf_counter() - start
+			sources = [_doc(d) for d in docs]
+			await svc.acquire_llm()
+		except BaseException:
+			svc.release()
+			raise
+
+		released = False
+
+		def release() -> None:
+			# The admission and LLM slots are held until the last token is sent, or the client goes away
+			nonlocal released
+			if not released:
+				released = True
+				svc.release_llm()
+				svc.release()
+
+		async def tokens() -> AsyncIterator[str]:
+			try:
+				timings["llm"] = {}
+				async for token in svc.llm.achat(messages, timings["llm"]):
+					yield token
+				timings["total_s"] = time.perf_counter() - start
+			finally:
+				release()
+
+		if not req.stream:
+			try:
+				text = "".join([t async for t in tokens()])
+			finally:
+				release()
+			return {"answer": text, "sources": sources, "timings": timings}
+
+		async def ndjson() -> AsyncIterator[str]:
+			async for token in tokens():
+				yield json.dumps({"token": token}) + "\n"
+			yield json.dumps({"done": True, "sources": sources, "timings": timings}) + "\n"
+
+		return _ReleasingStream(ndjson(), release, media_type="application/x-ndjson")
+
+	return app
+
+
+app = create_app()
+
+
+def main():
+	import uvicorn
+	uvicorn.run(app, host=api_config.host, port=api_config.port)
+
+
+if __name__ == "__main__":
+	main()
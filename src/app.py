@@ -5,11 +5,18 @@ from config import app_config, judge_config
 from retrieval import Retriever
 from memory import ShortTermMemory, LongTermMemory
 from llm import LLMService
-from judge import LLMJudge
-from vectorstore import QdrantStore, init_default_collections
+from judge import LLMJudge, BackgroundJudge
+from registry import registry
+from metrics import metrics
+from vectorstore import document_filter
 
 st.set_page_config(page_title=app_config.app_title, layout="wide")
 
+# Loads models/clients once per process; later reruns hit the registry cache.
+load_times = registry.warm_up()
+if app_config.metrics_port:
+	registry.get("metrics_server", lambda: metrics.serve(app_config.metrics_port))
+
 if "short_mem" not in st.session_state:
 	st.session_state.short_mem = ShortTermMemory(max_messages=30)
 if "session_id" not in st.session_state:
@@ -21,21 +28,48 @@ with st.sidebar:
 	st.header("Settings")
 	top_k = st.slider("Top K", 5, 50, 20)
 	mmr_k = st.slider("MMR K", 2, 20, 8)
+	mmr_lambda = st.slider("MMR Lambda (relevance vs. diversity)", 0.0, 1.0, app_config.mmr_lambda, 0.05)
 	use_memory = st.checkbox("Use long-term memory", value=True)
+	use_answer_cache = st.checkbox("Use answer cache", value=app_config.answer_cache_enabled)
 	enable_judge = st.checkbox("Enable LLM Judge", value=judge_config.enabled)
+	judge_sync = st.checkbox("Wait for judge (synchronous check)", value=judge_config.mode == "sync")
 	judge_threshold = st.slider("Judge Threshold", 1.0, 10.0, judge_config.threshold, 0.5)
+	st.subheader("Filters")
+	# Pushed into the vector search (indexed payload fields), not applied to its results
+	filter_sources = st.text_input("Sources (comma-separated paths)", "")
+	filter_symbols = st.text_input("Tickers (comma-separated)", "")
+	use_dates = st.checkbox("Limit to a date range", value=False)
+	date_range = st.date_input("Date range", value=()) if use_dates else ()
 	st.divider()
+	with st.expander("Resource load times"):
+		for name, seconds in load_times.items():
+			st.write(f"{name}: {seconds:.2f}s")
+	if registry.embedder().cache is not None:
+		with st.expander("Embedding cache"):
+			st.json(registry.embedder().cache.stats())
+	with st.expander("Micro-batching"):
+		st.json({"embed": registry.embedder().batch_stats(), "rerank": registry.reranker().batch_stats()})
+	if "background_judge" in registry.load_times():
+		with st.expander("Background judge"):
+			st.json(registry.get("background_judge", BackgroundJudge).stats())
+	if "long_term_memory" in registry.load_times():
+		with st.expander("Long-term memory"):
+			st.json(registry.get("long_term_memory", LongTermMemory).stats())
+	if app_config.answer_cache_enabled:
+		with st.expander("Answer cache"):
+			st.json(registry.answer_cache().stats())
 	#st.markdown("Start Qdrant via: `docker compose up -d qdrant`")
 
-store = QdrantStore()
-init_default_collections(store)
-retriever = Retriever(store=store)
-mem_long = LongTermMemory(store=store)
+retriever = Retriever()
+# One write-behind queue and compaction thread per process
+mem_long = registry.get("long_term_memory", LongTermMemory)
 llm = None
 judge = None
+background_judge = None
 try:
 	llm = LLMService()
 	judge = LLMJudge()
+	background_judge = registry.get("background_judge", BackgroundJudge)
 except Exception as e:
 	st.warning(f"LLM not initialized: {e}")
 
@@ -45,14 +79,53 @@ with st.form(key="chat_form", clear_on_submit=True):
 	query = st.text_area("Ask a question", height=120)
 	submitted = st.form_submit_button("Send")
 
-if submitted and query.strip():
+def render_sources(docs, timings):
+	st.markdown("### Sources")
+	for i, d in enumerate(docs):
+		meta = d.get("payload", {})
+		source = meta.get("source", "unknown")
+		st.write(f"[Doc {i+1}] {source}")
+	with st.expander("Timing"):
+		st.json(timings)
+
+search_filter = document_filter(
+	[s.strip() for s in filter_sources.split(",") if s.strip()],
+	[s.strip() for s in filter_symbols.split(",") if s.strip()],
+	*(date_range if len(date_range) == 2 else (None, None)),
+)
+# Cached answers were produced without filters
+use_answer_cache = use_answer_cache and search_filter is None
+
+cached = None
+if submitted and query.strip() and use_answer_cache and app_config.answer_cache_enabled:
+	query_vec = registry.embedder().embed_text(query)
+	cached = registry.answer_cache().lookup(query_vec)
+
+if cached:
+	st.session_state.short_mem.add("user", query)
+	with chat_container:
+		st.markdown("### Answer")
+		col1, col2 = st.columns([2,1])
+		with col1:
+			st.markdown(cached["answer"])
+			st.caption(f"Served from answer cache (similarity {cached['similarity']:.3f})")
+			if cached.get("judgment"):
+				with st.expander("Judge Details"):
+					st.json(cached["judgment"])
+			st.session_state.short_mem.add("assistant", cached["answer"])
+		with col2:
+			render_sources(cached["docs"], {"answer_cache": "hit"})
+elif submitted and query.strip():
+	trace = metrics.start_trace()
 	st.session_state.short_mem.add("user", query)
 	long_mem_docs = mem_long.recall(st.session_state.session_id, query, top_k=5) if use_memory else []
-	docs = retriever.search(query, top_k=top_k, mmr_k=mmr_k)
+	timings = {}
+	docs = retriever.search(query, top_k=top_k, mmr_k=mmr_k, filter_=search_filter, mmr_lambda=mmr_lambda, timings=timings)
 	with chat_container:
 		st.markdown("### Answer")
 		if llm:
-			messages = llm.build_messages(query, st.session_state.short_mem.get(), long_mem_docs, docs)
+			history, long_mem_docs, docs, timings["context"] = llm.fit_context(query, st.session_state.short_mem.get(), long_mem_docs, docs)
+			messages = llm.build_messages(query, history, long_mem_docs, docs)
 			placeholder = st.empty()
 			col1, col2 = st.columns([2,1])
 			with col1:
@@ -60,9 +133,15 @@ if submitted and query.strip():
 				for token in llm.chat(messages):
 					accum += token
 					placeholder.markdown(accum)
+				timings["llm"] = llm.last_metrics
 				
-				# Judge validation if enabled
-				if enable_judge and judge:
+				judgment = None
+				should_regenerate = False
+				# Judge validation if enabled: off the request path unless a synchronous check is requested
+				if enable_judge and background_judge and not judge_sync:
+					if background_judge.submit(query, accum, docs, {"session_id": st.session_state.session_id}):
+						st.caption("Queued for background judging")
+				elif enable_judge and judge:
 					with st.spinner("Validating response..."):
 						judgment = judge.validate_response(query, accum, docs)
 						should_regenerate = judge.should_regenerate(judgment, judge_threshold)
@@ -79,11 +158,20 @@ if submitted and query.strip():
 				st.session_state.short_mem.add("assistant", accum)
 				if use_memory:
 					mem_long.add(st.session_state.session_id, "assistant", accum)
+				if use_answer_cache and app_config.answer_cache_enabled and accum and not should_regenerate:
+					registry.answer_cache().store_answer(query, query_vec, accum, docs, judgment)
 			with col2:
-				st.markdown("### Sources")
-				for i, d in enumerate(docs):
-					meta = d.get("payload", {})
-					source = meta.get("source", "unknown")
-					st.write(f"[Doc {i+1}] {source}")
+				render_sources(docs, timings)
 		else:
 			st.info("Provide OLLAMA in .env to enable answers.")
+	trace.finish()
+	breakdown = trace.breakdown()
+	llm_stats = timings.get("llm") or {}
+	for key in ("prompt_eval", "eval"):
+		if f"{key}_s" in llm_stats:
+			breakdown.append({"span": f"ollama.{key} ({llm_stats[f'{key}_count']} tokens)", "start_ms": None, "duration_ms": llm_stats[f"{key}_s"] * 1000, "depth": 1})
+	st.session_state.last_breakdown = breakdown
+
+if metrics.enabled and st.session_state.get("last_breakdown"):
+	with st.sidebar.expander("Last query breakdown", expanded=True):
+		st.dataframe([{"stage": "  " * s["depth"] + s["span"], "start_ms": s["start_ms"], "ms": round(s["duration_ms"], 1)} for s in st.session_state.last_breakdown], hide_index=True)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+from concurrent.futures import Future
+import asyncio
+import queue
+import threading
+import time
+
+
+class Overloaded(RuntimeError):
+	"""Raised when a batcher's queue is full; callers should shed load (e.g. HTTP 429)."""
+
+
+class SizeHistogram:
+	"""Counts of observed sizes in power-of-two buckets (1, 2, 3-4, 5-8, ...)."""
+
+	def __init__(self):
+		self.counts: Dict[int, int] = {}
+
+	def observe(self, n: int) -> None:
+		bucket = 1 << max(0, n - 1).bit_length()
+		self.counts[bucket] = self.counts.get(bucket, 0) + 1
+
+	def snapshot(self) -> Dict[str, int]:
+		out = {}
+		for bucket in sorted(self.counts):
+			low = bucket // 2 + 1
+			out[str(bucket) if low >= bucket else f"{low}-{bucket}"] = self.counts[bucket]
+		return out
+
+
+class MicroBatcher:
+	"""Groups single-item calls from concurrent threads or coroutines into batched calls of `fn`.
+
+	The first queued item opens a batch; a dispatcher thread sends it once it
+	holds `max_batch` items or `max_wait_ms` has passed. `fn(items) -> results`
+	runs one batch at a time on that thread, so the model sees a single caller.
+	At most `max_queue` items may wait; beyond that callers get Overloaded.
+	"""
+
+	def __init__(self, fn: Callable[[List[Any]], Sequence[Any]], max_batch: int = 32, max_wait_ms: float = 5.0, max_queue: int = 1024, name: str = "batcher"):
+		self.fn = fn
+		self.max_batch = max(1, max_batch)
+		self.max_wait_s = max_wait_ms / 1000
+		self.name = name
+		self.batches = 0
+		self.items = 0
+		self.wait_s = 0.0
+		self.histogram = SizeHistogram()
+		self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+		self._lock = threading.Lock()
+		self._thread: threading.Thread | None = None
+
+	def _put(self, item: Any) -> Future:
+		if self._thread is None:
+			with self._lock:
+				if self._thread is None:
+					self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+					self._thread.start()
+		future: Future = Future()
+		try:
+			self._queue.put_nowait((item, future, time.perf_counter()))
+		except queue.Full:
+			raise Overloaded(f"{self.name} queue full ({self._queue.maxsize} waiting)")
+		return future
+
+	def call(self, item: Any) -> Any:
+		"""Blocking call from any thread."""
+		return self._put(item).result()
+
+	async def submit(self, item: Any) -> Any:
+		"""Awaitable call from a coroutine; the event loop is not blocked while the batch runs."""
+		return await asyncio.wrap_future(self._put(item))
+
+	def _collect(self) -> List[Tuple[Any, Future, float]]:
+		batch = [self._queue.get()]
+		deadline = time.perf_counter() + self.max_wait_s
+		while len(batch) < self.max_batch:
+			remaining = deadline - time.perf_counter()
+			try:
+				batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+			except queue.Empty:
+				break
+		return batch
+
+	def _run(self) -> None:
+		while True:
+			# Callers that gave up (e.g. disconnected clients) don't need a result
+			batch = [b for b in self._collect() if b[1].set_running_or_notify_cancel()]
+			if not batch:
+				continue
+			started = time.perf_counter()
+			try:
+				results = self.fn([item for item, _, _ in batch])
+			except Exception as e:
+				for _, fut, _ in batch:
+					fut.set_exception(e)
+				continue
+			with self._lock:
+				self.batches += 1
+				self.items += len(batch)
+				self.wait_s += sum(started - queued for _, _, queued in batch)
+				self.histogram.observe(len(batch))
+			for (_, fut, _), result in zip(batch, results):
+				fut.set_result(result)
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			return {
+				"batches": self.batches,
+				"items": self.items,
+				"mean_batch": self.items / self.batches if self.batches else 0.0,
+				"mean_wait_ms": self.wait_s * 1000 / self.items if self.items else 0.0,
+				"queued": self._queue.qsize(),
+				"batch_sizes": self.histogram.snapshot(),
+			}
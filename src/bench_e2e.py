@@ -0,0 +1,217 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+from typing import List, Dict, Any
+import numpy as np
+import ollama
+
+from chunking import iter_parsed_items
+from embeddings import EmbeddingService, BatchedEmbeddingService
+from reranker import BatchedReranker
+from vectorstore import QdrantStore
+from retrieval import Retriever
+from sparse import SparseEncoder
+from llm import LLMService
+from fake_ollama import FakeOllama
+from loadtest_api import QUERIES
+from config import app_config, embedding_config, reranker_config
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+COLLECTION = "bench_e2e"
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+	if not values:
+		return {}
+	p50, p95, p99 = np.percentile(values, [50, 95, 99])
+	return {"p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000, "mean_ms": float(np.mean(values)) * 1000}
+
+
+def _peak_rss_mb() -> Dict[str, float]:
+	# ru_maxrss is KiB on Linux; children covers the parse process pool
+	return {
+		"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+		"children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+	}
+
+
+def _git_commit() -> str:
+	try:
+		return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+	except Exception:
+		return "unknown"
+
+
+def bench_parse(paths: List[str], backend: str | None) -> tuple:
+	items = [{"path": p} for p in paths]
+	total_bytes = sum(os.path.getsize(p) for p in paths)
+	chunks: List[Dict[str, Any]] = []
+	start = time.perf_counter()
+	for _, file_chunks in iter_parsed_items(items, backend=backend):
+		chunks.extend(file_chunks or [])
+	elapsed = time.perf_counter() - start
+	return chunks, {
+		"files": len(paths),
+		"mb": total_bytes / 1e6,
+		"seconds": elapsed,
+		"mb_per_s": total_bytes / 1e6 / elapsed,
+		"chunks": len(chunks),
+		"chunks_per_s": len(chunks) / elapsed,
+	}
+
+
+def bench_embed(embedder: EmbeddingService, texts: List[str], batch_size: int) -> tuple:
+	vectors: List[List[float]] = []
+	start = time.perf_counter()
+	for i in range(0, len(texts), batch_size):
+		vectors.extend(embedder.embed_texts(texts[i:i + batch_size]))
+	elapsed = time.perf_counter() - start
+	return vectors, {"texts": len(texts), "batch_size": batch_size, "seconds": elapsed, "embeddings_per_s": len(texts) / elapsed}
+
+
+def bench_upsert(store: QdrantStore, chunks: List[Dict[str, Any]], vectors: List[List[float]], batch_size: int, hybrid: bool) -> Dict[str, Any]:
+	store.ensure_collection(COLLECTION, len(vectors[0]), sparse=hybrid)
+	sparse = SparseEncoder() if hybrid else None
+	payloads = [c["metadata"] | {"text": c["text"]} for c in chunks]
+	start = time.perf_counter()
+	sparse_vectors = sparse.encode_documents([c["text"] for c in chunks]) if sparse else None
+	if batch_size:
+		for i in range(0, len(chunks), batch_size):
+			store.upsert(COLLECTION, vectors[i:i + batch_size], payloads[i:i + batch_size], sparse_vectors=sparse_vectors[i:i + batch_size] if sparse_vectors else None)
+	else:
+		# Bulk path used by ingestion: byte-sized batches, un-waited, then the flush() barrier
+		store.upload(COLLECTION, np.asarray(vectors, dtype=np.float32), payloads, sparse_vectors=sparse_vectors)
+		store.flush()
+	elapsed = time.perf_counter() - start
+	return {"points": len(chunks), "batch_size": batch_size or "bulk", "hybrid": hybrid, "seconds": elapsed, "upserts_per_s": len(chunks) / elapsed}
+
+
+def bench_query(retriever: Retriever, llm: LLMService, queries: List[str], top_k: int, mmr_k: int) -> Dict[str, Any]:
+	stages: Dict[str, List[float]] = {k: [] for k in ("embed", "search", "mmr", "rerank", "retrieval", "context", "prompt_eval", "ttft", "generation", "total")}
+	for query in queries:
+		timings: Dict[str, Any] = {}
+		start = time.perf_counter()
+		docs = retriever.search(query, top_k=top_k, mmr_k=mmr_k, collection=COLLECTION, timings=timings)
+		retrieved = time.perf_counter()
+		history, memory, docs, _ = llm.fit_context(query, [], [], docs)
+		messages = llm.build_messages(query, history, memory, docs)
+		prompt_ready = time.perf_counter()
+		first = None
+		for token in llm.chat(messages):
+			if first is None and token:
+				first = time.perf_counter()
+		end = time.perf_counter()
+		stages["embed"].append(timings.get("embed_s", 0.0))
+		stages["search"].append(timings.get("search_s", 0.0))
+		stages["mmr"].append(timings.get("mmr_s", 0.0))
+		stages["rerank"].append(timings.get("rerank", {}).get("total_s", 0.0))
+		stages["retrieval"].append(retrieved - start)
+		stages["context"].append(prompt_ready - retrieved)
+		stages["prompt_eval"].append(llm.last_metrics.get("prompt_eval_s", 0.0))
+		stages["ttft"].append((first or end) - start)
+		stages["generation"].append(end - prompt_ready)
+		stages["total"].append(end - start)
+	return {"queries": len(queries), "top_k": top_k, "mmr_k": mmr_k, "stages": {k: _percentiles(v) for k, v in stages.items()}}
+
+
+def _flatten(d: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+	out = {}
+	for k, v in d.items():
+		key = f"{prefix}{k}"
+		if isinstance(v, dict):
+			out.update(_flatten(v, key + "."))
+		elif isinstance(v, (int, float)) and not isinstance(v, bool):
+			out[key] = v
+	return out
+
+
+def compare(base_path: str, result: Dict[str, Any]) -> None:
+	with open(base_path, "r", encoding="utf-8") as f:
+		base = _flatten(json.load(f))
+	current = _flatten(result)
+	print(f"{'metric':<40} {'base':>12} {'current':>12} {'change':>8}")
+	for key in sorted(set(base) & set(current)):
+		if key.startswith("meta."):
+			continue
+		b, c = base[key], current[key]
+		change = f"{(c - b) / b * 100:+.1f}%" if b else "-"
+		print(f"{key:<40} {b:>12.2f} {c:>12.2f} {change:>8}")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="End-to-end ingest and query benchmark on the bundled fixtures (in-memory Qdrant, fake Ollama)")
+	parser.add_argument("--docs", default=os.path.join(_ROOT, "docs", "*.pdf"))
+	parser.add_argument("--csv", default=os.path.join(_ROOT, "largedataset", "*.csv"))
+	parser.add_argument("--csv-files", type=int, default=0, help="Use only the first N CSV files (0 = all)")
+	parser.add_argument("--max-chunks", type=int, default=0, help="Embed/upsert at most N chunks (0 = all)")
+	parser.add_argument("--parse-backend", default=None, help="processes or threads (default: PARSE_BACKEND)")
+	parser.add_argument("--embed-batch-size", type=int, default=app_config.embed_batch_size)
+	parser.add_argument("--upsert-batch-size", type=int, default=0, help="Points per waited upsert (0 = bulk upload path)")
+	parser.add_argument("--queries", type=int, default=50, help="Number of queries (cycling through a fixed set)")
+	parser.add_argument("--top-k", type=int, default=20)
+	parser.add_argument("--mmr-k", type=int, default=8)
+	parser.add_argument("--token-rate", type=float, default=100.0, help="Fake Ollama streaming tokens per second")
+	parser.add_argument("--output", default=None, help="Result JSON path (default: bench_results/e2e-<timestamp>.json)")
+	parser.add_argument("--compare", default=None, help="Earlier result JSON to diff against")
+	args = parser.parse_args()
+
+	csv_paths = sorted(glob.glob(args.csv))
+	if args.csv_files:
+		csv_paths = csv_paths[:args.csv_files]
+	paths = sorted(glob.glob(args.docs)) + csv_paths
+	if not paths:
+		raise SystemExit("No fixture files found")
+
+	result: Dict[str, Any] = {
+		"meta": {
+			"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"commit": _git_commit(),
+			"python": platform.python_version(),
+			"cpus": os.cpu_count(),
+			"chunker": app_config.chunker,
+			"csv_mode": app_config.csv_mode,
+			"embedding_model": embedding_config.mdel_name,
+			"reranker_model": reranker_config.mdel_name,
+			"hybrid": app_config.hybrid_search,
+		},
+	}
+	print(f"Parsing {len(paths)} files...")
+	chunks, result["parse"] = bench_parse(paths, args.parse_backend)
+	if args.max_chunks:
+		chunks = chunks[:args.max_chunks]
+
+	service = EmbeddingService()
+	# Measure the model, not the embedding cache
+	service.cache = None
+	print(f"Embedding {len(chunks)} chunks...")
+	vectors, result["embed"] = bench_embed(service, [c["text"] for c in chunks], args.embed_batch_size)
+
+	store = QdrantStore(url=":memory:")
+	print("Upserting...")
+	result["upsert"] = bench_upsert(store, chunks, vectors, args.upsert_batch_size, app_config.hybrid_search)
+
+	with FakeOllama(token_rate=args.token_rate) as fake:
+		retriever = Retriever(store, BatchedEmbeddingService(service), BatchedReranker())
+		llm = LLMService(client=ollama.Client(host=fake.url))
+		queries = [QUERIES[i % len(QUERIES)] for i in range(args.queries)]
+		print(f"Running {len(queries)} queries...")
+		result["query"] = bench_query(retriever, llm, queries, args.top_k, args.mmr_k)
+	result["peak_rss_mb"] = _peak_rss_mb()
+
+	output = args.output or os.path.join("bench_results", f"e2e-{time.strftime('%Y%m%d-%H%M%S')}.json")
+	os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+	with open(output, "w", encoding="utf-8") as f:
+		json.dump(result, f, indent=2)
+	print(json.dumps({k: v for k, v in result.items() if k != "meta"}, indent=2))
+	print(f"Wrote {output}")
+	if args.compare:
+		compare(args.compare, result)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,52 @@
+import argparse
+from typing import List, Dict, Any
+import ollama
+
+from fake_ollama import FakeOllama
+from llm import LLMService
+
+
+def _docs(turn: int) -> List[Dict[str, Any]]:
+	"""Different retrieved context every turn, as in a real conversation."""
+	return [
+		{"id": f"{turn}-{i}", "score": 1.0 - i / 10, "payload": {"source": f"report_{turn}_{i}.pdf", "chunk_index": i, "text": f"Quarter {turn} note {i}: " + "revenue and margin details " * 20}}
+		for i in range(3)
+	]
+
+
+def _run(stable: bool, turns: int, url: str) -> List[Dict[str, Any]]:
+	llm = LLMService(client=ollama.Client(host=url))
+	llm.stable_prefix = stable
+	short_mem: List[Dict[str, Any]] = []
+	rows = []
+	for turn in range(turns):
+		query = f"What happened to revenue in quarter {turn}?"
+		history, memory, docs, _ = llm.fit_context(query, short_mem, [], _docs(turn))
+		answer = "".join(llm.chat(llm.build_messages(query, history, memory, docs)))
+		short_mem += [{"role": "user", "content": query}, {"role": "assistant", "content": answer}]
+		rows.append(llm.last_metrics)
+	return rows
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Compare prompt-eval work per turn with and without the stable prompt prefix (against a local fake Ollama)")
+	parser.add_argument("--turns", type=int, default=10)
+	parser.add_argument("--token-rate", type=float, default=500.0, help="Fake server streaming tokens per second")
+	args = parser.parse_args()
+
+	results = {}
+	for stable in (False, True):
+		# Fresh server per mode so the simulated KV cache starts cold
+		with FakeOllama(token_rate=args.token_rate) as server:
+			results[stable] = _run(stable, args.turns, server.url)
+			body = server.requests[-1]["body"]
+			print(f"stable_prefix={stable}: keep_alive={body.get('keep_alive')} options={body.get('options')}")
+	print(f"{'turn':>5} {'legacy prompt_eval':>19} {'stable prompt_eval':>19} {'stable prompt_eval_s':>21}")
+	for turn, (legacy, stable) in enumerate(zip(results[False], results[True])):
+		print(f"{turn:>5} {legacy['prompt_eval_count']:>19} {stable['prompt_eval_count']:>19} {stable['prompt_eval_s']:>21.4f}")
+	totals = [sum(r["prompt_eval_count"] for r in results[s]) for s in (False, True)]
+	print(f"total {totals[0]:>19} {totals[1]:>19}")
+
+
+if __name__ == "__main__":
+	main()
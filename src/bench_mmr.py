@@ -0,0 +1,61 @@
+import argparse
+import time
+from typing import List
+import numpy as np
+
+from retrieval import mmr_select
+
+
+def _legacy_mmr(q: np.ndarray, docs: np.ndarray, k: int, lambda_: float = 0.5) -> List[int]:
+	"""The previous pure-Python MMR loop, kept here as the comparison baseline."""
+	def cosine(a: np.ndarray, b: np.ndarray) -> float:
+		na = np.linalg.norm(a)
+		nb = np.linalg.norm(b)
+		if na == 0 or nb == 0:
+			return 0.0
+		return float(np.dot(a, b) / (na * nb))
+
+	selected_idx: List[int] = []
+	candidates = list(range(len(docs)))
+	while len(selected_idx) < k and candidates:
+		scores = []
+		for i in candidates:
+			relevance = cosine(q, docs[i])
+			diversity = max([cosine(docs[i], docs[j]) for j in selected_idx], default=0.0)
+			scores.append((lambda_ * relevance - (1 - lambda_) * diversity, i))
+		scores.sort(reverse=True)
+		sel = scores[0][1]
+		selected_idx.append(sel)
+		candidates.remove(sel)
+	return selected_idx
+
+
+def _time_ms(fn, repeats: int) -> float:
+	start = time.perf_counter()
+	for _ in range(repeats):
+		fn()
+	return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark MMR selection latency across candidate set sizes")
+	parser.add_argument("--top-k", type=int, nargs="+", default=[20, 50, 100, 200, 500], help="Candidate counts returned by Qdrant")
+	parser.add_argument("--mmr-k", type=int, default=8, help="Number of documents MMR selects")
+	parser.add_argument("--dim", type=int, default=384, help="Embedding dimension")
+	parser.add_argument("--repeats", type=int, default=20)
+	parser.add_argument("--skip-legacy", action="store_true", help="Only time the vectorized implementation")
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(0)
+	print(f"{'top_k':>6} {'mmr_k':>6} {'vectorized ms':>14} {'legacy ms':>10}")
+	for top_k in args.top_k:
+		q = rng.standard_normal(args.dim).astype(np.float32)
+		docs = rng.standard_normal((top_k, args.dim)).astype(np.float32)
+		k = min(args.mmr_k, top_k)
+		fast = _time_ms(lambda: mmr_select(q, docs, k), args.repeats)
+		legacy = "-" if args.skip_legacy else f"{_time_ms(lambda: _legacy_mmr(q, docs, k), max(1, args.repeats // 10)):.2f}"
+		print(f"{top_k:>6} {k:>6} {fast:>14.3f} {legacy:>10}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,155 @@
+import argparse
+import glob
+import json
+import os
+import time
+from typing import List, Dict, Any, Tuple
+import numpy as np
+
+from embeddings import EmbeddingService
+from reranker import Reranker
+from bench_e2e import bench_parse, compare, _git_commit
+from loadtest_api import QUERIES
+from config import embedding_config, reranker_config
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _backend(name: str) -> Tuple[str, bool]:
+	"""'torch' | 'onnx' | 'onnx-int8' -> (backend, int8)."""
+	if name not in ("torch", "onnx", "onnx-int8"):
+		raise SystemExit(f"Unknown backend '{name}' (expected torch, onnx or onnx-int8)")
+	return name.split("-")[0], name.endswith("int8")
+
+
+def _ranks(scores: np.ndarray) -> np.ndarray:
+	ranks = np.empty(len(scores))
+	ranks[np.argsort(-scores, kind="stable")] = np.arange(len(scores))
+	return ranks
+
+
+def rank_parity(reference: np.ndarray, scores: np.ndarray, k: int) -> Dict[str, float]:
+	"""Per-query agreement between two score matrices (queries x candidates)."""
+	overlap, top1, changed, spearman = [], [], [], []
+	for ref, cur in zip(reference, scores):
+		ref_top, cur_top = np.argsort(-ref, kind="stable")[:k], np.argsort(-cur, kind="stable")[:k]
+		overlap.append(len(set(ref_top) & set(cur_top)) / len(ref_top))
+		top1.append(float(ref_top[0] == cur_top[0]))
+		changed.append(float(not np.array_equal(ref_top, cur_top)))
+		if len(ref) > 1:
+			spearman.append(float(np.corrcoef(_ranks(ref), _ranks(cur))[0, 1]))
+	return {
+		f"overlap@{k}": float(np.mean(overlap)),
+		"top1_agreement": float(np.mean(top1)),
+		f"queries_with_top{k}_order_change": float(np.mean(changed)),
+		"spearman": float(np.mean(spearman)) if spearman else 1.0,
+	}
+
+
+def bench_embed(backend: str, int8: bool, texts: List[str], queries: List[str], batch_size: int) -> Tuple[np.ndarray, np.ndarray, Dict[str, Any]]:
+	start = time.perf_counter()
+	service = EmbeddingService(backend=backend, int8=int8)
+	load_s = time.perf_counter() - start
+	# Measure the model, not the embedding cache
+	service.cache = None
+	service.embed_texts(texts[:batch_size])
+	start = time.perf_counter()
+	vectors = np.asarray(service.embed_texts(texts), dtype=np.float32)
+	elapsed = time.perf_counter() - start
+	query_vectors = np.asarray(service.embed_texts(queries), dtype=np.float32)
+	single = []
+	for q in queries:
+		t = time.perf_counter()
+		service.embed_text(q)
+		single.append(time.perf_counter() - t)
+	return vectors, query_vectors, {"load_s": load_s, "texts": len(texts), "embeddings_per_s": len(texts) / elapsed, "single_query_ms": float(np.mean(single)) * 1000}
+
+
+def bench_rerank(backend: str, int8: bool, queries: List[str], candidates: List[List[str]], batch_size: int) -> Tuple[np.ndarray, Dict[str, Any]]:
+	start = time.perf_counter()
+	reranker = Reranker(backend=backend, int8=int8, cache_size=0)
+	load_s = time.perf_counter() - start
+	pairs = [(q, text) for q, texts in zip(queries, candidates) for text in texts]
+	reranker.model.predict(pairs[:batch_size], batch_size=batch_size, show_progress_bar=False)
+	start = time.perf_counter()
+	scores = np.asarray(reranker.model.predict(pairs, batch_size=batch_size, show_progress_bar=False), dtype=np.float32)
+	elapsed = time.perf_counter() - start
+	return scores.reshape(len(queries), -1), {"load_s": load_s, "pairs": len(pairs), "pairs_per_s": len(pairs) / elapsed}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Parity and throughput of the torch and ONNX (fp32/int8) embedding and reranker backends on the bundled docs")
+	parser.add_argument("--docs", default=os.path.join(_ROOT, "docs", "*.pdf"))
+	parser.add_argument("--csv", default=os.path.join(_ROOT, "largedataset", "*.csv"))
+	parser.add_argument("--csv-files", type=int, default=0, help="Also use the first N CSV files")
+	parser.add_argument("--max-chunks", type=int, default=2000)
+	parser.add_argument("--backends", default="torch,onnx,onnx-int8", help="Comma-separated; the first is the parity reference")
+	parser.add_argument("--batch-size", type=int, default=64)
+	parser.add_argument("--top-k", type=int, default=10, help="Rank agreement is measured on the top k")
+	parser.add_argument("--rerank-candidates", type=int, default=20, help="Passages reranked per query")
+	parser.add_argument("--output", default=None, help="Result JSON path (default: bench_results/onnx-<timestamp>.json)")
+	parser.add_argument("--compare", default=None, help="Earlier result JSON to diff against")
+	args = parser.parse_args()
+
+	paths = sorted(glob.glob(args.docs)) + (sorted(glob.glob(args.csv))[:args.csv_files] if args.csv_files else [])
+	if not paths:
+		raise SystemExit("No fixture files found")
+	chunks, _ = bench_parse(paths, None)
+	texts = [c["text"] for c in chunks[:args.max_chunks or None]]
+	queries = list(QUERIES)
+	backends = args.backends.split(",")
+	print(f"{len(texts)} chunks, {len(queries)} queries, backends: {', '.join(backends)}")
+
+	result: Dict[str, Any] = {
+		"meta": {
+			"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"commit": _git_commit(),
+			"cpus": os.cpu_count(),
+			"embedding_model": embedding_config.mdel_name,
+			"reranker_model": reranker_config.mdel_name,
+			"embedding_threads": [embedding_config.intra_op_threads, embedding_config.inter_op_threads],
+			"reranker_threads": [reranker_config.intra_op_threads, reranker_config.inter_op_threads],
+			"reference": backends[0],
+		},
+		"embed": {},
+		"rerank": {},
+	}
+	reference: Dict[str, np.ndarray] = {}
+	candidates: List[List[str]] = []
+	for name in backends:
+		backend, int8 = _backend(name)
+		print(f"Embedding with {name}...")
+		vectors, query_vectors, stats = bench_embed(backend, int8, texts, queries, args.batch_size)
+		retrieval = query_vectors @ vectors.T
+		if not reference:
+			reference.update(vectors=vectors, retrieval=retrieval)
+			# Rerank the reference backend's top passages with every backend
+			candidates = [[texts[i] for i in np.argsort(-row)[:args.rerank_candidates]] for row in retrieval]
+		else:
+			cosine = np.sum(vectors * reference["vectors"], axis=1)
+			stats["cosine_drift"] = {"mean": float(np.mean(1 - cosine)), "max": float(np.max(1 - cosine))}
+			stats["retrieval"] = rank_parity(reference["retrieval"], retrieval, args.top_k)
+		result["embed"][name] = stats
+
+		print(f"Reranking with {name}...")
+		scores, stats = bench_rerank(backend, int8, queries, candidates, args.batch_size)
+		if "rerank" not in reference:
+			reference["rerank"] = scores
+		else:
+			diff = np.abs(scores - reference["rerank"])
+			stats["score_diff"] = {"mean": float(np.mean(diff)), "max": float(np.max(diff))}
+			stats["ranking"] = rank_parity(reference["rerank"], scores, min(args.top_k, scores.shape[1]))
+		result["rerank"][name] = stats
+
+	output = args.output or os.path.join("bench_results", f"onnx-{time.strftime('%Y%m%d-%H%M%S')}.json")
+	os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+	with open(output, "w", encoding="utf-8") as f:
+		json.dump(result, f, indent=2)
+	print(json.dumps({k: v for k, v in result.items() if k != "meta"}, indent=2))
+	print(f"Wrote {output}")
+	if args.compare:
+		compare(args.compare, result)
+
+
+if __name__ == "__main__":
+	main()
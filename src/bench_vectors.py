@@ -0,0 +1,182 @@
+import argparse
+import glob
+import json
+import os
+import random
+import time
+from typing import List, Dict, Any
+import numpy as np
+from qdrant_client.http.models import OptimizersConfigDiff, CollectionStatus
+
+from embeddings import EmbeddingService
+from vectorstore import QdrantStore, PROFILES, CollectionProfile, collection_profile, _payload_point_id
+from bench_e2e import bench_parse, compare, _percentiles, _git_commit
+from loadtest_api import QUERIES
+from config import qdrant_config, embedding_config
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+COLLECTION_PREFIX = "bench_profile"
+
+
+def _make_queries(chunks: List[Dict[str, Any]], n: int, seed: int) -> List[str]:
+	"""The fixed QUERIES plus the opening words of sampled chunks, so queries follow the corpus."""
+	rng = random.Random(seed)
+	sampled = rng.sample(chunks, min(max(0, n - len(QUERIES)), len(chunks)))
+	return (QUERIES + [" ".join(c["text"].split()[:24]) for c in sampled])[:n]
+
+
+def _ground_truth(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+	# Vectors are L2-normalized, so exact cosine top-k is a dot product
+	scores = queries @ vectors.T
+	top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+	return [set(row.tolist()) for row in top]
+
+
+def _ram_estimate_mb(profile: CollectionProfile, n: int, dim: int) -> float:
+	"""Vector bytes Qdrant keeps in RAM for this profile (excluding the HNSW graph and payloads)."""
+	if profile.quantization == "scalar":
+		return n * dim / 1e6
+	if profile.quantization == "binary":
+		return n * dim / 8 / 1e6
+	return 0.0 if profile.on_disk_vectors else n * dim * 4 / 1e6
+
+
+def _wait_indexed(store: QdrantStore, name: str, timeout_s: float) -> float:
+	start = time.perf_counter()
+	while time.perf_counter() - start < timeout_s:
+		if store.client.get_collection(name).status == CollectionStatus.GREEN:
+			break
+		time.sleep(0.5)
+	return time.perf_counter() - start
+
+
+def bench_profile(store: QdrantStore, name: str, vectors: np.ndarray, payloads: List[Dict[str, Any]], ids: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+	profile = collection_profile(name)
+	collection = f"{COLLECTION_PREFIX}_{name}"
+	if store.client.collection_exists(collection):
+		store.drop_collection(collection)
+	store.ensure_collection(collection, vectors.shape[1], profile=profile)
+	try:
+		# Small fixtures stay below Qdrant's default threshold and would be searched exhaustively
+		store.client.update_collection(collection, optimizers_config=OptimizersConfigDiff(indexing_threshold=args.indexing_threshold))
+	except Exception as e:
+		print(f"Warning: could not lower the indexing threshold for '{collection}': {e}")
+	start = time.perf_counter()
+	store.upload(collection, vectors, payloads, ids=ids)
+	store.flush()
+	upsert_s = time.perf_counter() - start
+	index_s = _wait_indexed(store, collection, args.index_timeout)
+	return {
+		"collection": collection,
+		"profile": {k: v for k, v in profile.__dict__.items()},
+		"upsert_s": upsert_s,
+		"index_wait_s": index_s,
+		"ram_vectors_mb_est": _ram_estimate_mb(profile, len(payloads), vectors.shape[1]),
+	}
+
+
+def bench_search(store: QdrantStore, collection: str, queries: np.ndarray, truth: List[set], id_to_row: Dict[str, int], k: int, hnsw_ef: int | None, oversampling: float | None) -> Dict[str, Any]:
+	for q in queries[:5]:
+		store.query(collection, q.tolist(), top_k=k, hnsw_ef=hnsw_ef, oversampling=oversampling)
+	latencies: List[float] = []
+	recalls: List[float] = []
+	for q, expected in zip(queries, truth):
+		start = time.perf_counter()
+		hits = store.query(collection, q.tolist(), top_k=k, hnsw_ef=hnsw_ef, oversampling=oversampling)
+		latencies.append(time.perf_counter() - start)
+		recalls.append(len({id_to_row[str(h["id"])] for h in hits} & expected) / len(expected))
+	return {
+		"hnsw_ef": hnsw_ef or 0,
+		"oversampling": oversampling or 0,
+		f"recall@{k}": float(np.mean(recalls)),
+		"qps": len(latencies) / sum(latencies),
+		"latency": _percentiles(latencies),
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Recall@k and latency of Qdrant collection profiles (quantization, on-disk storage, HNSW ef) on the bundled fixtures")
+	parser.add_argument("--url", default=None, help="Qdrant URL (default: QDRANT_URL). ':memory:' runs but ignores profiles and ef")
+	parser.add_argument("--docs", default=os.path.join(_ROOT, "docs", "*.pdf"))
+	parser.add_argument("--csv", default=os.path.join(_ROOT, "largedataset", "*.csv"))
+	parser.add_argument("--csv-files", type=int, default=0, help="Use only the first N CSV files (0 = all)")
+	parser.add_argument("--max-chunks", type=int, default=0, help="Index at most N chunks (0 = all)")
+	parser.add_argument("--profiles", default=",".join(PROFILES), help="Comma-separated profile names")
+	parser.add_argument("--ef", default="0,32,64,128,256", help="Comma-separated search-time hnsw_ef values (0 = server default)")
+	parser.add_argument("--oversampling", default="0", help="Comma-separated oversampling values for quantized profiles (0 = profile default)")
+	parser.add_argument("--top-k", type=int, default=10)
+	parser.add_argument("--queries", type=int, default=200)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--indexing-threshold", type=int, default=100, help="Qdrant indexing_threshold (KB) so small corpora get an HNSW index")
+	parser.add_argument("--index-timeout", type=float, default=600)
+	parser.add_argument("--keep", action="store_true", help="Keep the benchmark collections")
+	parser.add_argument("--output", default=None, help="Result JSON path (default: bench_results/vectors-<timestamp>.json)")
+	parser.add_argument("--compare", default=None, help="Earlier result JSON to diff against")
+	args = parser.parse_args()
+
+	csv_paths = sorted(glob.glob(args.csv))
+	if args.csv_files:
+		csv_paths = csv_paths[:args.csv_files]
+	paths = sorted(glob.glob(args.docs)) + csv_paths
+	if not paths:
+		raise SystemExit("No fixture files found")
+
+	print(f"Parsing {len(paths)} files...")
+	chunks, _ = bench_parse(paths, None)
+	if args.max_chunks:
+		chunks = chunks[:args.max_chunks]
+	embedder = EmbeddingService()
+	print(f"Embedding {len(chunks)} chunks...")
+	vectors = np.asarray(embedder.embed_texts([c["text"] for c in chunks]), dtype=np.float32)
+	payloads = [c["metadata"] | {"text": c["text"]} for c in chunks]
+	ids = [_payload_point_id(p) for p in payloads]
+	id_to_row = {pid: i for i, pid in enumerate(ids)}
+	queries = np.asarray(embedder.embed_texts(_make_queries(chunks, args.queries, args.seed)), dtype=np.float32)
+	truth = _ground_truth(vectors, queries, args.top_k)
+
+	url = args.url or qdrant_config.url
+	if url == ":memory:":
+		print("Warning: local mode searches exhaustively; profiles and hnsw_ef have no effect")
+	store = QdrantStore(url=url)
+	ef_values = [int(v) for v in args.ef.split(",")]
+	oversampling_values = [float(v) for v in args.oversampling.split(",")]
+	result: Dict[str, Any] = {
+		"meta": {
+			"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"commit": _git_commit(),
+			"qdrant": url,
+			"embedding_model": embedding_config.mdel_name,
+			"points": len(chunks),
+			"queries": len(queries),
+		},
+		"profiles": {},
+	}
+	for name in args.profiles.split(","):
+		print(f"Profile {name}: upserting and indexing...")
+		entry = bench_profile(store, name, vectors, payloads, ids, args)
+		quantized = entry["profile"]["quantization"] != "none"
+		entry["search"] = {}
+		for ef in ef_values:
+			for oversampling in (oversampling_values if quantized else [0.0]):
+				run = bench_search(store, entry["collection"], queries, truth, id_to_row, args.top_k, ef or None, oversampling or None)
+				entry["search"][f"ef={ef},os={oversampling:g}"] = run
+		result["profiles"][name] = entry
+		if not args.keep:
+			store.drop_collection(entry["collection"])
+
+	print(f"\n{'profile':<10} {'ef':>5} {'os':>5} {'recall@' + str(args.top_k):>10} {'p50 ms':>8} {'p95 ms':>8} {'qps':>8} {'RAM MB':>8}")
+	for name, entry in result["profiles"].items():
+		for run in entry["search"].values():
+			print(f"{name:<10} {run['hnsw_ef']:>5} {run['oversampling']:>5g} {run[f'recall@{args.top_k}']:>10.3f} {run['latency']['p50_ms']:>8.2f} {run['latency']['p95_ms']:>8.2f} {run['qps']:>8.0f} {entry['ram_vectors_mb_est']:>8.1f}")
+
+	output = args.output or os.path.join("bench_results", f"vectors-{time.strftime('%Y%m%d-%H%M%S')}.json")
+	os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+	with open(output, "w", encoding="utf-8") as f:
+		json.dump(result, f, indent=2)
+	print(f"Wrote {output}")
+	if args.compare:
+		compare(args.compare, result)
+
+
+if __name__ == "__main__":
+	main()
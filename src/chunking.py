@@ -1,33 +1,67 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Iterable
+from typing import List, Dict, Any, Iterable, Tuple, Optional, Callable
+from functools import lru_cache
+import multiprocessing
 import os
 import re
 import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+from collections import deque
+from multiprocessing import connection
 import html2text
 from bs4 import BeautifulSoup
 from pypdf import PdfReader
 import docx
 
-from config import app_config
+from timeseries import iter_csv_row_windows, iter_csv_rollups
+from metrics import metrics
+from config import app_config, embedding_config
 
 _whitespace_re = re.compile(r"\s+")
+_inline_space_re = re.compile(r"[ \t\f\v\u00a0]+")
+_blank_lines_re = re.compile(r"\n\s*\n\s*")
 
 def _normalize(text: str) -> str:
 	return _whitespace_re.sub(" ", text).strip()
 
+def _normalize_keep_lines(text: str) -> str:
+	"""Collapse spacing but keep line and paragraph breaks for structure-aware chunking."""
+	text = _inline_space_re.sub(" ", text.replace("\r\n", "\n").replace("\r", "\n"))
+	text = "\n".join(line.strip() for line in text.split("\n"))
+	return _blank_lines_re.sub("\n\n", text).strip()
+
+def iter_text_from_file(path: str, deadline: float | None = None, normalize: Callable[[str], str] = _normalize) -> Iterable[str]:
+	"""Yield normalized text segments of a file: one per page for PDFs, the whole text otherwise.
+
+	`deadline` is a time.monotonic() value; parsing raises TimeoutError once it passes.
+	"""
+	extension = os.path.splitext(path)[1].lower()
+	if extension == ".pdf":
+		reader = PdfReader(path)
+		for page in reader.pages:
+			if deadline is not None and time.monotonic() > deadline:
+				raise TimeoutError(f"parsing exceeded {app_config.parse_timeout_s}s")
+			text = normalize(page.extract_text() or "")
+			if text:
+				yield text
+		return
+	text = normalize(_read_text(path))
+	if text:
+		yield text
+
 def load_text_from_file(path: str) -> str:
+	extension = os.path.splitext(path)[1].lower()
+	if extension == ".pdf":
+		return " ".join(iter_text_from_file(path))
+	return _normalize(_read_text(path))
+
+def _read_text(path: str) -> str:
 	text = ""
 	extension = os.path.splitext(path)[1].lower()
 	if extension in [".txt", ".md"]:
 		with open(path, "r", encoding="utf-8", errors="ignore") as f:
 			text = f.read()
-	elif extension == ".pdf":
-		reader = PdfReader(path)
-		pages = []
-		for page in reader.pages:
-			pages.append(page.extract_text() or "")
-		text = "\n".join(pages)
 	elif extension in [".docx", ".doc"]:
 		document = docx.Document(path)
 		text = "\n".join([p.text for p in document.paragraphs])
@@ -42,7 +76,7 @@ def load_text_from_file(path: str) -> str:
 	else:
 		with open(path, "r", encoding="utf-8", errors="ignore") as f:
 			text = f.read()
-	return _normalize(text)
+	return text
 
 
 def recursive_directory_loader(root: str, archive_dir: str | None = None) -> List[Dict[str, Any]]:
@@ -72,13 +106,276 @@ def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
 	return chunks
 
 
+def chunk_segments(segments: Iterable[str], chunk_size: int, chunk_overlap: int) -> Iterable[str]:
+	"""Streaming chunk_text over space-joined segments; only about one chunk is buffered at a time."""
+	buffer = ""
+	started = False
+	step = chunk_size - chunk_overlap
+	for segment in segments:
+		buffer = buffer + " " + segment if started else segment
+		started = True
+		# Slice by offset and drop the consumed prefix once per segment, not once per chunk
+		start = 0
+		while len(buffer) - start > chunk_size:
+			yield buffer[start:start + chunk_size]
+			start += step
+		if start:
+			buffer = buffer[start:]
+	if buffer:
+		yield buffer
+
+
+_heading_re = re.compile(r"^(#{1,6}\s+\S.*|(?=[^a-z]*[A-Z]{2})[A-Z0-9][A-Z0-9 &,.:'()/-]{2,80})$")
+_sentence_split_re = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])")
+
+
+@lru_cache(maxsize=None)
+def _get_tokenizer():
+	from transformers import AutoTokenizer
+	return AutoTokenizer.from_pretrained(embedding_config.mdel_name)
+
+
+def _count_tokens(text: str) -> int:
+	return len(_get_tokenizer().encode(text, add_special_tokens=False))
+
+
+def _iter_blocks(segments: Iterable[str]) -> Iterable[Tuple[str, bool]]:
+	"""Yield (block, is_heading): paragraphs split on blank lines, headings split out on their own."""
+	for segment in segments:
+		for paragraph in segment.split("\n\n"):
+			lines: List[str] = []
+			for line in paragraph.split("\n"):
+				if line and len(line) <= 80 and _heading_re.match(line):
+					if lines:
+						yield "\n".join(lines), False
+						lines = []
+					yield line, True
+				elif line:
+					lines.append(line)
+			if lines:
+				yield "\n".join(lines), False
+
+
+def _split_oversized(text: str, max_tokens: int, tokenizer, sep: str) -> Iterable[Tuple[str, int, str]]:
+	"""Split a unit that exceeds max_tokens: by lines, then sentences, then hard token windows.
+
+	Yields (piece, tokens, separator); the first piece keeps the caller's separator.
+	"""
+	for part_sep, parts in (("\n", text.split("\n")), (" ", _sentence_split_re.split(text))):
+		if len(parts) > 1:
+			for i, part in enumerate(parts):
+				n = len(tokenizer.encode(part, add_special_tokens=False))
+				if n <= max_tokens:
+					yield part, n, sep if i == 0 else part_sep
+				else:
+					yield from _split_oversized(part, max_tokens, tokenizer, sep if i == 0 else part_sep)
+			return
+	offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+	for i in range(0, len(offsets), max_tokens):
+		window = offsets[i:i + max_tokens]
+		yield text[window[0][0]:window[-1][1]], len(window), sep if i == 0 else " "
+
+
+def _join_units(units: List[Tuple[str, int, str]]) -> str:
+	return "".join(u if i == 0 else s + u for i, (u, _, s) in enumerate(units))
+
+
+def chunk_structured(segments: Iterable[str], max_tokens: int, overlap_tokens: int, tokenizer=None) -> Iterable[str]:
+	"""Token-aware chunking that packs paragraphs/sentences up to max_tokens.
+
+	Token counts come from the embedding model's tokenizer, so no chunk is
+	truncated at embed time. Breaks fall on paragraph, line or sentence
+	boundaries. A heading always starts a new chunk. Overlap carries trailing
+	units totalling at most overlap_tokens. Works as a generator, so only the
+	current chunk is held in memory.
+	"""
+	tokenizer = tokenizer or _get_tokenizer()
+	units: List[Tuple[str, int, str]] = []
+	total = 0
+	for block, is_heading in _iter_blocks(segments):
+		if is_heading and units:
+			yield _join_units(units)
+			units, total = [], 0
+		n = len(tokenizer.encode(block, add_special_tokens=False))
+		pieces = [(block, n, "\n\n")] if n <= max_tokens else _split_oversized(block, max_tokens, tokenizer, "\n\n")
+		for piece, n, sep in pieces:
+			if units and total + n > max_tokens:
+				yield _join_units(units)
+				carried: List[Tuple[str, int, str]] = []
+				carried_total = 0
+				for u in reversed(units):
+					if carried_total + u[1] > overlap_tokens or carried_total + u[1] + n > max_tokens:
+						break
+					carried.insert(0, u)
+					carried_total += u[1]
+				units, total = carried, carried_total
+			units.append((piece, n, sep))
+			total += n
+	if units:
+		yield _join_units(units)
+
+
+def make_csv_chunks(path: str, mode: str | None = None) -> List[Dict[str, Any]]:
+	"""Structured CSV chunks: header-repeating row windows, or per-day/per-week OHLCV rollups."""
+	mode = mode or app_config.csv_mode
+	# Row windows stop at the token chunker's limit, so the embedder sees every row they cover
+	sizing = (app_config.csv_rows_per_chunk, app_config.chunk_max_tokens, _count_tokens)
+	if mode in ("day", "week"):
+		windows = iter_csv_rollups(path, mode, *sizing)
+	else:
+		windows = iter_csv_row_windows(path, *sizing)
+	return [{"text": text, "metadata": {"source": path, "chunk_index": i} | meta} for i, (text, meta) in enumerate(windows)]
+
+
 def make_chunks_for_path(item: Dict[str, Any]) -> List[Dict[str, Any]]:
 	path = item["path"]
-	text = load_text_from_file(path)
-	chunks = chunk_text(text, app_config.chunk_size, app_config.chunk_overlap)
+	if path.lower().endswith(".csv") and app_config.csv_mode != "text":
+		return make_csv_chunks(path)
+	deadline = time.monotonic() + app_config.parse_timeout_s if app_config.parse_timeout_s > 0 else None
+	if app_config.chunker == "tokens":
+		segments = iter_text_from_file(path, deadline, normalize=_normalize_keep_lines)
+		chunks = chunk_structured(segments, app_config.chunk_max_tokens, app_config.chunk_overlap_tokens)
+	else:
+		segments = iter_text_from_file(path, deadline)
+		chunks = chunk_segments(segments, app_config.chunk_size, app_config.chunk_overlap)
 	return [{"text": c, "metadata": {"source": path, "chunk_index": i}} for i, c in enumerate(chunks)]
 
 
+def _make_chunks_for_item(item: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+	"""Parse one file; a failed, oversized or timed-out file yields None."""
+	try:
+		size_mb = os.path.getsize(item["path"]) / (1024 * 1024)
+		if app_config.max_file_mb > 0 and size_mb > app_config.max_file_mb:
+			raise ValueError(f"file is {size_mb:.0f} MB, limit is {app_config.max_file_mb} MB")
+		return make_chunks_for_path(item)
+	except Exception as e:
+		print(f"Warning: Skipping {item['path']}: {e}")
+		return None
+
+
+def _parse_worker(conn) -> None:
+	"""Worker loop: for each batch received, send ("started", None) and then ("parsed", chunks) per file."""
+	try:
+		while True:
+			batch = conn.recv()
+			if batch is None:
+				return
+			conn.send(("started", None))
+			for item in batch:
+				conn.send(("parsed", _make_chunks_for_item(item)))
+	except (EOFError, OSError):
+		return
+
+
+class _ParseWorker:
+	"""One parse worker fed batches over a pipe, so a stuck parser can be killed and replaced.
+
+	Processes are terminated on overrun; threads cannot be, so a stuck thread is
+	cut loose (its pipe is closed) and exits once its parser returns.
+	"""
+
+	def __init__(self, backend: str):
+		if backend == "processes":
+			# spawn keeps workers free of the parent's model weights and torch threads
+			ctx = multiprocessing.get_context("spawn")
+			self.conn, child = ctx.Pipe()
+			self.runner = ctx.Process(target=_parse_worker, args=(child,), daemon=True)
+		elif backend == "threads":
+			self.conn, child = multiprocessing.Pipe()
+			self.runner = threading.Thread(target=_parse_worker, args=(child,), daemon=True)
+		else:
+			raise ValueError(f"Unknown parse backend: {backend}")
+		self.runner.start()
+		self.killable = backend == "processes"
+		if self.killable:
+			child.close()
+		self.batch: Optional[List[Dict[str, Any]]] = None
+		self.pos = 0
+		self.deadline = float("inf")
+
+	def assign(self, batch: List[Dict[str, Any]]) -> None:
+		self.batch, self.pos, self.deadline = batch, 0, float("inf")
+		self.conn.send(batch)
+
+	def stop(self, kill: bool = False) -> None:
+		try:
+			if kill and self.killable:
+				self.runner.terminate()
+				self.runner.join(timeout=5)
+			elif not kill:
+				self.conn.send(None)
+		except (OSError, ValueError):
+			pass
+		self.conn.close()
+
+
+def iter_parsed_items(items: List[Dict[str, Any]], backend: str | None = None, max_workers: int | None = None, chunksize: int | None = None) -> Iterable[Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]]:
+	"""Yield (item, chunks) as files finish parsing; chunks is None if the file was skipped.
+
+	Files are handed to idle workers `chunksize` at a time. Each file gets
+	parse_timeout_s from the moment its worker starts on it; a worker that
+	overruns is killed and replaced, and the rest of its batch is requeued, so
+	one pathological document cannot stall the iteration.
+	"""
+	backend = backend or app_config.parse_backend
+	max_workers = max_workers or app_config.max_workers
+	chunksize = max(1, chunksize or app_config.parse_chunksize)
+	timeout_s = app_config.parse_timeout_s if app_config.parse_timeout_s > 0 else float("inf")
+	queue = deque(items[i:i + chunksize] for i in range(0, len(items), chunksize))
+	workers = [_ParseWorker(backend) for _ in range(min(max_workers, len(queue)))]
+	started = time.perf_counter()
+	parsed_chunks = 0
+
+	def recycle(worker: _ParseWorker, reason: str, status: str) -> Tuple[Dict[str, Any], None]:
+		item = worker.batch[worker.pos]
+		if worker.pos + 1 < len(worker.batch):
+			queue.appendleft(worker.batch[worker.pos + 1:])
+		worker.stop(kill=True)
+		workers[workers.index(worker)] = _ParseWorker(backend)
+		print(f"Warning: Abandoned {item['path']}: {reason}")
+		metrics.inc("ingest.files", status=status)
+		return item, None
+
+	try:
+		while queue or any(w.batch is not None for w in workers):
+			for w in workers:
+				if w.batch is None and queue:
+					w.assign(queue.popleft())
+			busy = [w for w in workers if w.batch is not None]
+			nearest = min(w.deadline for w in busy)
+			timeout = None if nearest == float("inf") else max(0.0, nearest - time.monotonic())
+			ready = connection.wait([w.conn for w in busy], timeout=timeout)
+			for w in busy:
+				if w.conn not in ready:
+					continue
+				try:
+					kind, chunks = w.conn.recv()
+				except (EOFError, OSError):
+					yield recycle(w, "parse worker died", "skipped")
+					continue
+				if kind == "started":
+					w.deadline = time.monotonic() + timeout_s
+					continue
+				item = w.batch[w.pos]
+				w.pos += 1
+				if w.pos == len(w.batch):
+					w.batch, w.deadline = None, float("inf")
+				else:
+					w.deadline = time.monotonic() + timeout_s
+				parsed_chunks += len(chunks or [])
+				metrics.inc("ingest.files", status="skipped" if chunks is None else "parsed")
+				yield item, chunks
+			now = time.monotonic()
+			# A worker with a reply waiting is not stuck; we were just slow to read it
+			for w in [w for w in workers if w.batch is not None and w.deadline < now and not w.conn.poll()]:
+				yield recycle(w, "parse timed out", "timed_out")
+	finally:
+		for w in workers:
+			w.stop()
+		# Parsing runs in the workers, so this is wall time (including time the consumer held us up)
+		metrics.record("ingest.parse", time.perf_counter() - started, parsed_chunks)
+
+
 def archive_file(source_path: str, archive_dir: str) -> str:
 	"""Move file to archive directory, preserving relative path structure"""
 	# Create archive directory if it doesn't exist
@@ -97,37 +394,41 @@ def archive_file(source_path: str, archive_dir: str) -> str:
 	return archive_path
 
 
+def build_chunks_for_items(items: List[Dict[str, Any]], on_skip: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+	return list(iter_chunks_for_items(items, on_skip))
+
+
+def iter_chunks_for_items(items: List[Dict[str, Any]], on_skip: Optional[Callable[[Dict[str, Any]], None]] = None) -> Iterable[Dict[str, Any]]:
+	"""Chunks of every file that parsed; `on_skip` is called with each item that did not (e.g. IngestManifest.skipped)."""
+	for item, chunks in iter_parsed_items(items):
+		if chunks is None:
+			if on_skip:
+				on_skip(item)
+			continue
+		for chunk in chunks:
+			yield chunk
+
+
 def build_chunks_from_directory(root: str, archive_dir: str | None = None) -> List[Dict[str, Any]]:
-	items = recursive_directory_loader(root, archive_dir)
-	results: List[Dict[str, Any]] = []
-	with ThreadPoolExecutor(max_workers=app_config.max_workers) as ex:
-		for chunks in ex.map(make_chunks_for_path, items):
-			results.extend(chunks)
-	return results
+	return build_chunks_for_items(recursive_directory_loader(root, archive_dir))
 
 
 def iter_chunks_from_directory(root: str, archive_dir: str | None = None) -> Iterable[Dict[str, Any]]:
-	items = recursive_directory_loader(root, archive_dir)
-	with ThreadPoolExecutor(max_workers=app_config.max_workers) as ex:
-		futures = {ex.submit(make_chunks_for_path, it): it for it in items}
-		for fut in as_completed(futures):
-			for chunk in fut.result():
-				yield chunk
+	return iter_chunks_for_items(recursive_directory_loader(root, archive_dir))
 
 
 def iter_chunks_with_archive(root: str, archive_dir: str) -> Iterable[Dict[str, Any]]:
 	"""Stream chunks and archive processed files"""
 	items = recursive_directory_loader(root, archive_dir)
-	with ThreadPoolExecutor(max_workers=app_config.max_workers) as ex:
-		futures = {ex.submit(make_chunks_for_path, it): it for it in items}
-		for fut in as_completed(futures):
-			item = futures[fut]
-			chunks = fut.result()
-			# Archive the file after processing
-			try:
-				archive_file(item["path"], archive_dir)
-			except Exception as e:
-				print(f"Warning: Failed to archive {item['path']}: {e}")
-			# Yield all chunks from this file
-			for chunk in chunks:
-				yield chunk
+	for item, chunks in iter_parsed_items(items):
+		if chunks is None:
+			# Leave skipped files in place so they are retried
+			continue
+		# Archive the file after processing
+		try:
+			archive_file(item["path"], archive_dir)
+		except Exception as e:
+			print(f"Warning: Failed to archive {item['path']}: {e}")
+		# Yield all chunks from this file
+		for chunk in chunks:
+			yield chunk
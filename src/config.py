@@ -8,36 +8,172 @@ class AppConfig(BaseModel):
 	app_title: str = os.getenv("APP_TITLE", "Full RAG Chat")
 	chunk_size: int = int(os.getenv("CHUNK_SIZE", "1200"))
 	chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP", "200"))
+	# "chars" uses chunk_size/chunk_overlap; "tokens" packs structure-aware chunks with the embedding tokenizer
+	chunker: str = os.getenv("CHUNKER", "chars")
+	chunk_max_tokens: int = int(os.getenv("CHUNK_MAX_TOKENS", "250"))
+	chunk_overlap_tokens: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
 	max_workers: int = int(os.getenv("MAX_WORKERS", "8"))
+	parse_backend: str = os.getenv("PARSE_BACKEND", "processes")
+	parse_chunksize: int = int(os.getenv("PARSE_CHUNKSIZE", "4"))
+	parse_timeout_s: float = float(os.getenv("PARSE_TIMEOUT_S", "300"))
+	max_file_mb: float = float(os.getenv("MAX_FILE_MB", "500"))
+	parse_workers: int = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 4)))
+	embed_batch_size: int = int(os.getenv("EMBED_BATCH_SIZE", "512"))
+	upsert_workers: int = int(os.getenv("UPSERT_WORKERS", "4"))
+	ingest_queue_size: int = int(os.getenv("INGEST_QUEUE_SIZE", "4096"))
+	manifest_dir: str = os.getenv("INGEST_MANIFEST_DIR", ".ingest_manifest")
+	csv_mode: str = os.getenv("CSV_MODE", "rows")
+	csv_rows_per_chunk: int = int(os.getenv("CSV_ROWS_PER_CHUNK", "24"))
+	mmr_lambda: float = float(os.getenv("MMR_LAMBDA", "0.5"))
+	hybrid_search: bool = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+	rrf_k: int = int(os.getenv("RRF_K", "60"))
+	answer_cache_enabled: bool = os.getenv("ANSWER_CACHE", "true").lower() == "true"
+	answer_cache_threshold: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+	answer_cache_ttl_s: float = float(os.getenv("ANSWER_CACHE_TTL_S", "86400"))
+	sparse_avg_doc_len: float = float(os.getenv("SPARSE_AVG_DOC_LEN", "180"))
+	# Per-collection document frequencies for the sparse query IDF
+	sparse_stats_path: str = os.getenv("SPARSE_STATS_PATH", ".docstore/term_stats.sqlite")
+	# Items allowed to wait in each micro-batcher before callers are refused
+	microbatch_queue_size: int = int(os.getenv("MICROBATCH_QUEUE_SIZE", "1024"))
+	metrics_enabled: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+	# Serve Prometheus /metrics from the Streamlit process on this port (0 = off; the API has its own /metrics)
+	metrics_port: int = int(os.getenv("METRICS_PORT", "0"))
+	# "qdrant" (server, or QDRANT_URL=:memory:) or "faiss" (embedded index under FAISS_DIR)
+	vector_backend: str = os.getenv("VECTOR_BACKEND", "qdrant").lower()
+	# "payload" keeps chunk text in the vector payload; "local" keeps it compressed in TEXT_STORE_PATH, fetched only for reranked candidates
+	text_store: str = os.getenv("TEXT_STORE", "payload").lower()
+	text_store_path: str = os.getenv("TEXT_STORE_PATH", ".docstore/chunks.sqlite")
+	# Exported (and int8-quantized) ONNX models for the onnx inference backend
+	onnx_dir: str = os.getenv("ONNX_DIR", ".onnx_models")
+
+class FaissConfig(BaseModel):
+	# In-process index used when VECTOR_BACKEND=faiss: one index file per collection plus a SQLite payload store
+	path: str = os.getenv("FAISS_DIR", ".faiss_index")
+	# "hnsw" (graph, no training), "ivf" (inverted lists, trained on the first vectors) or "flat" (exact)
+	index_type: str = os.getenv("FAISS_INDEX", "hnsw")
+	hnsw_m: int = int(os.getenv("FAISS_HNSW_M", "32"))
+	hnsw_ef_construction: int = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+	hnsw_ef_search: int = int(os.getenv("FAISS_HNSW_EF_SEARCH", "128"))
+	ivf_nlist: int = int(os.getenv("FAISS_IVF_NLIST", "1024"))
+	ivf_nprobe: int = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+	# Dirty indexes are written at most this often during writes (and always on flush/exit)
+	flush_interval_s: float = float(os.getenv("FAISS_FLUSH_INTERVAL_S", "30"))
 
 class QdrantConfig(BaseModel):
 	url: str = os.getenv("QDRANT_URL", "http://localhost:6333")
 	api_key: str | None = os.getenv("QDRANT_API_KEY")
 	collection: str = os.getenv("QDRANT_COLLECTION", "hc_data")
 	memory_collection: str = os.getenv("QDRANT_MEMORY_COLLECTION", "chat_memory")
+	answer_cache_collection: str = os.getenv("QDRANT_ANSWER_CACHE_COLLECTION", "answer_cache")
+	# Storage profile of the document collection when it is created: default | disk | scalar | binary
+	profile: str = os.getenv("QDRANT_PROFILE", "default")
+	# Profile overrides (0 = profile/server default)
+	hnsw_m: int = int(os.getenv("QDRANT_HNSW_M", "0"))
+	hnsw_ef_construct: int = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "0"))
+	oversampling: float = float(os.getenv("QDRANT_OVERSAMPLING", "0"))
+	# Search-time HNSW ef (0 = server default); higher raises recall and latency
+	search_hnsw_ef: int = int(os.getenv("QDRANT_SEARCH_HNSW_EF", "0"))
+	# gRPC (port 6334) instead of REST for every call; opt-in since the port is not always exposed. Ignored for ":memory:"
+	prefer_grpc: bool = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+	grpc_port: int = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+	# Bulk upload (ingestion): request size target, client processes, and whether each request waits to be applied
+	upload_batch_mb: float = float(os.getenv("QDRANT_UPLOAD_BATCH_MB", "4"))
+	upload_parallel: int = int(os.getenv("QDRANT_UPLOAD_PARALLEL", "1"))
+	upload_wait: bool = os.getenv("QDRANT_UPLOAD_WAIT", "false").lower() == "true"
 
 class EmbeddingConfig(BaseModel):
 	mdel_name: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 	#model_name: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/gte-large-en-v1.5")
 	dimension: int = int(os.getenv("EMBEDDING_DIM", "384"))
+	cache_enabled: bool = os.getenv("EMBEDDING_CACHE", "true").lower() == "true"
+	cache_dir: str = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+	cache_memory_items: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000"))
+	cache_disk_items: int = int(os.getenv("EMBEDDING_CACHE_DISK_ITEMS", "200000"))
+	# Single-query embeds from concurrent callers are grouped into one forward pass (size <= 1 disables)
+	microbatch_size: int = int(os.getenv("EMBED_MICROBATCH_SIZE", "32"))
+	microbatch_wait_ms: float = float(os.getenv("EMBED_MICROBATCH_WAIT_MS", "5"))
+	# "torch" (SentenceTransformer) or "onnx" (onnxruntime on CPU, exported to ONNX_DIR on first use)
+	backend: str = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+	onnx_int8: bool = os.getenv("EMBEDDING_ONNX_INT8", "false").lower() == "true"
+	# Intra-op/inter-op threads (0 = runtime default); for torch they are process-wide
+	intra_op_threads: int = int(os.getenv("EMBEDDING_INTRA_OP_THREADS", "0"))
+	inter_op_threads: int = int(os.getenv("EMBEDDING_INTER_OP_THREADS", "0"))
 
 class RerankerConfig(BaseModel):
 	mdel_name: str = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+	batch_size: int = int(os.getenv("RERANKER_BATCH_SIZE", "32"))
+	# Rerank only the best N candidates by first-stage score (0 = all)
+	top_n: int = int(os.getenv("RERANKER_TOP_N", "0"))
+	max_tokens: int = int(os.getenv("RERANKER_MAX_TOKENS", "256"))
+	cache_size: int = int(os.getenv("RERANKER_CACHE_SIZE", "20000"))
+	# Queries reranked together in one predict call (size <= 1 disables)
+	microbatch_size: int = int(os.getenv("RERANK_MICROBATCH_SIZE", "8"))
+	microbatch_wait_ms: float = float(os.getenv("RERANK_MICROBATCH_WAIT_MS", "5"))
+	backend: str = os.getenv("RERANKER_BACKEND", "torch").lower()
+	onnx_int8: bool = os.getenv("RERANKER_ONNX_INT8", "false").lower() == "true"
+	intra_op_threads: int = int(os.getenv("RERANKER_INTRA_OP_THREADS", "0"))
+	inter_op_threads: int = int(os.getenv("RERANKER_INTER_OP_THREADS", "0"))
 
 class LLMConfig(BaseModel):
 	provider: str = os.getenv("LLM_PROVIDER", "ollama")
 	ollama_host: str = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 	model: str = os.getenv("OLLAMA_MODEL", "llama3.2")
 	temperature: float = float(os.getenv("LLM_TEMPERATURE", "0.5"))
+	# Prompt budget (tokens) for history + memory + retrieved context; empty tokenizer = chars/4 estimate
+	context_tokens: int = int(os.getenv("LLM_CONTEXT_TOKENS", "3072"))
+	history_tokens: int = int(os.getenv("LLM_HISTORY_TOKENS", "768"))
+	tokenizer: str = os.getenv("LLM_TOKENIZER", "")
+	# Fixed system prefix + block-trimmed history so Ollama can reuse its KV cache across turns
+	stable_prefix: bool = os.getenv("LLM_STABLE_PREFIX", "true").lower() == "true"
+	keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+	num_ctx: int = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
 
 class JudgeConfig(BaseModel):
 	enabled: bool = os.getenv("JUDGE_ENABLED", "true").lower() == "true"
 	model: str = os.getenv("JUDGE_MODEL", "llama3.2")
 	threshold: float = float(os.getenv("JUDGE_THRESHOLD", "6.0"))
+	# "background" scores off the request path; "sync" blocks and honors the threshold
+	mode: str = os.getenv("JUDGE_MODE", "background")
+	sample_rate: float = float(os.getenv("JUDGE_SAMPLE_RATE", "1.0"))
+	workers: int = int(os.getenv("JUDGE_WORKERS", "1"))
+	queue_size: int = int(os.getenv("JUDGE_QUEUE_SIZE", "256"))
+	results_path: str = os.getenv("JUDGE_RESULTS_PATH", "judge_results.jsonl")
+
+class MemoryConfig(BaseModel):
+	# Long-term memory: add() queues turns; a background writer embeds and upserts them in batches
+	write_behind: bool = os.getenv("MEMORY_WRITE_BEHIND", "true").lower() == "true"
+	batch_size: int = int(os.getenv("MEMORY_BATCH_SIZE", "32"))
+	linger_s: float = float(os.getenv("MEMORY_LINGER_S", "0.5"))
+	queue_size: int = int(os.getenv("MEMORY_QUEUE_SIZE", "1024"))
+	# Turns this similar (cosine) to a stored turn of the same session are skipped (0 = off)
+	dedup_threshold: float = float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.97"))
+	# Recall score is halved every half_life_days of age (0 = no decay); candidates fetched per returned result
+	half_life_days: float = float(os.getenv("MEMORY_HALF_LIFE_DAYS", "30"))
+	recall_oversample: int = int(os.getenv("MEMORY_RECALL_OVERSAMPLE", "4"))
+	# Compaction: keep the newest keep_recent turns per session, fold older ones into summaries of group_size turns,
+	# then drop the oldest points beyond max_per_session
+	keep_recent: int = int(os.getenv("MEMORY_KEEP_RECENT", "50"))
+	group_size: int = int(os.getenv("MEMORY_COMPACT_GROUP", "10"))
+	max_per_session: int = int(os.getenv("MEMORY_MAX_PER_SESSION", "200"))
+	compact_interval_s: float = float(os.getenv("MEMORY_COMPACT_INTERVAL_S", "3600"))
+	# Summaries are written by this Ollama model (default: OLLAMA_MODEL); without the LLM they are extractive
+	summary_model: str = os.getenv("MEMORY_SUMMARY_MODEL", "")
+
+class ApiConfig(BaseModel):
+	host: str = os.getenv("API_HOST", "0.0.0.0")
+	port: int = int(os.getenv("API_PORT", "8080"))
+	# Requests beyond this many in flight are rejected with 429
+	max_inflight: int = int(os.getenv("API_MAX_INFLIGHT", "64"))
+	# Concurrent Ollama generations; further answers wait up to llm_wait_s, then get 503
+	llm_concurrency: int = int(os.getenv("API_LLM_CONCURRENCY", "4"))
+	llm_wait_s: float = float(os.getenv("API_LLM_WAIT_S", "30"))
 
 app_config = AppConfig()
 qdrant_config = QdrantConfig()
+faiss_config = FaissConfig()
 embedding_config = EmbeddingConfig()
 reranker_config = RerankerConfig()
 llm_config = LLMConfig()
 judge_config = JudgeConfig()
+memory_config = MemoryConfig()
+api_config = ApiConfig()
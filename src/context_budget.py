@@ -0,0 +1,134 @@
+from __future__ import annotations
+from typing import List, Dict, Any, Tuple, Callable
+from functools import lru_cache
+
+from config import llm_config
+
+# Rough chars-per-token for English prose when no tokenizer is configured
+_CHARS_PER_TOKEN = 4
+# Don't bother packing a truncated chunk smaller than this
+_MIN_PARTIAL_TOKENS = 48
+
+
+@lru_cache(maxsize=None)
+def _load_tokenizer(name: str):
+	from transformers import AutoTokenizer
+	return AutoTokenizer.from_pretrained(name)
+
+
+def token_counter(tokenizer_name: str | None = None) -> Callable[[str], int]:
+	"""Token counter for the generation model (LLM_TOKENIZER), or a chars/4 estimate if unset."""
+	name = llm_config.tokenizer if tokenizer_name is None else tokenizer_name
+	if not name:
+		return lambda text: (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+	tokenizer = _load_tokenizer(name)
+	return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def _overlap_len(a: str, b: str, max_overlap: int) -> int:
+	"""Length of the longest suffix of a that is a prefix of b (bounded by max_overlap)."""
+	for n in range(min(len(a), len(b), max_overlap), 0, -1):
+		if a.endswith(b[:n]):
+			return n
+	return 0
+
+
+def _priority(doc: Dict[str, Any]) -> float:
+	score = doc.get("rerank_score")
+	return score if score is not None else doc.get("score") or 0.0
+
+
+def merge_adjacent(docs: List[Dict[str, Any]], max_overlap: int) -> Tuple[List[Dict[str, Any]], int]:
+	"""Drop duplicate chunks and merge consecutive chunk_index runs from the same source.
+
+	Overlapping text between neighbours is emitted once. A merged doc keeps the
+	best priority of its parts and lists every point id in "ids".
+	Returns (docs, number of chunks merged away).
+	"""
+	seen: set = set()
+	by_source: Dict[str, List[Dict[str, Any]]] = {}
+	for d in docs:
+		payload = d.get("payload", {})
+		key = str(d.get("id")), payload.get("text", "")
+		if key in seen or (payload.get("source"), payload.get("text")) in seen:
+			continue
+		seen.add(key)
+		seen.add((payload.get("source"), payload.get("text")))
+		by_source.setdefault(payload.get("source", "unknown"), []).append(d)
+	merged: List[Dict[str, Any]] = []
+	merged_away = 0
+	for source, group in by_source.items():
+		group.sort(key=lambda d: d.get("payload", {}).get("chunk_index", 0))
+		current = None
+		for d in group:
+			payload = d.get("payload", {})
+			idx = payload.get("chunk_index")
+			if current is not None and idx is not None and idx == current["payload"].get("chunk_end", -2) + 1:
+				text = payload.get("text", "")
+				cut = _overlap_len(current["payload"]["text"], text, max_overlap)
+				current["payload"]["text"] += text[cut:] if cut else " " + text
+				current["payload"]["chunk_end"] = idx
+				current["ids"].append(d.get("id"))
+				current["rerank_score"] = max(_priority(current), _priority(d))
+				merged_away += 1
+				continue
+			current = dict(d)
+			current["payload"] = dict(payload, chunk_end=idx if idx is not None else -2)
+			current["ids"] = [d.get("id")]
+			current["rerank_score"] = _priority(d)
+			merged.append(current)
+	return merged, merged_away
+
+
+class ContextBudgeter:
+	"""Packs retrieved chunks into a token budget, best rerank score first."""
+
+	def __init__(self, max_tokens: int | None = None, tokenizer_name: str | None = None, max_overlap: int = 400):
+		self.max_tokens = max_tokens or llm_config.context_tokens
+		self.count = token_counter(tokenizer_name)
+		self.max_overlap = max_overlap
+
+	def pack(self, docs: List[Dict[str, Any]], budget: int | None = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+		"""Return (packed docs in priority order, report of tokens used/dropped)."""
+		budget = self.max_tokens if budget is None else budget
+		candidates, merged_away = merge_adjacent(docs, self.max_overlap)
+		candidates.sort(key=_priority, reverse=True)
+		packed: List[Dict[str, Any]] = []
+		used = dropped = truncated = 0
+		for d in candidates:
+			text = d["payload"].get("text", "")
+			# Each doc is rendered under a "[Doc N] Source: ..." header line, blank-line separated; those count too
+			sep = "\n\n" if packed else ""
+			header = self.count(f"{sep}[Doc {len(packed) + 1}] Source: {d['payload'].get('source', 'unknown')}\n")
+			n = self.count(text) + header
+			remaining = budget - used
+			if n <= remaining:
+				packed.append(d)
+				used += n
+				continue
+			if remaining >= _MIN_PARTIAL_TOKENS:
+				# Keep the head of the chunk that still fits (proportional cut, then verify)
+				room = remaining - header
+				keep = text[:max(0, int(len(text) * room / max(n, 1)))]
+				while keep and self.count(keep) > room:
+					keep = keep[:int(len(keep) * 0.9)]
+				if keep:
+					d["payload"]["text"] = keep
+					packed.append(d)
+					kept = self.count(keep) + header
+					used += kept
+					dropped += n - kept
+					truncated += 1
+					continue
+			dropped += n
+		report = {
+			"budget_tokens": budget,
+			"used_tokens": used,
+			"dropped_tokens": dropped,
+			"input_chunks": len(docs),
+			"packed_docs": len(packed),
+			"merged_chunks": merged_away,
+			"truncated_docs": truncated,
+			"dropped_docs": len(candidates) - len(packed),
+		}
+		return packed, report
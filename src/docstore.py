@@ -0,0 +1,83 @@
+from __future__ import annotations
+from typing import List, Dict, Any, Iterable
+import os
+import sqlite3
+import threading
+import zlib
+
+from metrics import metrics
+from config import app_config
+
+_SQL_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+	collection TEXT NOT NULL,
+	point_id TEXT NOT NULL,
+	text BLOB NOT NULL,
+	PRIMARY KEY (collection, point_id)
+) WITHOUT ROWID;
+"""
+
+
+class DocStore:
+	"""Chunk text kept out of the vector store: zlib-compressed rows in SQLite keyed by (collection, point id).
+
+	With TEXT_STORE=local, ingestion writes text here and the vector payload
+	keeps only filterable metadata, so searches return small payloads.
+	Retriever fetches text in bulk for the few candidates that survive MMR
+	and go on to the reranker and the prompt.
+	"""
+
+	def __init__(self, path: str | None = None, level: int = 6):
+		path = path or app_config.text_store_path
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		self.level = level
+		self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+		self._db.execute("PRAGMA journal_mode=WAL")
+		self._db.execute("PRAGMA synchronous=NORMAL")
+		self._db.executescript(_SCHEMA)
+		self._lock = threading.Lock()
+		self.fetched = 0
+		self.missing = 0
+
+	def put_many(self, collection: str, ids: List[str], texts: List[str]) -> None:
+		rows = [(collection, str(pid), zlib.compress(text.encode("utf-8"), self.level)) for pid, text in zip(ids, texts)]
+		with self._lock, self._db:
+			self._db.executemany("INSERT OR REPLACE INTO chunks (collection, point_id, text) VALUES (?, ?, ?)", rows)
+
+	def get_many(self, collection: str, ids: Iterable[str]) -> Dict[str, str]:
+		"""Texts for the ids that are stored; missing ids are left out."""
+		ids = list(dict.fromkeys(str(i) for i in ids))
+		out: Dict[str, str] = {}
+		with self._lock:
+			for start in range(0, len(ids), _SQL_BATCH):
+				batch = ids[start:start + _SQL_BATCH]
+				rows = self._db.execute(f"SELECT point_id, text FROM chunks WHERE collection = ? AND point_id IN ({','.join('?' * len(batch))})", (collection, *batch))
+				out.update((pid, zlib.decompress(blob).decode("utf-8")) for pid, blob in rows)
+			self.fetched += len(out)
+			self.missing += len(ids) - len(out)
+		return out
+
+	def delete(self, collection: str, ids: Iterable[str]) -> None:
+		ids = [str(i) for i in ids]
+		with self._lock, self._db:
+			for start in range(0, len(ids), _SQL_BATCH):
+				batch = ids[start:start + _SQL_BATCH]
+				self._db.execute(f"DELETE FROM chunks WHERE collection = ? AND point_id IN ({','.join('?' * len(batch))})", (collection, *batch))
+
+	def hydrate(self, collection: str, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+		"""Fill payload["text"] in place for docs that lack it (points written with text in the payload are left alone)."""
+		need = [d for d in docs if "text" not in (d.get("payload") or {})]
+		if not need:
+			return docs
+		with metrics.span("docstore.fetch", items=len(need)):
+			texts = self.get_many(collection, (d["id"] for d in need))
+		for d in need:
+			d["payload"] = (d.get("payload") or {}) | {"text": texts.get(str(d["id"]), "")}
+		return docs
+
+	def stats(self) -> Dict[str, float]:
+		with self._lock:
+			rows = self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+		return {"chunks": rows, "fetched": self.fetched, "missing": self.missing}
@@ -0,0 +1,201 @@
+from __future__ import annotations
+from typing import List, Dict, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+import json
+import mmap
+import os
+import threading
+import numpy as np
+
+try:
+	import fcntl
+except ImportError:  # Windows: no cross-process lock, rows are still verified by digest
+	fcntl = None
+
+_DIGEST_BYTES = 16
+
+def text_digest(text: str) -> bytes:
+	return hashlib.blake2b(text.encode("utf-8"), digest_size=_DIGEST_BYTES).digest()
+
+def _flush_rows(array: np.memmap, start: int, stop: int) -> None:
+	"""msync rows [start, stop) of a memmap mapped from the start of its file."""
+	row_bytes = array.strides[0]
+	begin = start * row_bytes // mmap.ALLOCATIONGRANULARITY * mmap.ALLOCATIONGRANULARITY
+	array._mmap.flush(begin, stop * row_bytes - begin)
+
+
+class EmbeddingCache:
+	"""Two-tier embedding cache: in-memory LRU in front of a memory-mapped disk store.
+
+	The disk tier lives in its own directory per (model, normalization) namespace:
+	a float32 matrix of `disk_items` rows plus a parallel array of text digests,
+	both memory-mapped. Rows are written ring-buffer style, so once full the
+	oldest entries are evicted first. Several processes may share a directory:
+	writers serialize on a lock file and every disk row is checked against its
+	digest before use, since another process may have overwritten it.
+	"""
+
+	def __init__(self, model_name: str, dimension: int, normalize: bool = True, cache_dir: str | None = None, memory_items: int = 10000, disk_items: int = 200000):
+		self.dimension = dimension
+		self.memory_items = memory_items
+		self.hits = 0
+		self.disk_hits = 0
+		self.misses = 0
+		self._lru: OrderedDict[bytes, np.ndarray] = OrderedDict()
+		self._lock = threading.Lock()
+		self._vectors: Optional[np.memmap] = None
+		self._digests: Optional[np.memmap] = None
+		self._rows: Dict[bytes, int] = {}
+		self._owners: List[Optional[bytes]] = []
+		self._lock_file = None
+		if cache_dir and disk_items > 0:
+			namespace = hashlib.sha1(f"{model_name}|{dimension}|{normalize}".encode("utf-8")).hexdigest()[:16]
+			self._open_disk(os.path.join(cache_dir, namespace), model_name, disk_items)
+
+	def _open_disk(self, path: str, model_name: str, capacity: int) -> None:
+		os.makedirs(path, exist_ok=True)
+		self._meta_path = os.path.join(path, "meta.json")
+		self._lock_file = open(os.path.join(path, "lock"), "a+b")
+		with self._file_lock(exclusive=True):
+			meta = self._read_meta()
+			if meta.get("capacity") != capacity or meta.get("dimension") != self.dimension:
+				# Shape changed: start over rather than misread rows
+				meta = {"model": model_name, "dimension": self.dimension, "capacity": capacity, "cursor": 0}
+				mode = "w+"
+			else:
+				mode = "r+"
+			self._vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode=mode, shape=(capacity, self.dimension))
+			self._digests = np.memmap(os.path.join(path, "digests.bin"), dtype=np.uint8, mode=mode, shape=(capacity, _DIGEST_BYTES))
+			self._meta = meta
+			if mode == "w+":
+				self._flush()
+			self._owners = [None] * capacity
+			for row in np.flatnonzero(self._digests.any(axis=1)):
+				digest = self._digests[row].tobytes()
+				self._rows[digest] = int(row)
+				self._owners[row] = digest
+
+	def _read_meta(self) -> Dict:
+		if not os.path.exists(self._meta_path):
+			return {}
+		with open(self._meta_path, "r", encoding="utf-8") as f:
+			return json.load(f)
+
+	@contextmanager
+	def _file_lock(self, exclusive: bool):
+		"""Hold the cross-process lock on the disk tier (shared for reads, exclusive for writes)."""
+		if self._lock_file is None or fcntl is None:
+			yield
+			return
+		fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+		try:
+			yield
+		finally:
+			fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+	def _disk_row(self, digest: bytes) -> Optional[int]:
+		"""Row holding digest, or None if unknown or overwritten by another process."""
+		row = self._rows.get(digest)
+		if row is None:
+			return None
+		if self._digests[row].tobytes() != digest:
+			del self._rows[digest]
+			self._owners[row] = None
+			return None
+		return row
+
+	def _remember(self, digest: bytes, vec: np.ndarray) -> None:
+		self._lru[digest] = vec
+		self._lru.move_to_end(digest)
+		while len(self._lru) > self.memory_items:
+			self._lru.popitem(last=False)
+
+	def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+		"""Return cached vectors aligned with texts, None where missing."""
+		out: List[Optional[np.ndarray]] = []
+		with self._lock:
+			pending = []
+			for pos, text in enumerate(texts):
+				digest = text_digest(text)
+				vec = self._lru.get(digest)
+				if vec is not None:
+					self._lru.move_to_end(digest)
+					self.hits += 1
+				elif digest in self._rows:
+					pending.append((pos, digest))
+				else:
+					self.misses += 1
+				out.append(vec)
+			if pending:
+				with self._file_lock(exclusive=False):
+					for pos, digest in pending:
+						row = self._disk_row(digest)
+						if row is None:
+							self.misses += 1
+							continue
+						out[pos] = np.array(self._vectors[row])
+						self._remember(digest, out[pos])
+						self.hits += 1
+						self.disk_hits += 1
+		return out
+
+	def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+		with self._lock:
+			for text, vec in zip(texts, vectors):
+				self._remember(text_digest(text), np.asarray(vec, dtype=np.float32))
+			if self._vectors is None:
+				return
+			with self._file_lock(exclusive=True):
+				# The cursor is shared: pick it up from whichever process wrote last
+				self._meta["cursor"] = self._read_meta().get("cursor", self._meta["cursor"])
+				first, written = self._meta["cursor"], 0
+				for text, vec in zip(texts, vectors):
+					digest = text_digest(text)
+					if self._disk_row(digest) is not None:
+						continue
+					row = self._meta["cursor"]
+					# Forget whatever this process last knew to be in the row, even if another process replaced it since
+					if self._owners[row] is not None:
+						self._rows.pop(self._owners[row], None)
+					self._vectors[row] = np.asarray(vec, dtype=np.float32)
+					self._digests[row] = np.frombuffer(digest, dtype=np.uint8)
+					self._rows[digest] = row
+					self._owners[row] = digest
+					self._meta["cursor"] = (row + 1) % len(self._digests)
+					written += 1
+				if written:
+					self._flush(first, written)
+
+	def _flush(self, first: int = 0, count: Optional[int] = None) -> None:
+		"""Sync `count` ring rows from `first` (all rows by default), then publish the cursor.
+
+		Other processes see writes through the shared mapping right away; the
+		sync is for durability, so only the rows just written are flushed.
+		"""
+		capacity = len(self._digests)
+		if count is None or count >= capacity:
+			spans = [(0, capacity)]
+		else:
+			spans = [(first, min(first + count, capacity))]
+			if first + count > capacity:
+				spans.append((0, first + count - capacity))
+		for start, stop in spans:
+			_flush_rows(self._vectors, start, stop)
+			_flush_rows(self._digests, start, stop)
+		tmp = self._meta_path + ".tmp"
+		with open(tmp, "w", encoding="utf-8") as f:
+			json.dump(self._meta, f)
+		os.replace(tmp, self._meta_path)
+
+	def stats(self) -> Dict[str, float]:
+		total = self.hits + self.misses
+		return {
+			"hits": self.hits,
+			"disk_hits": self.disk_hits,
+			"misses": self.misses,
+			"hit_rate": self.hits / total if total else 0.0,
+			"memory_items": len(self._lru),
+			"disk_items": len(self._rows),
+		}
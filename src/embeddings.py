@@ -1,26 +1,121 @@
 from __future__ import annotations
-from typing import List
+from typing import Any, Dict, List
+import asyncio
+import numpy as np
 import torch
 from sentence_transformers import SentenceTransformer
-from config import embedding_config
+from embedding_cache import EmbeddingCache
+from batching import MicroBatcher
+from metrics import metrics
+from config import embedding_config, app_config
+
+def set_torch_threads(intra_op: int, inter_op: int) -> None:
+	"""Apply explicit torch thread counts (0 = leave the default). Process-wide."""
+	if intra_op > 0:
+		torch.set_num_threads(intra_op)
+	if inter_op > 0:
+		try:
+			torch.set_num_interop_threads(inter_op)
+		except RuntimeError:
+			# Only settable before the first parallel op
+			pass
+
 
 class EmbeddingService:
-	def __init__(self, model_name: str | None = None):
+	def __init__(self, model_name: str | None = None, cache: EmbeddingCache | None = None, backend: str | None = None, int8: bool | None = None):
 		self.model_name = model_name or embedding_config.mdel_name
 		self.dimension = embedding_config.dimension
-		self.device = "cuda" if torch.cuda.is_available() else "cpu"
-		self.model = SentenceTransformer(self.model_name, device=self.device)
+		self.normalize = True
+		self.backend = backend or embedding_config.backend
+		int8 = embedding_config.onnx_int8 if int8 is None else int8
+		if self.backend == "onnx":
+			from onnx_backend import OnnxSentenceEncoder
+			self.device = "cpu"
+			self.model = OnnxSentenceEncoder(self.model_name, quantize=int8, intra_op_threads=embedding_config.intra_op_threads, inter_op_threads=embedding_config.inter_op_threads)
+		else:
+			set_torch_threads(embedding_config.intra_op_threads, embedding_config.inter_op_threads)
+			self.device = "cuda" if torch.cuda.is_available() else "cpu"
+			self.model = SentenceTransformer(self.model_name, device=self.device)
+		if cache is None and embedding_config.cache_enabled:
+			# ONNX/int8 vectors drift slightly from torch ones, so they get their own cache namespace
+			cache_key = self.model_name if self.backend == "torch" else f"{self.model_name}@onnx{'-int8' if int8 else ''}"
+			cache = EmbeddingCache(
+				cache_key,
+				self.dimension,
+				normalize=self.normalize,
+				cache_dir=embedding_config.cache_dir,
+				memory_items=embedding_config.cache_memory_items,
+				disk_items=embedding_config.cache_disk_items,
+			)
+		self.cache = cache
 
-	def embed_texts(self, texts: List[str]) -> List[List[float]]:
+	def _encode(self, texts: List[str]) -> np.ndarray:
+		with metrics.span("embed.encode", items=len(texts)):
+			return self.model.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=self.normalize)
+
+	def embed_array(self, texts: List[str]) -> np.ndarray:
+		"""Embeddings as one float32 array (rows follow texts), for bulk writers that take NumPy directly."""
 		if not texts:
-			return []
-		embeddings = self.model.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
-		return embeddings.tolist()
+			return np.empty((0, self.dimension), dtype=np.float32)
+		if self.cache is None:
+			return self._encode(texts)
+		cached = self.cache.get_many(texts)
+		missing = [i for i, v in enumerate(cached) if v is None]
+		if missing:
+			# Encode each distinct missing text once
+			unique = list(dict.fromkeys(texts[i] for i in missing))
+			encoded = self._encode(unique)
+			self.cache.put_many(unique, encoded)
+			by_text = dict(zip(unique, encoded))
+			for i in missing:
+				cached[i] = by_text[texts[i]]
+		return np.stack(cached)
+
+	def embed_texts(self, texts: List[str]) -> List[List[float]]:
+		return self.embed_array(texts).tolist()
 
 	def embed_text(self, text: str) -> List[float]:
 		return self.embed_texts([text])[0]
 
 
+class BatchedEmbeddingService:
+	"""EmbeddingService front that micro-batches single-text embeds across threads and coroutines.
+
+	Multi-text calls (ingestion) are already batched and go straight to the
+	wrapped service; other attributes (dimension, model, cache) are forwarded to it.
+	"""
+
+	def __init__(self, service: EmbeddingService | None = None, max_batch: int | None = None, max_wait_ms: float | None = None):
+		self.service = service or EmbeddingService()
+		max_batch = embedding_config.microbatch_size if max_batch is None else max_batch
+		max_wait_ms = embedding_config.microbatch_wait_ms if max_wait_ms is None else max_wait_ms
+		self.batcher = MicroBatcher(self.service.embed_texts, max_batch, max_wait_ms, app_config.microbatch_queue_size, name="embed-batcher") if max_batch > 1 else None
+
+	def __getattr__(self, name: str) -> Any:
+		if name == "service":
+			raise AttributeError(name)
+		return getattr(self.service, name)
+
+	def embed_texts(self, texts: List[str]) -> List[List[float]]:
+		return self.service.embed_texts(texts)
+
+	def embed_array(self, texts: List[str]) -> np.ndarray:
+		return self.service.embed_array(texts)
+
+	def embed_text(self, text: str) -> List[float]:
+		if self.batcher is None:
+			return self.service.embed_text(text)
+		return self.batcher.call(text)
+
+	async def aembed_text(self, text: str) -> List[float]:
+		if self.batcher is None:
+			return await asyncio.to_thread(self.service.embed_text, text)
+		return await self.batcher.submit(text)
+
+	def batch_stats(self) -> Dict[str, Any]:
+		return self.batcher.stats() if self.batcher else {}
+
+
 
 # from sentence_transformers import SentenceTransformer, InputExample, losses
 # from torch.utils.data import DataLoader
@@ -0,0 +1,445 @@
+from __future__ import annotations
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+import faiss
+from qdrant_client.http.models import Distance, Filter, FieldCondition, MatchValue, MatchAny, DatetimeRange, PayloadSchemaType
+
+from vectorstore import VectorStore, CollectionProfile, _payload_point_id
+from metrics import metrics
+from config import faiss_config
+
+# Filters matching at most this many points are scored exactly instead of walking the index with a selector
+EXACT_FILTER_LIMIT = 2048
+# Rebuild an index once deleted/replaced vectors exceed this share of it
+COMPACT_RATIO = 0.25
+# faiss warns below ~39 training points per inverted list
+IVF_POINTS_PER_LIST = 39
+_SQL_BATCH = 500
+
+_METRICS = {Distance.COSINE: faiss.METRIC_INNER_PRODUCT, Distance.DOT: faiss.METRIC_INNER_PRODUCT}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS collections (
+	name TEXT PRIMARY KEY,
+	dim INTEGER NOT NULL,
+	distance TEXT NOT NULL,
+	-- ids below this are in the saved index file
+	next_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS points (
+	collection TEXT NOT NULL,
+	id INTEGER NOT NULL,
+	point_id TEXT NOT NULL,
+	payload TEXT NOT NULL,
+	PRIMARY KEY (collection, id)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS points_point_id ON points (collection, point_id);
+-- Rows replaced by upserts since the last save; their vectors are still in the saved index
+CREATE TABLE IF NOT EXISTS superseded (
+	collection TEXT NOT NULL,
+	id INTEGER NOT NULL,
+	point_id TEXT NOT NULL,
+	payload TEXT NOT NULL,
+	PRIMARY KEY (collection, id)
+);
+"""
+
+
+@dataclass
+class _Collection:
+	name: str
+	dim: int
+	distance: str
+	index: Optional[faiss.Index] = None
+	# Rows in `points` that have a vector in `index`; index.ntotal - live are tombstones
+	live: int = 0
+	next_id: int = 0
+	mtime: int = 0
+	mmapped: bool = False
+	# Set once this process writes to the collection; it then owns the index file
+	writer: bool = False
+	dirty: bool = False
+	flushed_at: float = 0.0
+	# Queries currently searching `index` outside the store lock; upserts then add to a copy
+	searches: int = 0
+
+
+def _json_path(key: str) -> str:
+	return "$." + ".".join(f'"{part}"' for part in key.split("."))
+
+
+def _condition(cond: Any) -> Tuple[str, List[Any]]:
+	if isinstance(cond, Filter):
+		sql, args = _where(cond)
+		return f"({sql})", args
+	if not isinstance(cond, FieldCondition):
+		raise ValueError(f"Unsupported filter condition for the faiss backend: {type(cond).__name__}")
+	path = _json_path(cond.key)
+	if isinstance(cond.match, MatchValue):
+		# json_each also matches any element of an array field, like Qdrant
+		return "EXISTS (SELECT 1 FROM json_each(payload, ?) WHERE value = ?)", [path, cond.match.value]
+	if isinstance(cond.match, MatchAny):
+		marks = ",".join("?" * len(cond.match.any))
+		return f"EXISTS (SELECT 1 FROM json_each(payload, ?) WHERE value IN ({marks}))", [path, *cond.match.any]
+	if isinstance(cond.range, DatetimeRange):
+		# SQLite's datetime() normalizes ISO strings (and UTC offsets) to one comparable form
+		clauses, args = [], []
+		for op, bound in ((">", cond.range.gt), (">=", cond.range.gte), ("<", cond.range.lt), ("<=", cond.range.lte)):
+			if bound is not None:
+				clauses.append(f"datetime(json_extract(payload, ?)) {op} datetime(?)")
+				args += [path, bound.isoformat()]
+		return " AND ".join(clauses) or "1", args
+	if cond.range is not None:
+		clauses, args = [], []
+		for op, bound in ((">", cond.range.gt), (">=", cond.range.gte), ("<", cond.range.lt), ("<=", cond.range.lte)):
+			if bound is not None:
+				clauses.append(f"CAST(json_extract(payload, ?) AS REAL) {op} ?")
+				args += [path, bound]
+		return " AND ".join(clauses) or "1", args
+	raise ValueError(f"Unsupported condition on '{cond.key}' for the faiss backend (use match value/any, range or datetime range)")
+
+
+def _where(filter_: Filter) -> Tuple[str, List[Any]]:
+	"""Translate a Qdrant Filter (must/should/must_not of match and range conditions) to SQL on the JSON payload."""
+	clauses: List[str] = []
+	args: List[Any] = []
+	for cond in filter_.must or []:
+		sql, a = _condition(cond)
+		clauses.append(sql)
+		args += a
+	for cond in filter_.must_not or []:
+		sql, a = _condition(cond)
+		clauses.append(f"NOT ({sql})")
+		args += a
+	if filter_.should:
+		parts = [_condition(c) for c in filter_.should]
+		clauses.append("(" + " OR ".join(sql for sql, _ in parts) + ")")
+		args += [a for _, part_args in parts for a in part_args]
+	return " AND ".join(clauses) or "1", args
+
+
+class FaissStore(VectorStore):
+	"""In-process vector store: a FAISS index per collection plus payloads in SQLite.
+
+	Indexes live in `path/<collection>.faiss` and are opened memory-mapped, so
+	read-only processes share the page cache; the first write loads the index
+	into memory. Payloads are compact JSON rows in `path/payloads.sqlite`,
+	which is also where filters are evaluated; queries read it through a
+	per-thread connection and search outside the store lock. Replaced or deleted points
+	stay in the index as tombstones until the next compaction.
+
+	Writes are buffered in memory and saved by flush() (also called at exit
+	and every FAISS_FLUSH_INTERVAL_S while writing). One process should write
+	a given collection at a time; readers reload the index when its file changes.
+	"""
+
+	def __init__(self, path: str | None = None, index_type: str | None = None):
+		self.path = path or faiss_config.path
+		self.index_type = index_type or faiss_config.index_type
+		if self.index_type not in ("hnsw", "ivf", "flat"):
+			raise ValueError(f"Unknown FAISS_INDEX '{self.index_type}' (expected hnsw, ivf or flat)")
+		os.makedirs(self.path, exist_ok=True)
+		self._db = sqlite3.connect(os.path.join(self.path, "payloads.sqlite"), check_same_thread=False, timeout=30)
+		self._db.execute("PRAGMA journal_mode=WAL")
+		self._db.executescript(_SCHEMA)
+		self._collections: Dict[str, _Collection] = {}
+		self._lock = threading.RLock()
+		self._local = threading.local()
+		atexit.register(self.flush)
+
+	def _reader(self) -> sqlite3.Connection:
+		"""This thread's read-only connection; under WAL it reads committed rows while the writer holds self._db."""
+		db = getattr(self._local, "db", None)
+		if db is None:
+			db = self._local.db = sqlite3.connect(os.path.join(self.path, "payloads.sqlite"), timeout=30)
+			db.execute("PRAGMA query_only = ON")
+		return db
+
+	def _index_path(self, name: str) -> str:
+		return os.path.join(self.path, f"{name}.faiss")
+
+	def _new_index(self, col: _Collection, train: Optional[np.ndarray] = None) -> faiss.Index:
+		metric = _METRICS[Distance(col.distance)]
+		if self.index_type == "hnsw":
+			inner = faiss.IndexHNSWFlat(col.dim, faiss_config.hnsw_m, metric)
+			inner.hnsw.efConstruction = faiss_config.hnsw_ef_construction
+		elif self.index_type == "ivf":
+			nlist = max(1, min(faiss_config.ivf_nlist, len(train) // IVF_POINTS_PER_LIST))
+			inner = faiss.IndexIVFFlat(faiss.IndexFlat(col.dim, metric), col.dim, nlist, metric)
+			inner.train(train)
+			# IndexIDMap2.reconstruct (MMR, compaction) needs the direct map
+			inner.make_direct_map()
+		else:
+			inner = faiss.IndexFlat(col.dim, metric)
+		return faiss.IndexIDMap2(inner)
+
+	def _load_index(self, col: _Collection) -> None:
+		path = self._index_path(col.name)
+		if not os.path.exists(path):
+			return
+		col.mtime = os.stat(path).st_mtime_ns
+		if col.writer:
+			col.index, col.mmapped = faiss.read_index(path), False
+		else:
+			try:
+				col.index, col.mmapped = faiss.read_index(path, faiss.IO_FLAG_MMAP), True
+			except RuntimeError:
+				col.index, col.mmapped = faiss.read_index(path), False
+		col.next_id = self._db.execute("SELECT next_id FROM collections WHERE name = ?", (col.name,)).fetchone()[0]
+		col.live = self._db.execute("SELECT COUNT(*) FROM points WHERE collection = ? AND id < ?", (col.name, col.next_id)).fetchone()[0]
+
+	def _collection(self, name: str) -> _Collection:
+		col = self._collections.get(name)
+		if col is None:
+			row = self._db.execute("SELECT dim, distance, next_id FROM collections WHERE name = ?", (name,)).fetchone()
+			if row is None:
+				raise ValueError(f"Collection '{name}' not found")
+			col = self._collections[name] = _Collection(name, row[0], row[1], next_id=row[2])
+			self._load_index(col)
+		elif not col.writer and os.path.exists(self._index_path(name)) and os.stat(self._index_path(name)).st_mtime_ns != col.mtime:
+			# Another process saved a newer index
+			self._load_index(col)
+		return col
+
+	def _claim(self, col: _Collection) -> None:
+		"""Become the writer: load the index into memory and undo what a crashed writer never saved.
+
+		Rows it added have no vectors and are dropped; rows its upserts replaced
+		are restored, since their vectors are still in the saved index.
+		"""
+		if col.writer:
+			return
+		col.writer = True
+		self._load_index(col)
+		with self._db:
+			self._db.execute("DELETE FROM points WHERE collection = ? AND id >= ?", (col.name, col.next_id))
+			self._db.execute("INSERT OR IGNORE INTO points (collection, id, point_id, payload) SELECT collection, id, point_id, payload FROM superseded WHERE collection = ? AND id < ?", (col.name, col.next_id))
+			self._db.execute("DELETE FROM superseded WHERE collection = ?", (col.name,))
+		col.live = self._db.execute("SELECT COUNT(*) FROM points WHERE collection = ? AND id < ?", (col.name, col.next_id)).fetchone()[0]
+		col.flushed_at = time.monotonic()
+
+	def _prepare(self, col: _Collection, vectors: Any) -> np.ndarray:
+		x = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(-1, col.dim))
+		if col.distance == Distance.COSINE.value:
+			faiss.normalize_L2(x)
+		return x
+
+	def ensure_collection(self, name: str, vector_size: int, distance: Distance = Distance.COSINE, sparse: bool = False, profile: Optional[CollectionProfile] = None, payload_schema: Optional[Dict[str, PayloadSchemaType]] = None) -> None:
+		# `sparse`, the Qdrant storage `profile` and `payload_schema` are accepted for interface compatibility:
+		# the index type comes from FAISS_INDEX, and filters run in SQLite on the collection's rows only
+		if distance not in _METRICS:
+			raise ValueError(f"Distance {distance} is not supported by the faiss backend (use COSINE or DOT)")
+		with self._lock:
+			row = self._db.execute("SELECT dim FROM collections WHERE name = ?", (name,)).fetchone()
+			if row is None:
+				with self._db:
+					self._db.execute("INSERT INTO collections (name, dim, distance, next_id) VALUES (?, ?, ?, 0)", (name, vector_size, Distance(distance).value))
+			elif row[0] != vector_size:
+				raise ValueError(f"Collection '{name}' has dimension {row[0]}, not {vector_size}")
+
+	def upsert(self, collection: str, embeddings: List[List[float]], payloads: List[Dict[str, Any]], ids: Optional[List[str]] = None, sparse_vectors: Optional[List[Tuple[List[int], List[float]]]] = None) -> None:
+		if not payloads:
+			return
+		with metrics.span("faiss.upsert", items=len(payloads)), self._lock:
+			col = self._collection(collection)
+			self._claim(col)
+			ids = [str(i) for i in ids] if ids else [_payload_point_id(p) for p in payloads]
+			# The last occurrence of a repeated id wins, as with sequential upserts
+			keep = list({pid: i for i, pid in enumerate(ids)}.values())
+			x = self._prepare(col, [embeddings[i] for i in keep])
+			rowids = np.arange(col.next_id, col.next_id + len(keep), dtype=np.int64)
+			with self._db:
+				removed = 0
+				for start in range(0, len(keep), _SQL_BATCH):
+					batch = [ids[i] for i in keep[start:start + _SQL_BATCH]]
+					marks = ",".join("?" * len(batch))
+					# Kept until the next save, so a crash before it cannot lose the replaced points
+					self._db.execute(f"INSERT OR REPLACE INTO superseded (collection, id, point_id, payload) SELECT collection, id, point_id, payload FROM points WHERE collection = ? AND point_id IN ({marks})", (collection, *batch))
+					removed += self._db.execute(f"DELETE FROM points WHERE collection = ? AND point_id IN ({marks})", (collection, *batch)).rowcount
+				self._db.executemany(
+					"INSERT INTO points (collection, id, point_id, payload) VALUES (?, ?, ?, ?)",
+					[(collection, int(rid), ids[i], json.dumps(payloads[i], separators=(",", ":"), ensure_ascii=False)) for rid, i in zip(rowids, keep)],
+				)
+			if col.index is None:
+				col.index = self._new_index(col, train=x)
+			elif col.searches:
+				col.index = faiss.clone_index(col.index)
+			col.index.add_with_ids(x, rowids)
+			col.next_id += len(keep)
+			col.live += len(keep) - removed
+			col.dirty = True
+			if time.monotonic() - col.flushed_at > faiss_config.flush_interval_s:
+				self._save(col)
+
+	def delete(self, collection: str, ids: List[str]) -> None:
+		ids = [str(i) for i in ids]
+		if not ids:
+			return
+		with self._lock:
+			col = self._collection(collection)
+			self._claim(col)
+			with self._db:
+				for start in range(0, len(ids), _SQL_BATCH):
+					batch = ids[start:start + _SQL_BATCH]
+					col.live -= self._db.execute(f"DELETE FROM points WHERE collection = ? AND point_id IN ({','.join('?' * len(batch))})", (collection, *batch)).rowcount
+			col.dirty = True
+
+	def delete_where(self, collection: str, filter_: Filter) -> None:
+		where, args = _where(filter_)
+		with self._lock:
+			col = self._collection(collection)
+			self._claim(col)
+			with self._db:
+				removed = self._db.execute(f"DELETE FROM points WHERE collection = ? AND {where}", (collection, *args)).rowcount
+			if removed:
+				col.live -= removed
+				col.dirty = True
+
+	def existing_ids(self, collection: str, ids: List[str]) -> List[str]:
+		ids = [str(i) for i in ids]
+		found: List[str] = []
+		with self._lock:
+			for start in range(0, len(ids), _SQL_BATCH):
+				batch = ids[start:start + _SQL_BATCH]
+				rows = self._db.execute(f"SELECT point_id FROM points WHERE collection = ? AND point_id IN ({','.join('?' * len(batch))})", (collection, *batch))
+				found += [r[0] for r in rows]
+		return found
+
+	def scroll(self, collection: str, filter_: Optional[Filter] = None) -> List[Dict[str, Any]]:
+		where, args = _where(filter_) if filter_ is not None else ("1", [])
+		with self._lock:
+			rows = self._db.execute(f"SELECT point_id, payload FROM points WHERE collection = ? AND {where} ORDER BY id", (collection, *args)).fetchall()
+		return [{"id": pid, "payload": json.loads(payload)} for pid, payload in rows]
+
+	def _search_params(self, k: int, selector: Optional[faiss.IDSelector] = None, hnsw_ef: Optional[int] = None) -> Optional[faiss.SearchParameters]:
+		if self.index_type == "hnsw":
+			return faiss.SearchParametersHNSW(efSearch=max(hnsw_ef or faiss_config.hnsw_ef_search, k), sel=selector)
+		if self.index_type == "ivf":
+			return faiss.SearchParametersIVF(nprobe=faiss_config.ivf_nprobe, sel=selector)
+		return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+	def _exact(self, index: faiss.Index, q: np.ndarray, rowids: List[int], top_k: int) -> Tuple[List[int], List[float], Dict[int, np.ndarray]]:
+		vectors: Dict[int, np.ndarray] = {}
+		for rid in rowids:
+			try:
+				vectors[rid] = index.reconstruct(rid)
+			except RuntimeError:
+				# Written by another process after this index was saved
+				continue
+		if not vectors:
+			return [], [], {}
+		keys = list(vectors)
+		scores = np.stack([vectors[r] for r in keys]) @ q[0]
+		order = np.argsort(-scores)[:top_k]
+		return [keys[i] for i in order], [float(scores[i]) for i in order], vectors
+
+	@metrics.traced("faiss.query")
+	def query(self, collection: str, vector: List[float], top_k: int = 20, filter_: Optional[Filter] = None, with_vectors: bool = False, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> List[Dict[str, Any]]:
+		# Vectors are stored unquantized, so `oversampling` has nothing to rescore here
+		with self._lock:
+			col = self._collection(collection)
+			index, live = col.index, col.live
+			if index is None or index.ntotal == 0:
+				return []
+			col.searches += 1
+		try:
+			return self._search(col, index, live, vector, top_k, filter_, with_vectors, hnsw_ef)
+		finally:
+			with self._lock:
+				col.searches -= 1
+
+	def _search(self, col: _Collection, index: faiss.Index, live: int, vector: List[float], top_k: int, filter_: Optional[Filter], with_vectors: bool, hnsw_ef: Optional[int]) -> List[Dict[str, Any]]:
+		db = self._reader()
+		q = self._prepare(col, vector)
+		vectors: Dict[int, np.ndarray] = {}
+		if filter_ is not None:
+			where, args = _where(filter_)
+			allowed = [r[0] for r in db.execute(f"SELECT id FROM points WHERE collection = ? AND {where}", (col.name, *args))]
+			if not allowed:
+				return []
+			if len(allowed) <= EXACT_FILTER_LIMIT:
+				rowids, scores, vectors = self._exact(index, q, allowed, top_k)
+			else:
+				selector = faiss.IDSelectorBatch(np.asarray(allowed, dtype=np.int64))
+				k = min(top_k, len(allowed))
+				D, I = index.search(q, k, params=self._search_params(k, selector, hnsw_ef))
+				rowids, scores = [int(i) for i in I[0] if i >= 0], [float(d) for d, i in zip(D[0], I[0]) if i >= 0]
+		else:
+			# Over-fetch by the tombstone count so deleted points cannot crowd out live ones
+			k = min(index.ntotal, top_k + max(0, index.ntotal - live))
+			D, I = index.search(q, k, params=self._search_params(k, hnsw_ef=hnsw_ef))
+			rowids, scores = [int(i) for i in I[0] if i >= 0], [float(d) for d, i in zip(D[0], I[0]) if i >= 0]
+		rows: Dict[int, Tuple[str, str]] = {}
+		for start in range(0, len(rowids), _SQL_BATCH):
+			batch = rowids[start:start + _SQL_BATCH]
+			for rid, pid, payload in db.execute(f"SELECT id, point_id, payload FROM points WHERE collection = ? AND id IN ({','.join('?' * len(batch))})", (col.name, *batch)):
+				rows[rid] = (pid, payload)
+		items = []
+		for rid, score in zip(rowids, scores):
+			if rid not in rows:
+				continue
+			item = {"id": rows[rid][0], "score": score, "payload": json.loads(rows[rid][1])}
+			if with_vectors:
+				item["vector"] = (vectors[rid] if rid in vectors else index.reconstruct(rid)).tolist()
+			items.append(item)
+			if len(items) == top_k:
+				break
+		return items
+
+	def _rebuild(self, col: _Collection) -> None:
+		"""Re-create the index from live vectors: drops tombstones and re-trains IVF lists."""
+		rowids = np.fromiter((r[0] for r in self._db.execute("SELECT id FROM points WHERE collection = ? ORDER BY id", (col.name,))), dtype=np.int64)
+		if not len(rowids):
+			col.index, col.live = None, 0
+			return
+		x = np.ascontiguousarray(col.index.reconstruct_batch(rowids), dtype=np.float32)
+		col.index = self._new_index(col, train=x)
+		col.index.add_with_ids(x, rowids)
+		col.live = len(rowids)
+
+	def _needs_rebuild(self, col: _Collection) -> bool:
+		ntotal = col.index.ntotal
+		if ntotal - col.live > COMPACT_RATIO * ntotal:
+			return True
+		if self.index_type == "ivf":
+			nlist = faiss.extract_index_ivf(col.index).nlist
+			# Re-train once the collection has grown enough to support twice as many lists
+			return nlist < faiss_config.ivf_nlist and col.live >= 2 * nlist * IVF_POINTS_PER_LIST
+		return False
+
+	def _save(self, col: _Collection) -> None:
+		path = self._index_path(col.name)
+		if col.index is not None and self._needs_rebuild(col):
+			self._rebuild(col)
+		if col.index is None:
+			if os.path.exists(path):
+				os.remove(path)
+		else:
+			tmp = path + ".tmp"
+			faiss.write_index(col.index, tmp)
+			os.replace(tmp, path)
+			col.mtime = os.stat(path).st_mtime_ns
+		with self._db:
+			self._db.execute("UPDATE collections SET next_id = ? WHERE name = ?", (col.next_id, col.name))
+			self._db.execute("DELETE FROM superseded WHERE collection = ?", (col.name,))
+		col.dirty = False
+		col.flushed_at = time.monotonic()
+
+	def flush(self) -> None:
+		with self._lock:
+			for col in self._collections.values():
+				if col.dirty:
+					self._save(col)
+
+	def stats(self, collection: str) -> Dict[str, Any]:
+		with self._lock:
+			col = self._collection(collection)
+			ntotal = col.index.ntotal if col.index is not None else 0
+			return {"index": self.index_type, "points": col.live, "tombstones": ntotal - col.live, "mmapped": col.mmapped, "dirty": col.dirty}
@@ -0,0 +1,156 @@
+from __future__ import annotations
+from typing import List, Dict, Any, Optional
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+import json
+import threading
+import time
+
+DEFAULT_ANSWER = "Based on the context, revenue grew year over year [Doc 1]. Margins were stable [Doc 2]."
+
+
+class FakeOllama:
+	"""Local stand-in for the Ollama HTTP API (/api/chat, /api/tags) for benchmarks and checks.
+
+	Streams a canned answer at `token_rate` tokens/s and records every request.
+	It also models Ollama's KV-cache reuse: only the part of the prompt after the
+	longest common prefix with the previous prompt counts as prompt-eval
+	tokens, at `prompt_rate` tokens/s. Tokens are whitespace-separated words.
+	"""
+
+	def __init__(self, host: str = "127.0.0.1", port: int = 0, token_rate: float = 50.0, prompt_rate: float = 2000.0, answer: str = DEFAULT_ANSWER, answer_repeat: int = 1):
+		self.token_rate = token_rate
+		self.prompt_rate = prompt_rate
+		self.answer_tokens = (answer + " ").split(" ") * answer_repeat
+		self.requests: List[Dict[str, Any]] = []
+		self._last_prompt: Dict[str, List[str]] = {}
+		self._lock = threading.Lock()
+		self._server = ThreadingHTTPServer((host, port), self._handler())
+		self._server.daemon_threads = True
+		self._thread: Optional[threading.Thread] = None
+
+	@property
+	def url(self) -> str:
+		host, port = self._server.server_address[:2]
+		return f"http://{host}:{port}"
+
+	def start(self) -> "FakeOllama":
+		self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._server.shutdown()
+		self._server.server_close()
+
+	def __enter__(self) -> "FakeOllama":
+		return self.start()
+
+	def __exit__(self, *exc) -> None:
+		self.stop()
+
+	def _prompt_eval(self, model: str, messages: List[Dict[str, Any]]) -> tuple:
+		tokens = " ".join(f"<{m.get('role')}> {m.get('content', '')}" for m in messages).split()
+		with self._lock:
+			previous = self._last_prompt.get(model, [])
+			reused = 0
+			for a, b in zip(previous, tokens):
+				if a != b:
+					break
+				reused += 1
+			self._last_prompt[model] = tokens
+		return len(tokens) - reused, reused
+
+	def _handler(self):
+		fake = self
+
+		class Handler(BaseHTTPRequestHandler):
+			protocol_version = "HTTP/1.1"
+
+			def log_message(self, *args) -> None:
+				pass
+
+			def _send_json(self, obj: Dict[str, Any]) -> None:
+				body = json.dumps(obj).encode("utf-8")
+				self.send_response(200)
+				self.send_header("Content-Type", "application/json")
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def do_GET(self) -> None:
+				if self.path.startswith("/api/tags"):
+					self._send_json({"models": [{"name": "fake"}]})
+				else:
+					self.send_error(404)
+
+			def do_POST(self) -> None:
+				length = int(self.headers.get("Content-Length", 0))
+				request = json.loads(self.rfile.read(length) or b"{}")
+				with fake._lock:
+					fake.requests.append({"path": self.path, "received_at": time.time(), "body": request})
+				if not self.path.startswith("/api/chat"):
+					self.send_error(404)
+					return
+				model = request.get("model", "")
+				started = time.perf_counter()
+				evaluated, reused = fake._prompt_eval(model, request.get("messages", []))
+				prompt_s = evaluated / fake.prompt_rate if fake.prompt_rate else 0.0
+				time.sleep(prompt_s)
+				tokens = fake.answer_tokens
+				done = {
+					"model": model,
+					"done": True,
+					"done_reason": "stop",
+					"prompt_eval_count": evaluated,
+					"prompt_eval_duration": int(prompt_s * 1e9),
+					"eval_count": len(tokens),
+					"eval_duration": int(len(tokens) / fake.token_rate * 1e9) if fake.token_rate else 0,
+					"load_duration": 0,
+					"reused_prompt_tokens": reused,
+				}
+				if not request.get("stream", True):
+					time.sleep(done["eval_duration"] / 1e9)
+					done["total_duration"] = int((time.perf_counter() - started) * 1e9)
+					self._send_json(done | {"message": {"role": "assistant", "content": " ".join(tokens).strip()}})
+					return
+				self.send_response(200)
+				self.send_header("Content-Type", "application/x-ndjson")
+				self.send_header("Transfer-Encoding", "chunked")
+				self.end_headers()
+				delay = 1.0 / fake.token_rate if fake.token_rate else 0.0
+				for i, tok in enumerate(tokens):
+					piece = tok if i == 0 else " " + tok
+					self._write_chunk({"model": model, "done": False, "message": {"role": "assistant", "content": piece}})
+					time.sleep(delay)
+				done["total_duration"] = int((time.perf_counter() - started) * 1e9)
+				self._write_chunk(done | {"message": {"role": "assistant", "content": ""}})
+				self.wfile.write(b"0\r\n\r\n")
+
+			def _write_chunk(self, obj: Dict[str, Any]) -> None:
+				line = (json.dumps(obj) + "\n").encode("utf-8")
+				self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+				self.wfile.flush()
+
+		return Handler
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Run a local fake Ollama server")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=11434)
+	parser.add_argument("--token-rate", type=float, default=50.0, help="Streamed tokens per second")
+	parser.add_argument("--prompt-rate", type=float, default=2000.0, help="Prompt-eval tokens per second")
+	args = parser.parse_args()
+	server = FakeOllama(args.host, args.port, token_rate=args.token_rate, prompt_rate=args.prompt_rate)
+	print(f"Fake Ollama listening on {server.url}")
+	server.start()
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		server.stop()
+
+
+if __name__ == "__main__":
+	main()
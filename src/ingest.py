@@ -1,7 +1,9 @@
 import argparse
 import os
-from chunking import build_chunks_from_directory, iter_chunks_from_directory, iter_chunks_with_archive
+from chunking import build_chunks_for_items, iter_chunks_for_items, iter_chunks_with_archive, recursive_directory_loader
 from ingestion import IngestionPipeline
+from manifest import IngestManifest
+from config import qdrant_config
 
 
 def main():
@@ -11,6 +13,8 @@ def main():
 	parser.add_argument("--stream", action="store_true", help="Use streaming ingestion (recommended for very large datasets)")
 	parser.add_argument("--archive", action="store_true", help="Archive processed files to skip them in future runs")
 	parser.add_argument("--archive-dir", default=None, help="Archive directory (default: input_dir/archive)")
+	parser.add_argument("--staged", action="store_true", help="Run parse/embed/upsert as concurrent stages (process-pool parsing, batched embedding, parallel upserts)")
+	parser.add_argument("--full", action="store_true", help="Ignore the ingest manifest and re-embed every file")
 	args = parser.parse_args()
 
 	# Set up archive directory
@@ -18,16 +22,45 @@ def main():
 	if args.archive and not archive_dir:
 		archive_dir = os.path.join(args.input, "archive")
 
+	collection = args.collection or qdrant_config.collection
 	pipe = IngestionPipeline()
-	if args.stream:
-		if args.archive:
-			chunk_iter = iter_chunks_with_archive(args.input, archive_dir)
-		else:
-			chunk_iter = iter_chunks_from_directory(args.input, archive_dir)
-		pipe.ingest_stream(chunk_iter, collection=args.collection)
+	if args.stream and args.archive:
+		pipe.ingest_stream(iter_chunks_with_archive(args.input, archive_dir), collection=collection)
+		return
+
+	items = recursive_directory_loader(args.input, archive_dir)
+	manifest = None
+	removed = []
+	if not args.full:
+		manifest = IngestManifest.for_collection(collection)
+		# Archived files leave the listing but their points must stay
+		removed = [] if args.archive else manifest.removed_paths(items, args.input)
+		total = len(items)
+		items = manifest.changed_items(items)
+		print(f"Manifest: {len(items)} new/changed, {total - len(items)} unchanged, {len(removed)} removed")
+
+	# Files that fail to parse keep their previous manifest entry and points
+	on_skip = manifest.skipped if manifest else None
+	if args.staged:
+		stats = pipe.ingest_files(items, collection=collection, chunk_filter=manifest.filter_new_chunks if manifest else None, on_skip=on_skip)
+		print(f"Staged ingest: {stats}")
+	elif args.stream:
+		chunk_iter = iter_chunks_for_items(items, on_skip)
+		if manifest:
+			chunk_iter = manifest.filter_new_chunks(chunk_iter)
+		pipe.ingest_stream(chunk_iter, collection=collection)
 	else:
-		chunks = build_chunks_from_directory(args.input, archive_dir)
-		pipe.ingest(chunks, collection=args.collection)
+		chunks = build_chunks_for_items(items, on_skip)
+		if manifest:
+			chunks = list(manifest.filter_new_chunks(chunks))
+		pipe.ingest(chunks, collection=collection)
+
+	if manifest:
+		pipe.delete(collection, manifest.stale_ids(removed))
+		pipe.store.flush()
+		manifest.commit(removed)
+	for stage, s in pipe.stage_report().items():
+		print(f"{stage:>8}: {s['items']:>9.0f} items in {s['busy_s']:7.2f}s busy ({s['items_per_s']:,.0f}/s over {s['calls']} calls)")
 
 
 if __name__ == "__main__":
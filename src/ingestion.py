@@ -1,30 +1,95 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Iterable
+from typing import List, Dict, Any, Iterable, Callable, Optional
 from math import ceil
+import queue
+import threading
+import time
+import numpy as np
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from chunking import iter_parsed_items
 from embeddings import EmbeddingService
-from vectorstore import QdrantStore
+from vectorstore import VectorStore, DOCUMENT_SCHEMA, collection_profile, _payload_point_id
+from docstore import DocStore
+from answer_cache import SemanticAnswerCache
+from sparse import SparseEncoder
+from registry import registry
+from metrics import metrics
 from config import qdrant_config, app_config
 
+# Chunks per embed+upload task in ingest()/ingest_stream(); the store sizes wire requests by bytes
 BATCH_SIZE = 512
+# How long the embedder waits for more chunks before running a partial batch
+EMBED_LINGER_S = 0.05
+_DONE = object()
 
 class IngestionPipeline:
-	def __init__(self, store: QdrantStore | None = None, embedder: EmbeddingService | None = None):
-		self.store = store or QdrantStore()
-		self.embedder = embedder or EmbeddingService()
+	def __init__(self, store: VectorStore | None = None, embedder: EmbeddingService | None = None, hybrid: bool | None = None, docstore: DocStore | None = None, answer_cache: SemanticAnswerCache | None = None):
+		self.store = store or registry.store()
+		self.embedder = embedder or registry.embedder()
+		self.docstore = docstore or registry.docstore()
+		hybrid = app_config.hybrid_search if hybrid is None else hybrid
+		self.sparse = SparseEncoder(stats=registry.term_stats()) if hybrid else None
+		self._written_sources: set = set()
+		self._answer_cache = answer_cache
+		self._shared_store = store is None
+
+	def _ensure_collection(self, collection_name: str) -> None:
+		self.store.ensure_collection(collection_name, vector_size=self.embedder.dimension, sparse=self.sparse is not None, profile=collection_profile(), payload_schema=DOCUMENT_SCHEMA)
+
+	def _upsert(self, collection_name: str, embeddings: np.ndarray, payloads: List[Dict[str, Any]]) -> None:
+		sparse_vectors = None
+		if self.sparse and self.store.has_sparse(collection_name):
+			sparse_vectors = self.sparse.encode_documents([p["text"] for p in payloads], collection_name)
+		ids = None
+		if self.docstore is not None:
+			# Text goes to the local store first, so a point is never searchable without it
+			ids = [_payload_point_id(p) for p in payloads]
+			self.docstore.put_many(collection_name, ids, [p["text"] for p in payloads])
+			payloads = [{k: v for k, v in p.items() if k != "text"} for p in payloads]
+		# Un-waited bulk write; each ingest method ends with store.flush() before invalidating answers
+		self.store.upload(collection_name, embeddings, payloads, ids=ids, sparse_vectors=sparse_vectors)
+		self._written_sources.update(p.get("source") for p in payloads)
+
+	def delete(self, collection_name: str, ids: List[str]) -> None:
+		"""Delete points and their out-of-band text."""
+		if not ids:
+			return
+		self.store.delete(collection_name, ids)
+		if self.docstore is not None:
+			self.docstore.delete(collection_name, ids)
+
+	def invalidate_answer_cache(self, extra_sources: Iterable[str] = ()) -> None:
+		"""Drop cached answers citing any source written since the last call (plus extra_sources)."""
+		sources = self._written_sources | set(extra_sources)
+		self._written_sources = set()
+		if app_config.answer_cache_enabled and sources:
+			self.answer_cache().invalidate_sources(s for s in sources if s)
+
+	def answer_cache(self) -> SemanticAnswerCache:
+		"""The answer cache kept in this pipeline's store: the registry's for the shared store, else one created on first use."""
+		if self._answer_cache is None:
+			self._answer_cache = registry.answer_cache() if self._shared_store else SemanticAnswerCache(self.store, self.embedder.dimension)
+		return self._answer_cache
 
 	def _process_batch(self, collection_name: str, batch: List[Dict[str, Any]]) -> int:
 		texts = [b["text"] for b in batch]
 		payloads = [b["metadata"] | {"text": b["text"]} for b in batch]
-		embeddings = self.embedder.embed_texts(texts)
-		self.store.upsert(collection_name, embeddings, payloads)
+		with metrics.span("ingest.embed", items=len(batch)):
+			embeddings = self.embedder.embed_array(texts)
+		with metrics.span("ingest.upsert", items=len(batch)):
+			self._upsert(collection_name, embeddings, payloads)
 		return len(batch)
 
+	@staticmethod
+	def stage_report() -> Dict[str, Dict[str, float]]:
+		"""Per-stage calls, items, busy seconds and items/s for ingestion in this process."""
+		return metrics.stage_report("ingest.")
+
 	def ingest(self, chunks: List[Dict[str, Any]], collection: str | None = None) -> None:
 		collection_name = collection or qdrant_config.collection
-		self.store.ensure_collection(collection_name, vector_size=self.embedder.dimension)
+		self._ensure_collection(collection_name)
 		
 		if not chunks:
 			return
@@ -41,10 +106,12 @@ class IngestionPipeline:
 			futures = [executor.submit(self._process_batch, collection_name, batch) for batch in batches]
 			for f in tqdm(as_completed(futures), total=len(futures), desc="Upserting to Qdrant (parallel)"):
 				completed += f.result()
+		self.store.flush()
+		self.invalidate_answer_cache()
 
 	def ingest_stream(self, chunk_iter: Iterable[Dict[str, Any]], collection: str | None = None, max_in_flight: int | None = None) -> None:
 		collection_name = collection or qdrant_config.collection
-		self.store.ensure_collection(collection_name, vector_size=self.embedder.dimension)
+		self._ensure_collection(collection_name)
 		max_in_flight = max_in_flight or app_config.max_workers
 		
 		batch: List[Dict[str, Any]] = []
@@ -69,3 +136,122 @@ class IngestionPipeline:
 				total_completed += fut.result()
 				pbar.update(total_completed - pbar.n)
 			pbar.close()
+		self.store.flush()
+		self.invalidate_answer_cache()
+
+	def ingest_files(
+		self,
+		items: List[Dict[str, Any]],
+		collection: str | None = None,
+		chunk_filter: Optional[Callable[[Iterable[Dict[str, Any]]], Iterable[Dict[str, Any]]]] = None,
+		on_skip: Optional[Callable[[Dict[str, Any]], None]] = None,
+		parse_workers: int | None = None,
+		embed_batch_size: int | None = None,
+		upsert_workers: int | None = None,
+		queue_size: int | None = None,
+	) -> Dict[str, Any]:
+		"""Staged ingestion: parse -> embed -> upsert, connected by bounded queues.
+
+		Files are parsed on the configured parse backend (processes by default), a single thread owns the embedding model
+		and runs large dynamic batches, and several upsert threads overlap network
+		writes with embedding. `chunk_filter` (e.g. IngestManifest.filter_new_chunks)
+		is applied to each file's chunks before they are queued for embedding;
+		`on_skip` (e.g. IngestManifest.skipped) gets each file that failed to parse.
+		"""
+		collection_name = collection or qdrant_config.collection
+		self._ensure_collection(collection_name)
+		parse_workers = parse_workers or app_config.parse_workers
+		embed_batch_size = embed_batch_size or app_config.embed_batch_size
+		upsert_workers = upsert_workers or app_config.upsert_workers
+		queue_size = queue_size or app_config.ingest_queue_size
+
+		chunk_q: queue.Queue = queue.Queue(maxsize=queue_size)
+		upsert_q: queue.Queue = queue.Queue(maxsize=max(2, upsert_workers * 2))
+		stats: Dict[str, Any] = {"files": 0, "chunks": 0, "upserted": 0, "embed_batches": 0, "embed_busy_s": 0.0, "max_chunk_queue": 0, "max_upsert_queue": 0}
+		errors: List[BaseException] = []
+		lock = threading.Lock()
+		pbar = tqdm(desc="Staged ingest", unit="chunks")
+
+		def report() -> None:
+			with lock:
+				stats["max_chunk_queue"] = max(stats["max_chunk_queue"], chunk_q.qsize())
+				stats["max_upsert_queue"] = max(stats["max_upsert_queue"], upsert_q.qsize())
+				pbar.set_postfix(parse_q=chunk_q.qsize(), upsert_q=upsert_q.qsize(), refresh=False)
+
+		def parse_stage() -> None:
+			try:
+				for item, chunks in iter_parsed_items(items, max_workers=parse_workers):
+					stats["files"] += 1
+					if chunks is None and on_skip:
+						on_skip(item)
+					if not chunks:
+						continue
+					for chunk in (chunk_filter(chunks) if chunk_filter else chunks):
+						chunk_q.put(chunk)
+					report()
+			except BaseException as e:
+				errors.append(e)
+			finally:
+				chunk_q.put(_DONE)
+
+		def embed_stage() -> None:
+			finished = False
+			while not finished:
+				batch: List[Dict[str, Any]] = []
+				item = chunk_q.get()
+				while item is not _DONE:
+					batch.append(item)
+					if len(batch) >= embed_batch_size:
+						break
+					try:
+						item = chunk_q.get(timeout=EMBED_LINGER_S)
+					except queue.Empty:
+						break
+				finished = item is _DONE
+				if not batch or errors:
+					continue
+				try:
+					with metrics.span("ingest.embed", items=len(batch)) as span:
+						embeddings = self.embedder.embed_array([b["text"] for b in batch])
+					stats["embed_busy_s"] += span.seconds
+					stats["embed_batches"] += 1
+					stats["chunks"] += len(batch)
+					upsert_q.put(([b["metadata"] | {"text": b["text"]} for b in batch], embeddings))
+					report()
+				except BaseException as e:
+					errors.append(e)
+			for _ in range(upsert_workers):
+				upsert_q.put(_DONE)
+
+		def upsert_stage() -> None:
+			while True:
+				job = upsert_q.get()
+				if job is _DONE:
+					return
+				if errors:
+					continue
+				payloads, embeddings = job
+				try:
+					with metrics.span("ingest.upsert", items=len(payloads)):
+						self._upsert(collection_name, embeddings, payloads)
+					with lock:
+						stats["upserted"] += len(payloads)
+						pbar.update(len(payloads))
+				except BaseException as e:
+					errors.append(e)
+
+		started = time.perf_counter()
+		threads = [threading.Thread(target=parse_stage, name="ingest-parse"), threading.Thread(target=embed_stage, name="ingest-embed")]
+		threads += [threading.Thread(target=upsert_stage, name=f"ingest-upsert-{i}") for i in range(upsert_workers)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		pbar.close()
+		self.store.flush()
+		self.invalidate_answer_cache()
+		if errors:
+			raise errors[0]
+		stats["elapsed_s"] = time.perf_counter() - started
+		stats["embed_utilization"] = stats["embed_busy_s"] / stats["elapsed_s"] if stats["elapsed_s"] else 0.0
+		return stats
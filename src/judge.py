@@ -1,24 +1,43 @@
 from __future__ import annotations
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import json
+import os
+import queue
+import random
+import re
+import threading
+import time
 import ollama
-from config import llm_config
+from registry import registry
+from metrics import metrics
+from config import judge_config
+
+_citation_re = re.compile(r"\[Doc (\d+)\]")
 
 class LLMJudge:
-	def __init__(self, model_name: str | None = None):
-		self.client = ollama.Client(host=llm_config.ollama_host)
-		self.model = model_name or llm_config.model
+	def __init__(self, model_name: str | None = None, client: ollama.Client | None = None):
+		self.client = client or registry.llm_client()
+		self.model = model_name or judge_config.model
+
+	@staticmethod
+	def cited_docs(response: str, context_docs: List[Dict[str, Any]], fallback: int = 2) -> List[tuple]:
+		"""(doc number, doc) pairs for the [Doc N] citations in response; first `fallback` docs if none are cited."""
+		cited = sorted({int(n) for n in _citation_re.findall(response) if 0 < int(n) <= len(context_docs)})
+		if not cited:
+			cited = list(range(1, min(fallback, len(context_docs)) + 1))
+		return [(n, context_docs[n - 1]) for n in cited]
 
+	@metrics.traced("judge.validate")
 	def validate_response(self, query: str, response: str, context_docs: List[Dict[str, Any]]) -> Dict[str, Any]:
 		"""Validate response quality, relevance, and citation accuracy"""
 		
-		# Prepare context for judge
+		# Prepare context for judge: only the chunks the answer cites
 		context_text = ""
-		for i, doc in enumerate(context_docs):
+		for i, doc in self.cited_docs(response, context_docs):
 			meta = doc.get("payload", {})
 			source = meta.get("source", "unknown")
 			text = meta.get("text", "")
-			context_text += f"[Doc {i+1}] Source: {source}\n{text}\n\n"
+			context_text += f"[Doc {i}] Source: {source}\n{text}\n\n"
 		
 		judge_prompt = f"""
 You are an expert judge evaluating RAG responses. Rate the following response on multiple criteria.
@@ -102,3 +121,73 @@ Provide your evaluation in JSON format:
 		"""Determine if response should be regenerated based on scores"""
 		overall_score = judgment.get("overall_score", 5)
 		return overall_score < threshold
+
+
+class BackgroundJudge:
+	"""Scores answers off the request path and appends results to a JSONL file.
+
+	Only `sample_rate` of submitted answers are judged. When the queue is full,
+	new submissions are dropped rather than blocking the caller. An item that
+	fails is counted in stats()["failed"] and the worker moves on.
+	"""
+
+	def __init__(self, judge: LLMJudge | None = None, sample_rate: float | None = None, workers: int | None = None, results_path: str | None = None):
+		self.judge = judge or LLMJudge()
+		self.sample_rate = judge_config.sample_rate if sample_rate is None else sample_rate
+		self.results_path = results_path or judge_config.results_path
+		self.submitted = 0
+		self.dropped = 0
+		self.completed = 0
+		self.failed = 0
+		self._queue: queue.Queue = queue.Queue(maxsize=judge_config.queue_size)
+		self._write_lock = threading.Lock()
+		for i in range(workers or judge_config.workers):
+			threading.Thread(target=self._worker, name=f"judge-{i}", daemon=True).start()
+
+	def submit(self, query: str, response: str, context_docs: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> bool:
+		"""Queue an answer for scoring; returns False if it was sampled out or dropped."""
+		if random.random() >= self.sample_rate:
+			return False
+		# Copy only what the judge reads, so later mutation by the caller is harmless
+		docs = [{"payload": {"source": d.get("payload", {}).get("source"), "text": d.get("payload", {}).get("text", "")}} for d in context_docs]
+		try:
+			self._queue.put_nowait((query, response, docs, metadata or {}, time.time()))
+		except queue.Full:
+			self.dropped += 1
+			return False
+		self.submitted += 1
+		return True
+
+	def _worker(self) -> None:
+		while True:
+			item = self._queue.get()
+			try:
+				self._judge(*item)
+				self.completed += 1
+			except Exception as e:
+				# One bad record (unserializable metadata, full disk...) must not take the worker down
+				self.failed += 1
+				print(f"Warning: Background judge failed: {e}")
+
+	def _judge(self, query: str, response: str, docs: List[Dict[str, Any]], metadata: Dict[str, Any], submitted_at: float) -> None:
+		started = time.time()
+		judgment = self.judge.validate_response(query, response, docs)
+		record = {
+			"submitted_at": submitted_at,
+			"judge_latency_s": time.time() - started,
+			"model": self.judge.model,
+			"query": query,
+			"response": response,
+			"sources": [d["payload"]["source"] for _, d in self.judge.cited_docs(response, docs)],
+			"judgment": judgment,
+		} | metadata
+		self._persist(record)
+
+	def _persist(self, record: Dict[str, Any]) -> None:
+		with self._write_lock:
+			os.makedirs(os.path.dirname(self.results_path) or ".", exist_ok=True)
+			with open(self.results_path, "a", encoding="utf-8") as f:
+				f.write(json.dumps(record) + "\n")
+
+	def stats(self) -> Dict[str, Any]:
+		return {"submitted": self.submitted, "completed": self.completed, "failed": self.failed, "pending": self._queue.qsize(), "dropped": self.dropped, "sample_rate": self.sample_rate}
@@ -1,16 +1,68 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Iterable
+from typing import List, Dict, Any, AsyncIterator, Iterable, Tuple
 import ollama
 
+from context_budget import ContextBudgeter
+from registry import registry
+from metrics import metrics
 from config import llm_config
 
+SYSTEM_PROMPT = (
+	"You are a helpful assistant answering questions about the user's documents. "
+	"Answer from the provided context and cite sources as [Doc N]. "
+	"If the context does not contain the answer, say so."
+)
+# Ollama reports durations in nanoseconds
+_NS = 1e9
+
 class LLMService:
-	def __init__(self):
+	def __init__(self, client: ollama.Client | None = None, async_client: ollama.AsyncClient | None = None):
 		if llm_config.provider != "ollama":
 			raise RuntimeError("Only Ollama provider is supported in current configuration")
-		self.client = ollama.Client(host=llm_config.ollama_host)
+		self.client = client or registry.llm_client()
 		self.model = llm_config.model
 		self.temperature = llm_config.temperature
+		self.budgeter = ContextBudgeter()
+		self.stable_prefix = llm_config.stable_prefix
+		self.last_metrics: Dict[str, Any] = {}
+		# Created on first achat() so it binds to the API's event loop
+		self.async_client = async_client
+
+	def _history_window(self, short_mem: List[Dict[str, Any]], size: int = 8) -> List[Dict[str, Any]]:
+		"""Last `size` messages; in stable-prefix mode the window start moves in half-window steps
+		so consecutive turns share the same leading messages."""
+		if not self.stable_prefix or len(short_mem) <= size:
+			return short_mem[-size:]
+		step = max(1, size // 2)
+		start = ((len(short_mem) - size) // step + 1) * step
+		return short_mem[start:]
+
+	def fit_context(self, query: str, short_mem: List[Dict[str, Any]], long_mem: List[Dict[str, Any]], context_docs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, Any]]:
+		"""Trim history/memory to the history budget and pack docs into what is left of the prompt budget.
+
+		Returns (short_mem, long_mem, docs, report). Docs come back merged, deduplicated
+		and in priority order; cite and display them in that order.
+		"""
+		count = self.budgeter.count
+		history_budget = llm_config.history_tokens
+		kept_history: List[Dict[str, Any]] = []
+		for m in reversed(self._history_window(short_mem)):
+			n = count(m["content"])
+			if n > history_budget:
+				break
+			kept_history.insert(0, m)
+			history_budget -= n
+		kept_memory: List[Dict[str, Any]] = []
+		for d in long_mem[:6]:
+			n = count(d["payload"].get("text") or "")
+			if n > history_budget:
+				break
+			kept_memory.append(d)
+			history_budget -= n
+		used = llm_config.history_tokens - history_budget + count(query)
+		docs, report = self.budgeter.pack(context_docs, budget=max(0, llm_config.context_tokens - used))
+		report |= {"history_messages": len(kept_history), "memory_snippets": len(kept_memory), "history_tokens": used}
+		return kept_history, kept_memory, docs, report
 
 	def _format_context(self, docs: List[Dict[str, Any]]) -> str:
 		lines = []
@@ -22,6 +74,8 @@ class LLMService:
 		return "\n\n".join(lines)
 
 	def build_messages(self, query: str, short_mem: List[Dict[str, Any]], long_mem: List[Dict[str, Any]], context_docs: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+		if self.stable_prefix:
+			return self._build_stable_messages(query, short_mem, long_mem, context_docs)
 		messages: List[Dict[str, str]] = []
 		if short_mem:
 			for m in short_mem[-8:]:
@@ -34,7 +88,67 @@ class LLMService:
 		messages.append({"role": "user", "content": query})
 		return messages
 
+	def _build_stable_messages(self, query: str, short_mem: List[Dict[str, Any]], long_mem: List[Dict[str, Any]], context_docs: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+		"""Constant system prompt, then history, then everything that changes per turn in the last message.
+
+		The prompt prefix (system + earlier turns) then repeats across turns and
+		Ollama only evaluates the new tail instead of the whole prompt.
+		"""
+		messages: List[Dict[str, str]] = [{"role": "system", "content": SYSTEM_PROMPT}]
+		for m in self._history_window(short_mem):
+			messages.append({"role": m["role"], "content": m["content"]})
+		parts = []
+		if long_mem:
+			snippets = [f"[{d['payload'].get('role')}] {d['payload'].get('text')}" for d in long_mem[:6]]
+			parts.append("Relevant past memory:\n" + "\n".join(snippets))
+		if context_docs:
+			parts.append("Context:\n" + self._format_context(context_docs))
+		parts.append(f"Question: {query}")
+		messages.append({"role": "user", "content": "\n\n".join(parts)})
+		return messages
+
+	def _options(self) -> Dict[str, Any]:
+		options: Dict[str, Any] = {"temperature": self.temperature}
+		if self.stable_prefix:
+			# A fixed context size avoids reloading the model when prompt sizes vary
+			options["num_ctx"] = llm_config.num_ctx
+		return options
+
+	@staticmethod
+	def _metrics(chunk: Dict[str, Any]) -> Dict[str, Any]:
+		# Ollama's own timings, reported as spans so prompt eval and generation show separately
+		metrics.record("llm.prompt_eval", chunk.get("prompt_eval_duration", 0) / _NS, chunk.get("prompt_eval_count", 0))
+		metrics.record("llm.eval", chunk.get("eval_duration", 0) / _NS, chunk.get("eval_count", 0))
+		return {
+			"prompt_eval_count": chunk.get("prompt_eval_count", 0),
+			"prompt_eval_s": chunk.get("prompt_eval_duration", 0) / _NS,
+			"eval_count": chunk.get("eval_count", 0),
+			"eval_s": chunk.get("eval_duration", 0) / _NS,
+			"load_s": chunk.get("load_duration", 0) / _NS,
+			"total_s": chunk.get("total_duration", 0) / _NS,
+		}
+
 	def chat(self, messages: List[Dict[str, str]]) -> Iterable[str]:
-		stream = self.client.chat(model=self.model, messages=messages, options={"temperature": self.temperature}, stream=True)
-		for chunk in stream:
-			yield chunk.get("message", {}).get("content", "")
+		"""Stream response tokens; prompt-eval/eval counts and durations land in self.last_metrics."""
+		keep_alive = llm_config.keep_alive if self.stable_prefix else None
+		self.last_metrics = {}
+		with metrics.span("llm.chat"):
+			stream = self.client.chat(model=self.model, messages=messages, options=self._options(), stream=True, keep_alive=keep_alive)
+			for chunk in stream:
+				if chunk.get("done"):
+					self.last_metrics = self._metrics(chunk)
+				yield chunk.get("message", {}).get("content", "")
+
+	async def achat(self, messages: List[Dict[str, str]], stats: Dict[str, Any] | None = None) -> AsyncIterator[str]:
+		"""chat() on ollama.AsyncClient. Concurrent calls share this service, so token counts and durations go to the caller's `stats` dict."""
+		if self.async_client is None:
+			self.async_client = ollama.AsyncClient(host=llm_config.ollama_host)
+		keep_alive = llm_config.keep_alive if self.stable_prefix else None
+		with metrics.span("llm.chat"):
+			stream = await self.async_client.chat(model=self.model, messages=messages, options=self._options(), stream=True, keep_alive=keep_alive)
+			async for chunk in stream:
+				if chunk.get("done"):
+					done = self._metrics(chunk)
+					if stats is not None:
+						stats.update(done)
+				yield chunk.get("message", {}).get("content", "")
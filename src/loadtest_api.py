@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import threading
+import time
+from typing import List, Dict, Any
+import httpx
+import numpy as np
+import ollama
+
+QUERIES = [
+	"What was the closing price trend for NVIDIA?",
+	"How did Apple stock perform over the period?",
+	"Compare Tesla and Amazon trading volume.",
+	"What is the highest price reached by Microsoft?",
+	"Summarize JPMorgan's recent performance.",
+	"Which stock had the largest drawdown?",
+	"How volatile was Meta compared to Google?",
+	"What happened to Berkshire Hathaway shares?",
+]
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+	if not values:
+		return {}
+	p50, p95, p99 = np.percentile(values, [50, 95, 99])
+	return {"p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000}
+
+
+async def _seed(store, embedder, pattern: str, collection: str) -> int:
+	"""Chunk and upsert the fixture documents into the (in-memory) store the API reads from."""
+	from chunking import build_chunks_for_items
+	from sparse import SparseEncoder
+	from vectorstore import DOCUMENT_SCHEMA
+	chunks = build_chunks_for_items([{"path": p} for p in sorted(glob.glob(pattern))])
+	await store.ensure_collection(collection, embedder.dimension, sparse=True, payload_schema=DOCUMENT_SCHEMA)
+	sparse = SparseEncoder()
+	for i in range(0, len(chunks), 256):
+		batch = chunks[i:i + 256]
+		texts = [c["text"] for c in batch]
+		payloads = [c["metadata"] | {"text": c["text"]} for c in batch]
+		await store.upsert(collection, embedder.embed_texts(texts), payloads, sparse_vectors=sparse.encode_documents(texts))
+	return len(chunks)
+
+
+def _start_local(args) -> tuple:
+	"""API on an in-memory Qdrant and a fake Ollama, served by uvicorn in a background thread."""
+	import uvicorn
+	from api import QueryService, create_app
+	from fake_ollama import FakeOllama
+	from llm import LLMService
+	from registry import registry
+	from vectorstore import AsyncQdrantStore
+	from config import qdrant_config
+
+	fake = FakeOllama(token_rate=args.token_rate, answer_repeat=args.answer_repeat).start()
+	store = AsyncQdrantStore(url=":memory:")
+	n_chunks = asyncio.run(_seed(store, registry.embedder(), args.docs, qdrant_config.collection))
+	llm = LLMService(client=ollama.Client(host=fake.url), async_client=ollama.AsyncClient(host=fake.url))
+	service = QueryService(store=store, llm=llm)
+	server = uvicorn.Server(uvicorn.Config(create_app(service), host="127.0.0.1", port=args.port, log_level="warning"))
+	threading.Thread(target=server.run, daemon=True).start()
+	while not server.started:
+		time.sleep(0.05)
+	print(f"Seeded {n_chunks} chunks; API on http://127.0.0.1:{args.port}, fake Ollama on {fake.url}")
+	return f"http://127.0.0.1:{args.port}", server, fake
+
+
+async def _one(client: httpx.AsyncClient, endpoint: str, query: str, results: Dict[str, Any]) -> None:
+	body = {"query": query, "top_k": 20, "mmr_k": 8}
+	start = time.perf_counter()
+	try:
+		if endpoint == "answer":
+			async with client.stream("POST", "/answer", json=body | {"stream": True}) as resp:
+				first = None
+				async for line in resp.aiter_lines():
+					if first is None and line:
+						first = time.perf_counter() - start
+				status = resp.status_code
+			if first is not None and status == 200:
+				results["ttft"].append(first)
+		else:
+			status = (await client.post(f"/{endpoint}", json=body)).status_code
+	except httpx.HTTPError:
+		status = "error"
+	results["status"][str(status)] = results["status"].get(str(status), 0) + 1
+	if status == 200:
+		results["latency"].append(time.perf_counter() - start)
+
+
+async def _load(url: str, endpoint: str, concurrency: int, requests: int) -> Dict[str, Any]:
+	results: Dict[str, Any] = {"status": {}, "latency": [], "ttft": []}
+	queue: asyncio.Queue = asyncio.Queue()
+	for i in range(requests):
+		queue.put_nowait(QUERIES[i % len(QUERIES)])
+	limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+	async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+		async def worker():
+			while not queue.empty():
+				await _one(client, endpoint, queue.get_nowait(), results)
+		start = time.perf_counter()
+		await asyncio.gather(*(worker() for _ in range(concurrency)))
+		elapsed = time.perf_counter() - start
+		stats = (await client.get("/stats")).json()
+	return {
+		"endpoint": endpoint,
+		"concurrency": concurrency,
+		"requests": requests,
+		"elapsed_s": elapsed,
+		"qps": len(results["latency"]) / elapsed if elapsed else 0.0,
+		"status": results["status"],
+		"latency": _percentiles(results["latency"]),
+		"ttft": _percentiles(results["ttft"]),
+		"server": stats,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Load-test the query API (by default against an in-memory Qdrant and a fake Ollama)")
+	parser.add_argument("--url", help="Existing API to hit; omit to start a local one with stand-ins")
+	parser.add_argument("--endpoint", choices=["retrieve", "answer"], default="answer")
+	parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+	parser.add_argument("--requests", type=int, default=200)
+	parser.add_argument("--docs", default=os.path.join(os.path.dirname(__file__), "..", "docs", "*.pdf"), help="Glob of fixture documents to seed")
+	parser.add_argument("--port", type=int, default=8765)
+	parser.add_argument("--token-rate", type=float, default=200.0, help="Fake Ollama tokens per second")
+	parser.add_argument("--answer-repeat", type=int, default=4, help="Length of the fake answer in repeats of the canned reply")
+	args = parser.parse_args()
+
+	url, server, fake = args.url, None, None
+	if url is None:
+		url, server, fake = _start_local(args)
+	try:
+		for concurrency in args.concurrency:
+			print(json.dumps(asyncio.run(_load(url, args.endpoint, concurrency, args.requests)), indent=2))
+	finally:
+		if server is not None:
+			server.should_exit = True
+			fake.stop()
+
+
+if __name__ == "__main__":
+	main()
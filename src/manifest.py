@@ -0,0 +1,120 @@
+from __future__ import annotations
+from typing import List, Dict, Any, Iterable, Optional, Set
+import hashlib
+import json
+import os
+
+from vectorstore import point_id
+from config import app_config
+
+class IngestManifest:
+	"""Local record of ingested files (mtime, size, sha256 and point ids) per collection.
+
+	Lets re-ingestion skip unchanged files, embed only the chunks of changed files
+	whose content-addressed ids are new, and delete points that no longer exist.
+	"""
+
+	def __init__(self, path: str):
+		self.path = path
+		self.files: Dict[str, Dict[str, Any]] = {}
+		self._new_ids: Dict[str, List[str]] = {}
+		# Entries as they were before changed_items() re-stamped them, for files that end up skipped
+		self._previous: Dict[str, Optional[Dict[str, Any]]] = {}
+		if os.path.exists(path):
+			with open(path, "r", encoding="utf-8") as f:
+				self.files = json.load(f).get("files", {})
+
+	@classmethod
+	def for_collection(cls, collection: str) -> "IngestManifest":
+		return cls(os.path.join(app_config.manifest_dir, f"{collection}.json"))
+
+	@staticmethod
+	def _key(path: str) -> str:
+		return os.path.abspath(path)
+
+	@staticmethod
+	def _sha256(path: str) -> str:
+		h = hashlib.sha256()
+		with open(path, "rb") as f:
+			for block in iter(lambda: f.read(1 << 20), b""):
+				h.update(block)
+		return h.hexdigest()
+
+	def changed_items(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+		"""Filter loader items down to new or modified files.
+
+		mtime+size is checked first; the file is only hashed when those differ, and
+		a touched-but-identical file is just re-stamped.
+		"""
+		changed = []
+		for item in items:
+			key = self._key(item["path"])
+			st = os.stat(item["path"])
+			entry = self.files.get(key)
+			if entry and entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+				continue
+			sha = self._sha256(item["path"])
+			if entry and entry["sha256"] == sha:
+				entry.update(mtime=st.st_mtime, size=st.st_size)
+				continue
+			self._previous[key] = entry
+			self.files[key] = {"mtime": st.st_mtime, "size": st.st_size, "sha256": sha, "point_ids": entry["point_ids"] if entry else []}
+			self._new_ids[key] = []
+			changed.append(item)
+		return changed
+
+	def skipped(self, item: Dict[str, Any]) -> None:
+		"""Forget a changed file that failed to parse, so its old points are kept and the next run retries it."""
+		key = self._key(item["path"])
+		if key not in self._previous:
+			return
+		self._new_ids.pop(key, None)
+		previous = self._previous.pop(key)
+		if previous is None:
+			self.files.pop(key, None)
+		else:
+			self.files[key] = previous
+
+	def removed_paths(self, items: List[Dict[str, Any]], root: str) -> List[str]:
+		"""Manifest entries under root that no longer exist in the listing."""
+		root_key = self._key(root).rstrip(os.sep) + os.sep
+		present = {self._key(it["path"]) for it in items}
+		return [k for k in self.files if k.startswith(root_key) and k not in present]
+
+	def filter_new_chunks(self, chunk_iter: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+		"""Yield only chunks whose point id is not already stored for their file, recording all ids seen."""
+		known: Dict[str, Set[str]] = {}
+		for chunk in chunk_iter:
+			meta = chunk["metadata"]
+			key = self._key(meta["source"])
+			pid = point_id(meta["source"], meta["chunk_index"], chunk["text"])
+			self._new_ids.setdefault(key, []).append(pid)
+			if key not in known:
+				known[key] = set(self.files.get(key, {}).get("point_ids", []))
+			if pid not in known[key]:
+				yield chunk
+
+	def stale_ids(self, removed: List[str]) -> List[str]:
+		"""Ids to delete: every point of removed files plus ids that changed files no longer produce."""
+		stale: List[str] = []
+		for key in removed:
+			stale.extend(self.files.get(key, {}).get("point_ids", []))
+		for key, ids in self._new_ids.items():
+			current = set(ids)
+			stale.extend(pid for pid in self.files.get(key, {}).get("point_ids", []) if pid not in current)
+		return stale
+
+	def commit(self, removed: List[str]) -> None:
+		"""Apply recorded ids, drop removed files and persist the manifest."""
+		for key, ids in self._new_ids.items():
+			if key in self.files:
+				self.files[key]["point_ids"] = ids
+		for key in removed:
+			self.files.pop(key, None)
+		self._new_ids = {}
+		self._previous = {}
+		os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+		tmp = self.path + ".tmp"
+		with open(tmp, "w", encoding="utf-8") as f:
+			json.dump({"files": self.files}, f)
+		os.replace(tmp, self.path)
@@ -1,11 +1,26 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass, field
+from uuid import uuid5
+import atexit
+import queue
+import re
+import threading
 import time
+import numpy as np
+import ollama
 
 from embeddings import EmbeddingService
-from vectorstore import QdrantStore
-from config import qdrant_config
+from vectorstore import VectorStore, MEMORY_SCHEMA, POINT_ID_NAMESPACE
+from registry import registry
+from metrics import metrics
+from config import qdrant_config, memory_config, llm_config
+
+SUMMARY_PROMPT = (
+	"Summarize these earlier turns of a conversation in a few sentences. "
+	"Keep facts, figures, names and decisions the user may refer back to; drop pleasantries."
+)
+_DAY_S = 86400.0
 
 @dataclass
 class ChatMessage:
@@ -27,18 +42,228 @@ class ShortTermMemory:
 		return [m.__dict__ for m in self.messages]
 
 class LongTermMemory:
-	def __init__(self, store: QdrantStore | None = None, embedder: EmbeddingService | None = None):
-		self.store = store or QdrantStore()
-		self.embedder = embedder or EmbeddingService()
-		self.store.ensure_collection(qdrant_config.memory_collection, vector_size=self.embedder.model.get_sentence_embedding_dimension())
+	"""Per-session conversation memory in the vector store.
+
+	add() only queues a turn; a background writer embeds and upserts queued
+	turns in batches, skipping near-duplicates of what the session already
+	holds. recall() discounts older points by age (MEMORY_HALF_LIFE_DAYS).
+	compact(), also run every MEMORY_COMPACT_INTERVAL_S, folds each session's
+	older turns into summary points and caps the session at
+	MEMORY_MAX_PER_SESSION points, so recall cost stays bounded per session.
+	"""
+
+	def __init__(self, store: VectorStore | None = None, embedder: EmbeddingService | None = None, llm_client: ollama.Client | None = None, write_behind: bool | None = None, compact_interval_s: float | None = None):
+		self.store = store or registry.store()
+		self.embedder = embedder or registry.embedder()
+		self.collection = qdrant_config.memory_collection
+		self.store.ensure_collection(self.collection, vector_size=self.embedder.model.get_sentence_embedding_dimension(), payload_schema=MEMORY_SCHEMA)
+		self._llm_client = llm_client
+		self.write_behind = memory_config.write_behind if write_behind is None else write_behind
+		self.written = 0
+		self.duplicates = 0
+		self.errors = 0
+		self.summaries = 0
+		self.summarized_turns = 0
+		self.expired = 0
+		self.last_compaction: Dict[str, Any] = {}
+		self._queue: queue.Queue = queue.Queue(maxsize=memory_config.queue_size)
+		self._compact_lock = threading.Lock()
+		if self.write_behind:
+			threading.Thread(target=self._writer, name="memory-writer", daemon=True).start()
+			atexit.register(self.flush)
+		compact_interval_s = memory_config.compact_interval_s if compact_interval_s is None else compact_interval_s
+		if compact_interval_s > 0:
+			threading.Thread(target=self._compactor, args=(compact_interval_s,), name="memory-compactor", daemon=True).start()
 
 	def add(self, session_id: str, role: str, content: str) -> None:
-		text = f"[{role}] {content}"
-		vec = self.embedder.embed_text(text)
-		payload = {"session_id": session_id, "role": role, "text": content}
-		self.store.upsert(qdrant_config.memory_collection, [vec], [payload])
+		"""Remember a turn. With write-behind it becomes recallable after the next batch write (within MEMORY_LINGER_S)."""
+		if not content.strip():
+			return
+		payload = {"session_id": session_id, "role": role, "text": content, "kind": "turn", "created_at": time.time()}
+		if self.write_behind:
+			try:
+				self._queue.put_nowait(payload)
+				return
+			except queue.Full:
+				# Backpressure: write on the caller's thread rather than lose the turn
+				pass
+		self._write([payload])
+
+	def flush(self) -> None:
+		"""Block until every queued turn is written."""
+		if self.write_behind:
+			self._queue.join()
+
+	def _writer(self) -> None:
+		while True:
+			batch = [self._queue.get()]
+			deadline = time.monotonic() + memory_config.linger_s
+			while len(batch) < memory_config.batch_size:
+				try:
+					batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+				except queue.Empty:
+					break
+			try:
+				self._write(batch)
+			except Exception as e:
+				self.errors += 1
+				print(f"Warning: could not write {len(batch)} memory turns: {e}")
+			finally:
+				for _ in batch:
+					self._queue.task_done()
+
+	def _write(self, payloads: List[Dict[str, Any]]) -> None:
+		with metrics.span("memory.write", items=len(payloads)):
+			vectors = np.asarray(self.embedder.embed_texts([f"[{p['role']}] {p['text']}" for p in payloads]), dtype=np.float32)
+			keep = self._novel(payloads, vectors)
+			if keep:
+				self.store.upsert(self.collection, vectors[keep].tolist(), [payloads[i] for i in keep], ids=[_memory_id(payloads[i]) for i in keep])
+		self.written += len(keep)
+		self.duplicates += len(payloads) - len(keep)
+		metrics.inc("memory.turns", len(keep), status="written")
+		metrics.inc("memory.turns", len(payloads) - len(keep), status="duplicate")
+
+	def _novel(self, payloads: List[Dict[str, Any]], vectors: np.ndarray) -> List[int]:
+		"""Indexes of turns that are not near-duplicates of a stored turn of their session, or of an earlier turn in the batch."""
+		threshold = memory_config.dedup_threshold
+		if threshold <= 0:
+			return list(range(len(payloads)))
+		unit = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+		keep: List[int] = []
+		for i, payload in enumerate(payloads):
+			if any(payloads[j]["session_id"] == payload["session_id"] and float(unit[i] @ unit[j]) >= threshold for j in keep):
+				continue
+			hits = self.store.query(self.collection, vectors[i].tolist(), top_k=1, filter_=self.store.build_filter("session_id", payload["session_id"]))
+			if hits and hits[0]["score"] >= threshold:
+				continue
+			keep.append(i)
+		return keep
 
 	def recall(self, session_id: str, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+		"""The session's best matches for `query`, similarity discounted by age ("similarity" keeps the raw score)."""
 		vec = self.embedder.embed_text(query)
+		half_life = memory_config.half_life_days
+		# Decay can promote older-but-relevant points past newer ones, so rank a wider candidate set
+		limit = top_k * max(1, memory_config.recall_oversample) if half_life > 0 else top_k
 		filter_ = self.store.build_filter("session_id", session_id)
-		return self.store.query(qdrant_config.memory_collection, vec, top_k=top_k, filter_=filter_)
+		hits = self.store.query(self.collection, vec, top_k=limit, filter_=filter_)
+		if half_life > 0:
+			now = time.time()
+			for h in hits:
+				age_days = max(0.0, now - (h["payload"] or {}).get("created_at", now)) / _DAY_S
+				h["similarity"] = h["score"]
+				if h["score"] > 0:
+					h["score"] *= 0.5 ** (age_days / half_life)
+			hits.sort(key=lambda h: h["score"], reverse=True)
+		return hits[:top_k]
+
+	def sessions(self) -> List[str]:
+		return sorted({p["payload"].get("session_id") for p in self.store.scroll(self.collection)} - {None})
+
+	def compact(self, session_id: str | None = None) -> Dict[str, Any]:
+		"""Summarize each session's turns beyond the newest MEMORY_KEEP_RECENT and drop points beyond MEMORY_MAX_PER_SESSION."""
+		self.flush()
+		totals = {"sessions": 0, "summarized_turns": 0, "summaries": 0, "expired": 0}
+		with self._compact_lock, metrics.span("memory.compact") as span:
+			for sid in ([session_id] if session_id else self.sessions()):
+				summarized, summaries, expired = self._compact_session(sid)
+				totals["sessions"] += 1
+				totals["summarized_turns"] += summarized
+				totals["summaries"] += summaries
+				totals["expired"] += expired
+		self.summarized_turns += totals["summarized_turns"]
+		self.summaries += totals["summaries"]
+		self.expired += totals["expired"]
+		self.last_compaction = totals | {"at": time.time(), "seconds": span.seconds}
+		return totals
+
+	def _points(self, session_id: str) -> List[Dict[str, Any]]:
+		points = self.store.scroll(self.collection, self.store.build_filter("session_id", session_id))
+		return sorted(points, key=lambda p: p["payload"].get("created_at", 0.0))
+
+	def _compact_session(self, session_id: str) -> Tuple[int, int, int]:
+		points = self._points(session_id)
+		turns = [p for p in points if p["payload"].get("kind", "turn") == "turn"]
+		group = max(2, memory_config.group_size)
+		old = turns[:max(0, len(turns) - memory_config.keep_recent)]
+		# Whole groups only; the remainder waits for the next run
+		old = old[:len(old) - len(old) % group]
+		summaries = []
+		for start in range(0, len(old), group):
+			chunk = [p["payload"] for p in old[start:start + group]]
+			summaries.append({
+				"session_id": session_id,
+				"role": "summary",
+				"kind": "summary",
+				"text": self._summarize(chunk),
+				"turns": len(chunk),
+				"period_start": chunk[0].get("created_at", 0.0),
+				# Dated like its newest turn, so recall decay treats it like the turns it replaces
+				"created_at": chunk[-1].get("created_at", 0.0),
+			})
+		if summaries:
+			vectors = self.embedder.embed_texts([f"[summary] {s['text']}" for s in summaries])
+			# Summaries are stored before the turns they replace are deleted
+			self.store.upsert(self.collection, vectors, summaries, ids=[_memory_id(s) for s in summaries])
+			self.store.delete(self.collection, [p["id"] for p in old])
+		expired: List[Any] = []
+		if summaries:
+			points = self._points(session_id)
+		# Retention: the oldest points (summaries are dated by their newest turn) go first
+		if len(points) > memory_config.max_per_session:
+			expired = [p["id"] for p in points[:len(points) - memory_config.max_per_session]]
+			self.store.delete(self.collection, expired)
+		return len(old), len(summaries), len(expired)
+
+	def _summarize(self, turns: List[Dict[str, Any]]) -> str:
+		transcript = "\n".join(f"[{t.get('role')}] {t.get('text', '')}" for t in turns)
+		try:
+			client = self._llm_client or registry.llm_client()
+			response = client.chat(
+				model=memory_config.summary_model or llm_config.model,
+				messages=[{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": transcript}],
+				options={"temperature": 0.0, "num_predict": 256},
+			)
+			summary = response["message"]["content"].strip()
+			if summary:
+				return summary
+		except Exception as e:
+			print(f"Warning: LLM memory summary failed, keeping an extractive one: {e}")
+		return _extractive_summary(turns)
+
+	def _compactor(self, interval_s: float) -> None:
+		while True:
+			time.sleep(interval_s)
+			try:
+				self.compact()
+			except Exception as e:
+				self.errors += 1
+				print(f"Warning: memory compaction failed: {e}")
+
+	def stats(self) -> Dict[str, Any]:
+		return {
+			"queued": self._queue.qsize(),
+			"written": self.written,
+			"duplicates": self.duplicates,
+			"summaries": self.summaries,
+			"summarized_turns": self.summarized_turns,
+			"expired": self.expired,
+			"errors": self.errors,
+			"last_compaction": self.last_compaction,
+		}
+
+
+def _memory_id(payload: Dict[str, Any]) -> str:
+	"""Deterministic id, so re-adding the same turn overwrites it instead of adding a copy."""
+	key = "\x00".join(str(payload.get(k, "")) for k in ("session_id", "kind", "role", "period_start", "text"))
+	return str(uuid5(POINT_ID_NAMESPACE, key))
+
+
+def _extractive_summary(turns: List[Dict[str, Any]], max_chars: int = 200) -> str:
+	"""Fallback summary: the first sentence of each turn."""
+	parts = []
+	for t in turns:
+		text = " ".join(str(t.get("text", "")).split())
+		first = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0][:max_chars]
+		parts.append(f"{t.get('role')}: {first}")
+	return " | ".join(parts)
@@ -0,0 +1,235 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from contextvars import ContextVar
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+from config import app_config
+
+# Prometheus-style latency buckets (seconds)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_PREFIX = "rag"
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+
+class _Histogram:
+	__slots__ = ("counts", "sum", "count", "items")
+
+	def __init__(self):
+		self.counts = [0] * (len(BUCKETS) + 1)
+		self.sum = 0.0
+		self.count = 0
+		self.items = 0.0
+
+
+class Trace:
+	"""Spans recorded in one context (e.g. one chat query), in completion order."""
+
+	def __init__(self):
+		self.start = time.perf_counter()
+		self.depth = 0
+		self.spans: List[Dict[str, Any]] = []
+		self._token = _current_trace.set(self)
+
+	def finish(self) -> None:
+		"""Stop collecting spans in this context."""
+		if self._token is not None:
+			_current_trace.reset(self._token)
+			self._token = None
+
+	def breakdown(self) -> List[Dict[str, Any]]:
+		"""Spans ordered by start time, with nesting depth, for display."""
+		return sorted(self.spans, key=lambda s: s["start_ms"])
+
+
+class Span:
+	"""Times a block. Duration is always available as .seconds; it is only recorded when metrics are enabled."""
+
+	__slots__ = ("metrics", "name", "items", "start", "seconds", "_trace")
+
+	def __init__(self, metrics: "Metrics", name: str, items: Optional[float] = None):
+		self.metrics = metrics
+		self.name = name
+		self.items = items
+		self.seconds = 0.0
+		self._trace = None
+
+	def __enter__(self) -> "Span":
+		if self.metrics.enabled:
+			self._trace = _current_trace.get()
+			if self._trace is not None:
+				self._trace.depth += 1
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc) -> None:
+		self.seconds = time.perf_counter() - self.start
+		if self.metrics.enabled:
+			self.metrics.record(self.name, self.seconds, self.items)
+			if self._trace is not None:
+				self._trace.depth -= 1
+				self._trace.spans.append({
+					"span": self.name,
+					"start_ms": (self.start - self._trace.start) * 1000,
+					"duration_ms": self.seconds * 1000,
+					"depth": self._trace.depth,
+				})
+
+
+class Metrics:
+	"""In-process counters and span-duration histograms with Prometheus text export.
+
+	When disabled, span() still times the block for callers that read .seconds,
+	but nothing is recorded and traced() wrappers call straight through.
+	"""
+
+	def __init__(self, enabled: bool = True):
+		self.enabled = enabled
+		self._lock = threading.Lock()
+		self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+		self._spans: Dict[str, _Histogram] = {}
+
+	def span(self, name: str, items: Optional[float] = None) -> Span:
+		return Span(self, name, items)
+
+	def record(self, name: str, seconds: float, items: Optional[float] = None) -> None:
+		"""Add one observation to the span histogram `name` (e.g. a duration reported by Ollama)."""
+		if not self.enabled:
+			return
+		with self._lock:
+			h = self._spans.get(name)
+			if h is None:
+				h = self._spans[name] = _Histogram()
+			h.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+			h.sum += seconds
+			h.count += 1
+			if items:
+				h.items += items
+
+	def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+		if not self.enabled:
+			return
+		key = (name, tuple(sorted(labels.items())))
+		with self._lock:
+			self._counters[key] = self._counters.get(key, 0.0) + value
+
+	def start_trace(self) -> Trace:
+		"""Collect spans recorded in this thread/task into a Trace until trace.finish()."""
+		return Trace()
+
+	def trace(self) -> "_TraceContext":
+		"""Context-manager form of start_trace()."""
+		return _TraceContext()
+
+	def traced(self, name: str) -> Callable:
+		"""Decorator recording each call of a sync or async function as span `name`."""
+		def decorate(fn: Callable) -> Callable:
+			if inspect.iscoroutinefunction(fn):
+				@functools.wraps(fn)
+				async def async_wrapper(*args, **kwargs):
+					if not self.enabled:
+						return await fn(*args, **kwargs)
+					with Span(self, name):
+						return await fn(*args, **kwargs)
+				return async_wrapper
+
+			@functools.wraps(fn)
+			def wrapper(*args, **kwargs):
+				if not self.enabled:
+					return fn(*args, **kwargs)
+				with Span(self, name):
+					return fn(*args, **kwargs)
+			return wrapper
+		return decorate
+
+	def stage_report(self, prefix: str) -> Dict[str, Dict[str, float]]:
+		"""Per-span totals for spans starting with `prefix`: calls, items, busy seconds and items/s."""
+		with self._lock:
+			spans = {n: h for n, h in self._spans.items() if n.startswith(prefix)}
+			return {
+				n[len(prefix):]: {
+					"calls": h.count,
+					"items": h.items,
+					"busy_s": h.sum,
+					"items_per_s": h.items / h.sum if h.sum else 0.0,
+				}
+				for n, h in sorted(spans.items())
+			}
+
+	def snapshot(self) -> Dict[str, Any]:
+		with self._lock:
+			return {
+				"spans": {n: {"count": h.count, "sum_s": h.sum, "mean_ms": h.sum * 1000 / h.count if h.count else 0.0, "items": h.items} for n, h in sorted(self._spans.items())},
+				"counters": {n + (str(dict(l)) if l else ""): v for (n, l), v in sorted(self._counters.items())},
+			}
+
+	def reset(self) -> None:
+		with self._lock:
+			self._counters.clear()
+			self._spans.clear()
+
+	def render_prometheus(self) -> str:
+		lines: List[str] = []
+		with self._lock:
+			if self._spans:
+				lines += [f"# HELP {_PREFIX}_span_seconds Duration of instrumented stages.", f"# TYPE {_PREFIX}_span_seconds histogram"]
+				for name, h in sorted(self._spans.items()):
+					cumulative = 0
+					for bound, n in zip(BUCKETS + (float("inf"),), h.counts):
+						cumulative += n
+						le = "+Inf" if bound == float("inf") else repr(bound)
+						lines.append(f'{_PREFIX}_span_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+					lines.append(f'{_PREFIX}_span_seconds_sum{{span="{name}"}} {h.sum}')
+					lines.append(f'{_PREFIX}_span_seconds_count{{span="{name}"}} {h.count}')
+				lines += [f"# HELP {_PREFIX}_span_items_total Items (texts, points, tokens) processed by instrumented stages.", f"# TYPE {_PREFIX}_span_items_total counter"]
+				for name, h in sorted(self._spans.items()):
+					lines.append(f'{_PREFIX}_span_items_total{{span="{name}"}} {h.items}')
+			for name in sorted({n for n, _ in self._counters}):
+				metric = f"{_PREFIX}_{name.replace('.', '_').replace('-', '_')}_total"
+				lines.append(f"# TYPE {metric} counter")
+				for (n, labels), v in sorted(self._counters.items()):
+					if n == name:
+						label_str = ",".join(f'{k}="{val}"' for k, val in labels)
+						lines.append(f"{metric}{{{label_str}}} {v}" if label_str else f"{metric} {v}")
+		return "\n".join(lines) + "\n"
+
+	def serve(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+		"""Expose /metrics on a background thread (for processes without their own HTTP server)."""
+		metrics = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def log_message(self, *args) -> None:
+				pass
+
+			def do_GET(self) -> None:
+				if not self.path.startswith("/metrics"):
+					self.send_error(404)
+					return
+				body = metrics.render_prometheus().encode("utf-8")
+				self.send_response(200)
+				self.send_header("Content-Type", "text/plain; version=0.0.4")
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+		server = ThreadingHTTPServer((host, port), Handler)
+		server.daemon_threads = True
+		threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+		return server
+
+
+class _TraceContext:
+	def __enter__(self) -> Trace:
+		self.trace = Trace()
+		return self.trace
+
+	def __exit__(self, *exc) -> None:
+		self.trace.finish()
+
+
+metrics = Metrics(enabled=app_config.metrics_enabled)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+from typing import List, Dict, Any, Tuple
+import inspect
+import json
+import os
+import shutil
+import threading
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+from config import app_config
+
+_export_lock = threading.Lock()
+
+
+def model_dir(model_name: str, kind: str) -> str:
+	return os.path.join(app_config.onnx_dir, model_name.replace("/", "__"), kind)
+
+
+def _export(model_name: str, kind: str, path: str) -> None:
+	"""Export the torch model once (needs torch); the tokenizer and pooling metadata are saved next to it."""
+	import torch
+
+	if kind == "embed":
+		from sentence_transformers import SentenceTransformer
+		st = SentenceTransformer(model_name, device="cpu")
+		model, tokenizer = st[0].auto_model, st[0].tokenizer
+		pooling = st[1].get_config_dict() if len(st) > 1 else {}
+		meta = {
+			"pooling": "cls" if pooling.get("pooling_mode_cls_token") else "mean",
+			"dimension": st.get_sentence_embedding_dimension(),
+			"max_length": st.max_seq_length,
+		}
+	else:
+		from transformers import AutoModelForSequenceClassification
+		model = AutoModelForSequenceClassification.from_pretrained(model_name)
+		tokenizer = AutoTokenizer.from_pretrained(model_name)
+		meta = {"num_labels": model.config.num_labels}
+	model.eval()
+	sample = tokenizer(["query"], ["passage"] if kind == "rerank" else None, return_tensors="pt")
+	input_names = list(sample.keys())
+
+	class _Outputs(torch.nn.Module):
+		def __init__(self, inner):
+			super().__init__()
+			self.inner = inner
+
+		def forward(self, *args):
+			# last_hidden_state for encoders, logits for classifiers
+			return self.inner(**dict(zip(input_names, args)))[0]
+
+	dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+	dynamic_axes["output"] = {0: "batch", 1: "sequence"} if kind == "embed" else {0: "batch"}
+	# Newer torch defaults to the dynamo exporter (extra onnxscript dependency); keep the TorchScript one
+	legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+	with torch.no_grad():
+		torch.onnx.export(_Outputs(model), tuple(sample[n] for n in input_names), path, input_names=input_names, output_names=["output"], dynamic_axes=dynamic_axes, opset_version=14, **legacy)
+	tokenizer.save_pretrained(os.path.dirname(path))
+	with open(os.path.join(os.path.dirname(path), "meta.json"), "w", encoding="utf-8") as f:
+		json.dump(meta, f)
+
+
+def _complete(directory: str) -> bool:
+	# meta.json is written last, so only a finished export has it
+	return os.path.exists(os.path.join(directory, "meta.json"))
+
+
+def _publish(staging: str, directory: str) -> None:
+	"""Move a finished export into place in one rename; if another process got there first, keep theirs."""
+	if os.path.isdir(directory) and not _complete(directory):
+		# Left behind by an interrupted export
+		shutil.rmtree(directory, ignore_errors=True)
+	try:
+		os.rename(staging, directory)
+	except OSError:
+		if not _complete(directory):
+			raise
+		shutil.rmtree(staging, ignore_errors=True)
+
+
+def ensure_model(model_name: str, kind: str, quantize: bool) -> Tuple[str, Dict[str, Any]]:
+	"""Path to the ONNX model (exported, and int8-quantized if asked, on first use) and its metadata.
+
+	Exports are staged in a per-process directory and renamed into place whole,
+	so other processes never see a model without its tokenizer and meta.json.
+	"""
+	directory = model_dir(model_name, kind)
+	fp32 = os.path.join(directory, "model.onnx")
+	int8 = os.path.join(directory, "model.int8.onnx")
+	with _export_lock:
+		if not _complete(directory):
+			print(f"Exporting {model_name} to ONNX ({directory})...")
+			staging = f"{directory}.{os.getpid()}.tmp"
+			shutil.rmtree(staging, ignore_errors=True)
+			os.makedirs(staging)
+			try:
+				_export(model_name, kind, os.path.join(staging, "model.onnx"))
+				_publish(staging, directory)
+			finally:
+				shutil.rmtree(staging, ignore_errors=True)
+		if quantize and not os.path.exists(int8):
+			from onnxruntime.quantization import quantize_dynamic, QuantType
+			tmp = f"{int8}.{os.getpid()}.tmp"
+			# Dynamic quantization: int8 weights, activations quantized per batch at run time
+			quantize_dynamic(fp32, tmp, weight_type=QuantType.QInt8)
+			os.replace(tmp, int8)
+	with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+		meta = json.load(f)
+	return (int8 if quantize else fp32), meta
+
+
+def _session(path: str, intra_op_threads: int, inter_op_threads: int) -> ort.InferenceSession:
+	options = ort.SessionOptions()
+	options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+	# 0 leaves the choice to onnxruntime (one thread per physical core)
+	options.intra_op_num_threads = intra_op_threads
+	options.inter_op_num_threads = inter_op_threads
+	return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class OnnxSentenceEncoder:
+	"""SentenceTransformer.encode() on onnxruntime: same tokenizer, pooling and normalization."""
+
+	def __init__(self, model_name: str, quantize: bool = False, intra_op_threads: int = 0, inter_op_threads: int = 0):
+		path, meta = ensure_model(model_name, "embed", quantize)
+		self.path = path
+		self.session = _session(path, intra_op_threads, inter_op_threads)
+		self.input_names = [i.name for i in self.session.get_inputs()]
+		self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(path))
+		self.pooling = meta["pooling"]
+		self.dimension = meta["dimension"]
+		self.max_seq_length = meta["max_length"]
+
+	def get_sentence_embedding_dimension(self) -> int:
+		return self.dimension
+
+	def encode(self, texts: List[str], batch_size: int = 64, convert_to_numpy: bool = True, normalize_embeddings: bool = False, **_: Any) -> np.ndarray:
+		out = np.empty((len(texts), self.dimension), dtype=np.float32)
+		# Longest first, so each batch pads to similar lengths
+		order = np.argsort([-len(t) for t in texts], kind="stable")
+		for start in range(0, len(texts), batch_size):
+			idx = order[start:start + batch_size]
+			enc = self.tokenizer([texts[i] for i in idx], padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np")
+			hidden = self.session.run(None, {name: enc[name].astype(np.int64) for name in self.input_names})[0]
+			if self.pooling == "cls":
+				pooled = hidden[:, 0]
+			else:
+				mask = enc["attention_mask"][..., None].astype(np.float32)
+				pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+			out[idx] = pooled
+		if normalize_embeddings:
+			out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+		return out
+
+
+class OnnxCrossEncoder:
+	"""CrossEncoder.predict() on onnxruntime, with the same truncation and sigmoid for single-logit models."""
+
+	def __init__(self, model_name: str, max_length: int, quantize: bool = False, intra_op_threads: int = 0, inter_op_threads: int = 0):
+		path, meta = ensure_model(model_name, "rerank", quantize)
+		self.path = path
+		self.session = _session(path, intra_op_threads, inter_op_threads)
+		self.input_names = [i.name for i in self.session.get_inputs()]
+		self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(path))
+		self.max_length = max_length
+		self.num_labels = meta["num_labels"]
+
+	def predict(self, pairs: List[Tuple[str, str]], batch_size: int = 32, **_: Any) -> np.ndarray:
+		scores: List[np.ndarray] = []
+		for start in range(0, len(pairs), batch_size):
+			batch = pairs[start:start + batch_size]
+			enc = self.tokenizer([q for q, _ in batch], [p for _, p in batch], padding=True, truncation="longest_first", max_length=self.max_length, return_tensors="np")
+			logits = self.session.run(None, {name: enc[name].astype(np.int64) for name in self.input_names})[0]
+			scores.append(1 / (1 + np.exp(-logits[:, 0])) if self.num_labels == 1 else logits)
+		return np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
@@ -0,0 +1,85 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict
+import threading
+import time
+import ollama
+
+from embeddings import BatchedEmbeddingService
+from reranker import BatchedReranker
+from vectorstore import VectorStore, make_store, init_default_collections
+from answer_cache import SemanticAnswerCache
+from docstore import DocStore
+from sparse import TermStats
+from config import llm_config, app_config
+
+class ResourceRegistry:
+	"""Process-wide cache of heavy resources (models and clients).
+
+	Streamlit re-executes app.py on every interaction, but imported modules stay
+	in sys.modules, so anything held here is loaded once per process and shared
+	across reruns and sessions.
+	"""
+
+	def __init__(self):
+		self._resources: Dict[str, Any] = {}
+		self._load_times: Dict[str, float] = {}
+		self._lock = threading.RLock()
+
+	def get(self, name: str, factory: Callable[[], Any]) -> Any:
+		resource = self._resources.get(name)
+		if resource is not None:
+			return resource
+		with self._lock:
+			if name not in self._resources:
+				start = time.perf_counter()
+				self._resources[name] = factory()
+				self._load_times[name] = time.perf_counter() - start
+			return self._resources[name]
+
+	def set(self, name: str, resource: Any) -> None:
+		"""Register an already-built resource (e.g. a stub in benchmarks)."""
+		with self._lock:
+			self._resources[name] = resource
+			self._load_times[name] = 0.0
+
+	def load_times(self) -> Dict[str, float]:
+		return dict(self._load_times)
+
+	def embedder(self) -> BatchedEmbeddingService:
+		return self.get("embedder", BatchedEmbeddingService)
+
+	def reranker(self) -> BatchedReranker:
+		return self.get("reranker", BatchedReranker)
+
+	def store(self) -> VectorStore:
+		return self.get("store", make_store)
+
+	def docstore(self) -> DocStore | None:
+		"""Out-of-band chunk text store, or None when text stays in the vector payload (TEXT_STORE=payload)."""
+		if app_config.text_store != "local":
+			return None
+		return self.get("docstore", DocStore)
+
+	def term_stats(self) -> TermStats:
+		return self.get("term_stats", TermStats)
+
+	def llm_client(self) -> ollama.Client:
+		return self.get("llm_client", lambda: ollama.Client(host=llm_config.ollama_host))
+
+	def answer_cache(self) -> SemanticAnswerCache:
+		return self.get("answer_cache", lambda: SemanticAnswerCache(self.store(), self.embedder().dimension))
+
+	def warm_up(self) -> Dict[str, float]:
+		"""Load every shared resource and create default collections. Idempotent."""
+		self.embedder()
+		self.reranker()
+		self.llm_client()
+		store = self.store()
+		self.docstore()
+		self.get("default_collections", lambda: init_default_collections(store) or True)
+		if app_config.answer_cache_enabled:
+			self.answer_cache()
+		return self.load_times()
+
+
+registry = ResourceRegistry()
@@ -1,16 +1,140 @@
 from __future__ import annotations
-from typing import List, Dict
+from typing import List, Dict, Any, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import threading
+import time
 from sentence_transformers import CrossEncoder
-from config import reranker_config
+from embeddings import set_torch_threads
+from batching import MicroBatcher
+from metrics import metrics
+from config import reranker_config, app_config
+
+def _digest(text: str) -> str:
+	return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
 
 class Reranker:
-	def __init__(self, model_name: str | None = None):
-		self.model_name = model_name or reranker_config.model_name
-		self.model = CrossEncoder(self.model_name)
+	def __init__(self, model_name: str | None = None, batch_size: int | None = None, top_n: int | None = None, max_tokens: int | None = None, cache_size: int | None = None, backend: str | None = None, int8: bool | None = None):
+		self.model_name = model_name or reranker_config.mdel_name
+		self.batch_size = batch_size or reranker_config.batch_size
+		self.top_n = reranker_config.top_n if top_n is None else top_n
+		max_tokens = max_tokens or reranker_config.max_tokens
+		self.backend = backend or reranker_config.backend
+		# max_length truncates each (query, passage) pair to the token budget
+		if self.backend == "onnx":
+			from onnx_backend import OnnxCrossEncoder
+			int8 = reranker_config.onnx_int8 if int8 is None else int8
+			self.model = OnnxCrossEncoder(self.model_name, max_length=max_tokens, quantize=int8, intra_op_threads=reranker_config.intra_op_threads, inter_op_threads=reranker_config.inter_op_threads)
+		else:
+			set_torch_threads(reranker_config.intra_op_threads, reranker_config.inter_op_threads)
+			self.model = CrossEncoder(self.model_name, max_length=max_tokens)
+		self.cache_size = reranker_config.cache_size if cache_size is None else cache_size
+		self._cache: OrderedDict[Tuple[str, str, str], float] = OrderedDict()
+		self._lock = threading.Lock()
+
+	@staticmethod
+	def _dense_rank_key(c: Dict[str, Any]) -> float:
+		return c.get("rrf_score", c.get("score") or 0.0)
+
+	def rerank(self, query: str, candidates: List[Dict]) -> List[Dict]:
+		return self.rerank_with_timing(query, candidates)[0]
+
+	def rerank_with_timing(self, query: str, candidates: List[Dict]) -> Tuple[List[Dict], Dict[str, Any]]:
+		"""Cross-encoder rerank; returns (results, timing).
+
+		Only the top_n candidates by first-stage score are scored (0 = all); the rest
+		follow in their original order. Scores are cached per (query digest, point id,
+		passage digest), so an edited passage is rescored, and uncached pairs are sorted by passage length so each batch pads less.
+		"""
+		return self.rerank_many([(query, candidates)])[0]
+
+	def rerank_many(self, requests: List[Tuple[str, List[Dict]]]) -> List[Tuple[List[Dict], Dict[str, Any]]]:
+		"""rerank_with_timing for several queries at once, with a single predict() over all their pairs."""
+		start = time.perf_counter()
+		plans = []
+		missing: List[Tuple[str, Tuple[str, str, str], Dict]] = []
+		with self._lock:
+			for query, candidates in requests:
+				head, tail = candidates, []
+				if self.top_n and len(candidates) > self.top_n:
+					ordered = sorted(candidates, key=self._dense_rank_key, reverse=True)
+					head, tail = ordered[:self.top_n], ordered[self.top_n:]
+				qkey = _digest(query)
+				scored = 0
+				for c in head:
+					key = (qkey, str(c["id"]), _digest(c["payload"]["text"]))
+					score = self._cache.get(key) if self.cache_size else None
+					if score is None:
+						missing.append((query, key, c))
+						scored += 1
+					else:
+						self._cache.move_to_end(key)
+						c["rerank_score"] = score
+				plans.append((candidates, head, tail, scored))
+		infer_s = 0.0
+		if missing:
+			missing.sort(key=lambda m: len(m[2]["payload"]["text"]))
+			pairs = [(query, c["payload"]["text"]) for query, _, c in missing]
+			with metrics.span("rerank.predict", items=len(pairs)) as predict:
+				scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+			infer_s = predict.seconds
+			with self._lock:
+				for (_, key, c), s in zip(missing, scores):
+					c["rerank_score"] = float(s)
+					if self.cache_size:
+						self._cache[key] = float(s)
+				while len(self._cache) > self.cache_size:
+					self._cache.popitem(last=False)
+		total_s = time.perf_counter() - start
+		out = []
+		for candidates, head, tail, scored in plans:
+			results = sorted(head, key=lambda x: x["rerank_score"], reverse=True) + tail
+			timing = {
+				"candidates": len(candidates),
+				"scored": scored,
+				"cached": len(head) - scored,
+				"skipped": len(tail),
+				"batch_queries": len(requests),
+				"inference_s": infer_s,
+				"total_s": total_s,
+			}
+			out.append((results, timing))
+		return out
+
+
+class BatchedReranker:
+	"""Reranker front that scores concurrent callers' queries together via Reranker.rerank_many.
+
+	Other attributes (model, cache_size, ...) are forwarded to the wrapped reranker.
+	"""
+
+	def __init__(self, reranker: Reranker | None = None, max_batch: int | None = None, max_wait_ms: float | None = None):
+		self.reranker = reranker or Reranker()
+		max_batch = reranker_config.microbatch_size if max_batch is None else max_batch
+		max_wait_ms = reranker_config.microbatch_wait_ms if max_wait_ms is None else max_wait_ms
+		self.batcher = MicroBatcher(self.reranker.rerank_many, max_batch, max_wait_ms, app_config.microbatch_queue_size, name="rerank-batcher") if max_batch > 1 else None
+
+	def __getattr__(self, name: str) -> Any:
+		if name == "reranker":
+			raise AttributeError(name)
+		return getattr(self.reranker, name)
 
 	def rerank(self, query: str, candidates: List[Dict]) -> List[Dict]:
-		pairs = [(query, c["payload"]["text"]) for c in candidates]
-		scores = self.model.predict(pairs)
-		for c, s in zip(candidates, scores):
-			c["rerank_score"] = float(s)
-		return sorted(candidates, key=lambda x: x["rerank_score"], reverse=True)
+		return self.rerank_with_timing(query, candidates)[0]
+
+	def rerank_with_timing(self, query: str, candidates: List[Dict]) -> Tuple[List[Dict], Dict[str, Any]]:
+		if self.batcher is None:
+			return self.reranker.rerank_with_timing(query, candidates)
+		return self.batcher.call((query, candidates))
+
+	async def arerank_with_timing(self, query: str, candidates: List[Dict]) -> Tuple[List[Dict], Dict[str, Any]]:
+		if self.batcher is None:
+			return await asyncio.to_thread(self.reranker.rerank_with_timing, query, candidates)
+		return await self.batcher.submit((query, candidates))
+
+	def rerank_many(self, requests: List[Tuple[str, List[Dict]]]) -> List[Tuple[List[Dict], Dict[str, Any]]]:
+		return self.reranker.rerank_many(requests)
+
+	def batch_stats(self) -> Dict[str, Any]:
+		return self.batcher.stats() if self.batcher else {}
@@ -1,53 +1,156 @@
 from __future__ import annotations
 from typing import List, Dict, Any, Optional
+import asyncio
 import numpy as np
 
-from embeddings import EmbeddingService
-from vectorstore import QdrantStore
-from reranker import Reranker
-from config import qdrant_config
+from embeddings import EmbeddingService, BatchedEmbeddingService
+from vectorstore import VectorStore, AsyncQdrantStore, ThreadedAsyncStore
+from reranker import Reranker, BatchedReranker
+from docstore import DocStore
+from sparse import SparseEncoder, reciprocal_rank_fusion
+from registry import registry
+from metrics import metrics
+from config import qdrant_config, app_config
 
 class Retriever:
-	def __init__(self, store: QdrantStore | None = None, embedder: EmbeddingService | None = None, reranker: Reranker | None = None):
-		self.store = store or QdrantStore()
-		self.embedder = embedder or EmbeddingService()
-		rself = reranker or Reranker()
-		self.reranker = rself
+	def __init__(self, store: VectorStore | None = None, embedder: EmbeddingService | None = None, reranker: Reranker | None = None, mmr_lambda: float | None = None, hybrid: bool | None = None, docstore: DocStore | None = None):
+		self.store = store or registry.store()
+		self.embedder = embedder or registry.embedder()
+		self.reranker = reranker or registry.reranker()
+		self.docstore = docstore or registry.docstore()
+		self.mmr_lambda = app_config.mmr_lambda if mmr_lambda is None else mmr_lambda
+		hybrid = app_config.hybrid_search if hybrid is None else hybrid
+		self.sparse = SparseEncoder(stats=registry.term_stats()) if hybrid else None
 
-	def search(self, query: str, top_k: int = 20, mmr_k: int = 8, filter_: Optional[Any] = None, collection: Optional[str] = None) -> List[Dict[str, Any]]:
+	def candidates(self, query: str, q_vec: List[float], top_k: int, filter_: Optional[Any], collection_name: str, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> List[Dict[str, Any]]:
+		"""Dense hits, or dense+sparse hits merged by reciprocal rank fusion when hybrid is on."""
+		if self.sparse is None or not self.store.has_sparse(collection_name):
+			return self.store.query(collection_name, q_vec, top_k=top_k, filter_=filter_, with_vectors=True, hnsw_ef=hnsw_ef, oversampling=oversampling)
+		dense, sparse = self.store.hybrid_query(collection_name, q_vec, self.sparse.encode_query(query, collection_name), top_k=top_k, filter_=filter_, with_vectors=True, hnsw_ef=hnsw_ef, oversampling=oversampling)
+		return reciprocal_rank_fusion([dense, sparse], k=app_config.rrf_k)[:top_k]
+
+	def search(self, query: str, top_k: int = 20, mmr_k: int = 8, filter_: Optional[Any] = None, collection: Optional[str] = None, mmr_lambda: float | None = None, timings: Optional[Dict[str, Any]] = None, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> List[Dict[str, Any]]:
+		"""Embed, retrieve, diversify with MMR and rerank. Pass a dict as `timings` to receive per-stage timing.
+
+		`hnsw_ef` and `oversampling` override the store's search-time recall/latency settings for this query.
+		"""
+		timings = {} if timings is None else timings
 		collection_name = collection or qdrant_config.collection
-		q_vec = self.embedder.embed_text(query)
-		initial = self.store.query(collection_name, q_vec, top_k=top_k, filter_=filter_)
+		with metrics.span("retrieval.embed") as span:
+			q_vec = self.embedder.embed_text(query)
+		timings["embed_s"] = span.seconds
+		with metrics.span("retrieval.search") as span:
+			initial = self.candidates(query, q_vec, top_k, filter_, collection_name, hnsw_ef, oversampling)
+		timings["search_s"] = span.seconds
 		if not initial:
 			return []
-		# MMR selection on embedding vectors
-		vectors = np.array([q_vec] + [r["payload"].get("vector", q_vec) for r in initial], dtype=float)  # fallback if vector not stored
-		# If vectors for docs are not stored, skip MMR
+		with metrics.span("retrieval.mmr", items=len(initial)) as span:
+			selected = self._diversify(q_vec, initial, mmr_k, mmr_lambda)
+		timings["mmr_s"] = span.seconds
+		self._fetch_text(collection_name, selected, timings)
+		with metrics.span("retrieval.rerank", items=len(selected)):
+			results, timings["rerank"] = self.reranker.rerank_with_timing(query, selected)
+		return results
+
+	def _fetch_text(self, collection_name: str, docs: List[Dict[str, Any]], timings: Dict[str, Any]) -> None:
+		"""Load out-of-band chunk text for the candidates that go on to rerank and the prompt."""
+		if self.docstore is None:
+			return
+		with metrics.span("retrieval.fetch_text", items=len(docs)) as span:
+			self.docstore.hydrate(collection_name, docs)
+		timings["fetch_text_s"] = span.seconds
+
+	def _diversify(self, q_vec: List[float], initial: List[Dict[str, Any]], mmr_k: int, mmr_lambda: float | None) -> List[Dict[str, Any]]:
 		selected = initial
-		if vectors.shape[0] == len(initial) + 1 and vectors.shape[1] == len(q_vec):
-			selected = self._mmr(vectors[0], vectors[1:], initial, k=min(mmr_k, len(initial)))
-		return self.reranker.rerank(query, selected)
-
-	@staticmethod
-	def _cosine(a: np.ndarray, b: np.ndarray) -> float:
-		na = np.linalg.norm(a)
-		nb = np.linalg.norm(b)
-		if na == 0 or nb == 0:
-			return 0.0
-		return float(np.dot(a, b) / (na * nb))
-
-	def _mmr(self, q: np.ndarray, docs: np.ndarray, items: List[Dict[str, Any]], k: int, lambda_: float = 0.5) -> List[Dict[str, Any]]:
-		selected_idx: List[int] = []
-		candidates = list(range(len(docs)))
-		while len(selected_idx) < k and candidates:
-			scores = []
-			for i in candidates:
-				relevance = self._cosine(q, docs[i])
-				diversity = max([self._cosine(docs[i], docs[j]) for j in selected_idx], default=0.0)
-				score = lambda_ * relevance - (1 - lambda_) * diversity
-				scores.append((score, i))
-			scores.sort(reverse=True)
-			sel = scores[0][1]
-			selected_idx.append(sel)
-			candidates.remove(sel)
-		return [items[i] for i in selected_idx]
+		doc_vecs = [r.pop("vector", None) for r in initial]
+		# MMR needs the stored document vectors; skip it if any are missing
+		if all(v is not None and len(v) == len(q_vec) for v in doc_vecs):
+			vectors = np.asarray(doc_vecs, dtype=np.float32)
+			selected = self._mmr(np.asarray(q_vec, dtype=np.float32), vectors, initial, k=min(mmr_k, len(initial)), lambda_=mmr_lambda)
+		return selected
+
+	def _mmr(self, q: np.ndarray, docs: np.ndarray, items: List[Dict[str, Any]], k: int, lambda_: float | None = None) -> List[Dict[str, Any]]:
+		lambda_ = self.mmr_lambda if lambda_ is None else lambda_
+		relevance = None
+		if items and "rrf_score" in items[0]:
+			# Hybrid hits: rank by fused score so sparse-only matches are not penalized for low cosine
+			fused = np.array([it["rrf_score"] for it in items], dtype=np.float32)
+			relevance = fused / fused.max()
+		return [items[i] for i in mmr_select(q, docs, k, lambda_, relevance=relevance)]
+
+
+class AsyncRetriever(Retriever):
+	"""Retriever for the HTTP API: awaits an async store and the shared micro-batched embedder/reranker."""
+
+	def __init__(self, store: AsyncQdrantStore | ThreadedAsyncStore, embedder: BatchedEmbeddingService | None = None, reranker: BatchedReranker | None = None, mmr_lambda: float | None = None, hybrid: bool | None = None, docstore: DocStore | None = None):
+		super().__init__(store, embedder, reranker, mmr_lambda, hybrid, docstore)
+
+	async def candidates(self, query: str, q_vec: List[float], top_k: int, filter_: Optional[Any], collection_name: str, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> List[Dict[str, Any]]:
+		if self.sparse is None or not await self.store.has_sparse(collection_name):
+			return await self.store.query(collection_name, q_vec, top_k=top_k, filter_=filter_, with_vectors=True, hnsw_ef=hnsw_ef, oversampling=oversampling)
+		# IDF weights come from SQLite reads; keep them off the event loop
+		sparse_query = await asyncio.to_thread(self.sparse.encode_query, query, collection_name)
+		dense, sparse = await self.store.hybrid_query(collection_name, q_vec, sparse_query, top_k=top_k, filter_=filter_, with_vectors=True, hnsw_ef=hnsw_ef, oversampling=oversampling)
+		return reciprocal_rank_fusion([dense, sparse], k=app_config.rrf_k)[:top_k]
+
+	async def retrieve(self, query: str, top_k: int = 20, mmr_k: int = 8, filter_: Optional[Any] = None, collection: Optional[str] = None, mmr_lambda: float | None = None, timings: Optional[Dict[str, Any]] = None, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> List[Dict[str, Any]]:
+		"""Embed, retrieve and diversify with MMR, without reranking. Returned docs carry their text."""
+		timings = {} if timings is None else timings
+		collection_name = collection or qdrant_config.collection
+		with metrics.span("retrieval.embed") as span:
+			q_vec = await self.embedder.aembed_text(query)
+		timings["embed_s"] = span.seconds
+		with metrics.span("retrieval.search") as span:
+			initial = await self.candidates(query, q_vec, top_k, filter_, collection_name, hnsw_ef, oversampling)
+		timings["search_s"] = span.seconds
+		if not initial:
+			return []
+		with metrics.span("retrieval.mmr", items=len(initial)) as span:
+			selected = self._diversify(q_vec, initial, mmr_k, mmr_lambda)
+		timings["mmr_s"] = span.seconds
+		await asyncio.to_thread(self._fetch_text, collection_name, selected, timings)
+		return selected
+
+	async def rerank(self, query: str, candidates: List[Dict[str, Any]], timings: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+		if not candidates:
+			return []
+		with metrics.span("retrieval.rerank", items=len(candidates)):
+			results, rerank_timing = await self.reranker.arerank_with_timing(query, candidates)
+		if timings is not None:
+			timings["rerank"] = rerank_timing
+		return results
+
+	async def search(self, query: str, top_k: int = 20, mmr_k: int = 8, filter_: Optional[Any] = None, collection: Optional[str] = None, mmr_lambda: float | None = None, timings: Optional[Dict[str, Any]] = None, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> List[Dict[str, Any]]:
+		selected = await self.retrieve(query, top_k, mmr_k, filter_, collection, mmr_lambda, timings, hnsw_ef, oversampling)
+		return await self.rerank(query, selected, timings)
+
+
+def _normalize_rows(x: np.ndarray) -> np.ndarray:
+	norms = np.linalg.norm(x, axis=-1, keepdims=True)
+	norms[norms == 0] = 1.0
+	return x / norms
+
+
+def mmr_select(q: np.ndarray, docs: np.ndarray, k: int, lambda_: float = 0.5, relevance: Optional[np.ndarray] = None) -> List[int]:
+	"""Maximal marginal relevance over cosine similarity; returns selected row indices.
+
+	The doc-doc similarity matrix is computed once and each candidate's max
+	similarity to the selected set is updated incrementally, so selection costs
+	k vectorized passes over n candidates instead of k*n*k cosine calls.
+	`relevance` overrides the query-cosine relevance term (e.g. fused scores).
+	"""
+	docs = _normalize_rows(np.asarray(docs, dtype=np.float32))
+	if relevance is None:
+		relevance = docs @ _normalize_rows(np.asarray(q, dtype=np.float32)[None, :])[0]
+	similarity = docs @ docs.T
+	max_sim = np.zeros(len(docs), dtype=np.float32)
+	available = np.ones(len(docs), dtype=bool)
+	selected_idx: List[int] = []
+	for _ in range(min(k, len(docs))):
+		scores = lambda_ * relevance - (1 - lambda_) * max_sim
+		scores[~available] = -np.inf
+		sel = int(np.argmax(scores))
+		selected_idx.append(sel)
+		available[sel] = False
+		np.maximum(max_sim, similarity[sel], out=max_sim)
+	return selected_idx
@@ -0,0 +1,151 @@
+from __future__ import annotations
+from typing import List, Dict, Tuple, Iterable
+from collections import Counter
+import math
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+from config import app_config
+
+_token_re = re.compile(r"[a-z0-9]+(?:[.,'%$][a-z0-9]+)*")
+
+_STOPWORDS = frozenset(
+	"a an and are as at be by for from has have in is it its of on or that the this to was were what when which who will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+	"""Lowercased terms; keeps tickers, quarters and figures like 'nvda', 'q3', '3.2' intact."""
+	return [t for t in _token_re.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _term_index(term: str) -> int:
+	# Stable across processes (unlike hash()), fits Qdrant's uint32 sparse indices
+	return zlib.crc32(term.encode("utf-8"))
+
+
+_SQL_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS collections (
+	collection TEXT PRIMARY KEY,
+	docs INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+	collection TEXT NOT NULL,
+	term INTEGER NOT NULL,
+	df INTEGER NOT NULL,
+	PRIMARY KEY (collection, term)
+) WITHOUT ROWID;
+"""
+
+
+class TermStats:
+	"""Per-collection document frequencies for the sparse IDF, kept in SQLite.
+
+	Counts only grow: chunks that are later deleted or re-ingested are not
+	subtracted, which inflates the document count and df together and barely
+	moves the log-scaled weights. Drop a collection's counts when it is rebuilt.
+	"""
+
+	def __init__(self, path: str | None = None):
+		path = path or app_config.sparse_stats_path
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+		self._db.execute("PRAGMA journal_mode=WAL")
+		self._db.execute("PRAGMA synchronous=NORMAL")
+		self._db.executescript(_SCHEMA)
+		self._lock = threading.Lock()
+
+	def add_documents(self, collection: str, term_sets: List[Iterable[int]]) -> None:
+		df = Counter(term for terms in term_sets for term in set(terms))
+		with self._lock, self._db:
+			self._db.execute(
+				"INSERT INTO collections (collection, docs) VALUES (?, ?) ON CONFLICT (collection) DO UPDATE SET docs = docs + excluded.docs",
+				(collection, len(term_sets)),
+			)
+			self._db.executemany(
+				"INSERT INTO terms (collection, term, df) VALUES (?, ?, ?) ON CONFLICT (collection, term) DO UPDATE SET df = df + excluded.df",
+				[(collection, term, n) for term, n in df.items()],
+			)
+
+	def idf(self, collection: str, terms: List[int]) -> List[float]:
+		"""BM25 idf per term; uniform for a collection with no counts yet."""
+		with self._lock:
+			row = self._db.execute("SELECT docs FROM collections WHERE collection = ?", (collection,)).fetchone()
+			df: Dict[int, int] = {}
+			for start in range(0, len(terms), _SQL_BATCH):
+				batch = terms[start:start + _SQL_BATCH]
+				df.update(self._db.execute(f"SELECT term, df FROM terms WHERE collection = ? AND term IN ({','.join('?' * len(batch))})", (collection, *batch)))
+		docs = row[0] if row else 0
+		return [math.log(1 + (docs - df.get(t, 0) + 0.5) / (df.get(t, 0) + 0.5)) for t in terms]
+
+	def drop(self, collection: str) -> None:
+		with self._lock, self._db:
+			self._db.execute("DELETE FROM collections WHERE collection = ?", (collection,))
+			self._db.execute("DELETE FROM terms WHERE collection = ?", (collection,))
+
+
+class SparseEncoder:
+	"""BM25 sparse vectors for Qdrant.
+
+	Documents get BM25 term-frequency saturation with length normalization
+	against a fixed average length; queries get one weight per distinct term,
+	its IDF in the collection when `stats` is given. Qdrant scores by dot
+	product, so a hit's score is the BM25 sum over the query terms it contains.
+	IDF lives on the query side because it changes as the collection grows,
+	while stored document vectors do not.
+	"""
+
+	def __init__(self, k1: float = 1.2, b: float = 0.75, avg_doc_len: float | None = None, stats: TermStats | None = None):
+		self.k1 = k1
+		self.b = b
+		self.avg_doc_len = avg_doc_len or app_config.sparse_avg_doc_len
+		self.stats = stats
+
+	def _weights(self, counts: Counter, doc_len: int) -> Tuple[List[int], List[float]]:
+		merged: Dict[int, float] = {}
+		norm = self.k1 * (1 - self.b + self.b * doc_len / self.avg_doc_len)
+		for term, tf in counts.items():
+			idx = _term_index(term)
+			merged[idx] = merged.get(idx, 0.0) + tf * (self.k1 + 1) / (tf + norm)
+		indices = sorted(merged)
+		return indices, [merged[i] for i in indices]
+
+	def encode_document(self, text: str) -> Tuple[List[int], List[float]]:
+		terms = tokenize(text)
+		return self._weights(Counter(terms), len(terms))
+
+	def encode_documents(self, texts: List[str], collection: str | None = None) -> List[Tuple[List[int], List[float]]]:
+		"""Encode a batch; with `collection` and stats set, also count the batch toward its document frequencies."""
+		vectors = [self.encode_document(t) for t in texts]
+		if self.stats is not None and collection:
+			self.stats.add_documents(collection, [indices for indices, _ in vectors])
+		return vectors
+
+	def encode_query(self, text: str, collection: str | None = None) -> Tuple[List[int], List[float]]:
+		indices = sorted({_term_index(t) for t in tokenize(text)})
+		if self.stats is None or not collection or not indices:
+			return indices, [1.0] * len(indices)
+		return indices, self.stats.idf(collection, indices)
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict]], k: int = 60) -> List[Dict]:
+	"""Merge ranked hit lists by sum of 1/(k + rank), keyed on point id.
+
+	The first occurrence of each id is kept, with the fused value in "rrf_score".
+	"""
+	fused: Dict[str, Dict] = {}
+	scores: Dict[str, float] = {}
+	for results in result_lists:
+		for rank, item in enumerate(results):
+			key = str(item["id"])
+			if key not in fused:
+				fused[key] = item
+			scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+	for key, item in fused.items():
+		item["rrf_score"] = scores[key]
+	return sorted(fused.values(), key=lambda x: x["rrf_score"], reverse=True)
@@ -0,0 +1,153 @@
+from __future__ import annotations
+from typing import List, Dict, Any, Iterable, Optional, Tuple, Callable
+from datetime import datetime, timezone
+import csv
+import os
+
+_TIME_COLUMNS = ("date", "datetime", "timestamp", "time")
+_OHLCV = ("open", "high", "low", "close", "volume")
+
+
+def csv_identity(path: str) -> Dict[str, str]:
+	"""Symbol and bar interval from a `<SYMBOL>_<interval>.csv` file name."""
+	stem = os.path.splitext(os.path.basename(path))[0]
+	symbol, _, interval = stem.partition("_")
+	meta = {"symbol": symbol.upper()}
+	if interval:
+		meta["interval"] = interval
+	return meta
+
+
+def _parse_time(value: str) -> Optional[datetime]:
+	try:
+		return datetime.fromisoformat(value.strip())
+	except ValueError:
+		return None
+
+
+def _time_range(start: Optional[datetime], end: Optional[datetime]) -> Dict[str, Any]:
+	if start is None or end is None:
+		return {}
+	# ISO strings for display, epoch seconds for Qdrant range filters
+	return {
+		"time_start": start.isoformat(),
+		"time_end": end.isoformat(),
+		"time_start_ts": _epoch(start),
+		"time_end_ts": _epoch(end),
+	}
+
+
+def _epoch(value: datetime) -> int:
+	"""Epoch seconds; naive times are read as UTC, as Qdrant reads the ISO fields, not in the host's zone."""
+	if value.tzinfo is None:
+		value = value.replace(tzinfo=timezone.utc)
+	return int(value.timestamp())
+
+
+def iter_csv_row_windows(path: str, rows_per_chunk: int, max_tokens: int | None = None, count_tokens: Callable[[str], int] | None = None) -> Iterable[Tuple[str, Dict[str, Any]]]:
+	"""Stream (text, metadata) windows of up to `rows_per_chunk` rows, each repeating the header line.
+
+	With `max_tokens` and `count_tokens`, a window also closes before it would
+	outgrow the embedder's input, so no row it claims to cover is truncated away.
+	"""
+	identity = csv_identity(path)
+	with open(path, "r", encoding="utf-8", errors="ignore", newline="") as f:
+		reader = csv.reader(f)
+		header = next(reader, None)
+		if not header:
+			return
+		columns = [h.strip().lower() for h in header]
+		time_col = next((columns.index(c) for c in _TIME_COLUMNS if c in columns), None)
+		header_line = ",".join(header)
+		prefix = " ".join(f"{k}: {v}" for k, v in identity.items())
+		budget = max_tokens if max_tokens and count_tokens else None
+		overhead = count_tokens(f"{prefix}\n{header_line}") if budget else 0
+		window: List[List[str]] = []
+		used = overhead
+
+		def flush() -> Tuple[str, Dict[str, Any]]:
+			meta: Dict[str, Any] = dict(identity, rows=len(window))
+			if time_col is not None:
+				meta |= _time_range(_parse_time(window[0][time_col]), _parse_time(window[-1][time_col]))
+			text = "\n".join([prefix, header_line] + [",".join(r) for r in window])
+			return text, meta
+
+		for row in reader:
+			# Blank lines, and truncated rows that stop before the time column
+			if not row or (time_col is not None and len(row) <= time_col):
+				continue
+			if budget:
+				n = count_tokens(",".join(row))
+				if window and used + n > budget:
+					yield flush()
+					window, used = [], overhead
+				used += n
+			window.append(row)
+			if len(window) >= rows_per_chunk:
+				yield flush()
+				window, used = [], overhead
+		if window:
+			yield flush()
+
+
+def iter_csv_rollups(path: str, period: str, rows_per_chunk: int, max_tokens: int | None = None, count_tokens: Callable[[str], int] | None = None) -> Iterable[Tuple[str, Dict[str, Any]]]:
+	"""Stream one OHLCV summary chunk per day or ISO week.
+
+	Falls back to row windows (sized by the remaining arguments) when the file
+	has no time column or OHLCV columns.
+	"""
+	identity = csv_identity(path)
+	with open(path, "r", encoding="utf-8", errors="ignore", newline="") as f:
+		reader = csv.reader(f)
+		header = next(reader, None)
+		if not header:
+			return
+		columns = [h.strip().lower() for h in header]
+		time_col = next((columns.index(c) for c in _TIME_COLUMNS if c in columns), None)
+		if time_col is None or not all(c in columns for c in _OHLCV):
+			yield from iter_csv_row_windows(path, rows_per_chunk, max_tokens, count_tokens)
+			return
+		idx = {c: columns.index(c) for c in _OHLCV}
+		label = identity["symbol"] + (f" ({identity['interval']} bars)" if "interval" in identity else "")
+		bucket: Optional[str] = None
+		agg: Dict[str, Any] = {}
+
+		def flush() -> Tuple[str, Dict[str, Any]]:
+			change = (agg["close"] - agg["open"]) / agg["open"] * 100 if agg["open"] else 0.0
+			text = (
+				f"{label} {period} summary for {bucket} ({agg['start'].isoformat()} to {agg['end'].isoformat()}): "
+				f"open {agg['open']:g}, high {agg['high']:g}, low {agg['low']:g}, close {agg['close']:g}, "
+				f"change {change:+.2f}%, volume {agg['volume']:.0f}, bars {agg['bars']}."
+			)
+			meta = dict(identity, period=period, period_key=bucket, rows=agg["bars"]) | _time_range(agg["start"], agg["end"])
+			return text, meta
+
+		for row in reader:
+			if len(row) < len(columns):
+				continue
+			ts = _parse_time(row[time_col])
+			if ts is None:
+				continue
+			try:
+				o, h, l, c, v = (float(row[idx[k]]) for k in _OHLCV)
+			except ValueError:
+				continue
+			if period == "week":
+				year, week, _ = ts.isocalendar()
+				key = f"{year}-W{week:02d}"
+			else:
+				key = ts.date().isoformat()
+			if key != bucket:
+				if bucket is not None:
+					yield flush()
+				bucket = key
+				agg = {"open": o, "high": h, "low": l, "close": c, "volume": v, "bars": 1, "start": ts, "end": ts}
+				continue
+			agg["high"] = max(agg["high"], h)
+			agg["low"] = min(agg["low"], l)
+			agg["close"] = c
+			agg["volume"] += v
+			agg["bars"] += 1
+			agg["end"] = ts
+		if bucket is not None:
+			yield flush()
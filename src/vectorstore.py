@@ -1,42 +1,524 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Optional
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams, Distance, PointStruct, Filter, FieldCondition, MatchValue
-from uuid import uuid4
-from config import qdrant_config, embedding_config
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, replace
+from datetime import date, datetime, time as dtime
+from math import ceil
+import asyncio
+import json
+import threading
+import numpy as np
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.http.models import (
+	VectorParams, Distance, PointStruct, PointIdsList, Filter, FieldCondition, MatchValue, MatchAny, Range, DatetimeRange, PayloadSchemaType,
+	SparseVectorParams, SparseVector, NamedSparseVector, SearchRequest, FilterSelector, HasIdCondition, SearchParams, QuantizationSearchParams,
+	HnswConfigDiff, ScalarQuantization, ScalarQuantizationConfig, ScalarType, BinaryQuantization, BinaryQuantizationConfig,
+)
+from uuid import uuid4, uuid5, UUID
+import hashlib
+from metrics import metrics
+from config import qdrant_config, embedding_config, app_config
 
-class QdrantStore:
-	def __init__(self, url: str | None = None, api_key: Optional[str] = None):
-		self.client = QdrantClient(url=url or qdrant_config.url, api_key=api_key or qdrant_config.api_key)
-
-	def ensure_collection(self, name: str, vector_size: int, distance: Distance = Distance.COSINE) -> None:
-		collections = [c.name for c in self.client.get_collections().collections]
-		if name not in collections:
-			self.client.create_collection(collection_name=name, vectors_config=VectorParams(size=vector_size, distance=distance))
-
-	def upsert(self, collection: str, embeddings: List[List[float]], payloads: List[Dict[str, Any]]) -> None:
-		points = []
-		for vec, payload in zip(embeddings, payloads):
-			points.append(PointStruct(id=str(uuid4()), vector=vec, payload=payload))
-		self.client.upsert(collection_name=collection, points=points)
-
-	def query(self, collection: str, vector: List[float], top_k: int = 20, filter_: Optional[Filter] = None) -> List[Dict[str, Any]]:
-		search_result = self.client.search(collection_name=collection, query_vector=vector, limit=top_k, query_filter=filter_)
-		results = []
-		for r in search_result:
-			item = {
-				"id": r.id,
-				"score": r.score,
-				"payload": r.payload,
-			}
-			results.append(item)
-		return results
+# Qdrant's name for the unnamed (default) dense vector, and our sparse vector name
+DENSE_VECTOR = ""
+SPARSE_VECTOR = "bm25"
+
+# Fixed namespace so the same chunk always maps to the same point id
+POINT_ID_NAMESPACE = UUID("6f1c1d9e-3b7a-4c52-9a43-0c2f1b7e8d11")
+
+def point_id(source: str, chunk_index: int, text: str) -> str:
+	"""Content-addressed point id: stable across runs for identical (source, index, text)."""
+	digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+	return str(uuid5(POINT_ID_NAMESPACE, f"{source}\x00{chunk_index}\x00{digest}"))
+
+# Payload fields indexed per kind of collection. Filtered HNSW searches on an
+# unindexed field check payloads point by point, which degrades as collections grow.
+DOCUMENT_SCHEMA: Dict[str, PayloadSchemaType] = {
+	"source": PayloadSchemaType.KEYWORD,
+	"symbol": PayloadSchemaType.KEYWORD,
+	"interval": PayloadSchemaType.KEYWORD,
+	"chunk_index": PayloadSchemaType.INTEGER,
+	"time_start": PayloadSchemaType.DATETIME,
+	"time_end": PayloadSchemaType.DATETIME,
+}
+MEMORY_SCHEMA: Dict[str, PayloadSchemaType] = {
+	"session_id": PayloadSchemaType.KEYWORD,
+	"role": PayloadSchemaType.KEYWORD,
+	"kind": PayloadSchemaType.KEYWORD,
+	"created_at": PayloadSchemaType.FLOAT,
+}
+ANSWER_CACHE_SCHEMA: Dict[str, PayloadSchemaType] = {
+	"collection": PayloadSchemaType.KEYWORD,
+	"sources": PayloadSchemaType.KEYWORD,
+	"created_at": PayloadSchemaType.FLOAT,
+}
+
+
+def field_condition(key: str, value: Any) -> FieldCondition:
+	"""Condition on one payload field: a Range/DatetimeRange bounds it, a list, tuple or set matches any of its values, anything else must be equal."""
+	if isinstance(value, (Range, DatetimeRange)):
+		return FieldCondition(key=key, range=value)
+	if isinstance(value, (list, tuple, set, frozenset)):
+		return FieldCondition(key=key, match=MatchAny(any=list(value)))
+	return FieldCondition(key=key, match=MatchValue(value=value))
+
+
+def between(gte: Any = None, lte: Any = None) -> Range | DatetimeRange:
+	"""Inclusive range; date/datetime bounds give a DatetimeRange (for datetime-indexed fields), numbers a Range."""
+	if isinstance(gte, date) or isinstance(lte, date):
+		return DatetimeRange(gte=gte, lte=lte)
+	return Range(gte=gte, lte=lte)
+
+
+def make_filter(must: Optional[Dict[str, Any]] = None, should: Optional[Dict[str, Any]] = None, must_not: Optional[Dict[str, Any]] = None) -> Optional[Filter]:
+	"""Filter from {field: value} maps, values as in field_condition. `should` needs at least one match.
+
+	Returns None when nothing is constrained, so the result can go straight to query().
+	"""
+	clauses = {
+		name: [field_condition(k, v) for k, v in (conditions or {}).items()] or None
+		for name, conditions in (("must", must), ("should", should), ("must_not", must_not))
+	}
+	if not any(clauses.values()):
+		return None
+	return Filter(**clauses)
+
+
+def combine_filters(*filters: Optional[Filter]) -> Optional[Filter]:
+	"""All of the given filters (None entries are skipped)."""
+	filters = tuple(f for f in filters if f is not None)
+	if len(filters) <= 1:
+		return filters[0] if filters else None
+	return Filter(must=list(filters))
+
+
+def document_filter(sources: Optional[List[str]] = None, symbols: Optional[List[str]] = None, start: Optional[date] = None, end: Optional[date] = None) -> Optional[Filter]:
+	"""Scope a document search to sources, ticker symbols and a time window.
+
+	The window keeps chunks whose [time_start, time_end] overlaps it; chunks
+	without times (PDFs, text) are excluded once a bound is set. A plain date
+	`end` includes that whole day.
+	"""
+	must: Dict[str, Any] = {}
+	if sources:
+		must["source"] = list(sources)
+	if symbols:
+		must["symbol"] = [s.strip().upper() for s in symbols]
+	if start is not None:
+		must["time_end"] = between(gte=start if isinstance(start, datetime) else datetime.combine(start, dtime.min))
+	if end is not None:
+		must["time_start"] = between(lte=end if isinstance(end, datetime) else datetime.combine(end, dtime.max))
+	return make_filter(must)
+
+@dataclass(frozen=True)
+class CollectionProfile:
+	"""Storage layout of a collection: vector quantization, on-disk placement and HNSW build parameters.
+
+	With quantization the compressed vectors stay in RAM for the HNSW search
+	and the originals are only read (from disk, if on_disk_vectors) to rescore
+	the best `oversampling * limit` candidates.
+	"""
+	quantization: str = "none"  # none | scalar (int8) | binary (1 bit per dimension)
+	on_disk_vectors: bool = False
+	on_disk_payload: bool = False
+	hnsw_m: Optional[int] = None  # None = server default (16)
+	hnsw_ef_construct: Optional[int] = None  # None = server default (100)
+	oversampling: Optional[float] = None
+	rescore: bool = True
+
+	def create_kwargs(self, vector_size: int, distance: Distance) -> Dict[str, Any]:
+		quantization = None
+		if self.quantization == "scalar":
+			quantization = ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+		elif self.quantization == "binary":
+			quantization = BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+		elif self.quantization != "none":
+			raise ValueError(f"Unknown quantization '{self.quantization}' (expected none, scalar or binary)")
+		hnsw = HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct) if self.hnsw_m or self.hnsw_ef_construct else None
+		return {
+			"vectors_config": VectorParams(size=vector_size, distance=distance, on_disk=self.on_disk_vectors or None),
+			"on_disk_payload": self.on_disk_payload or None,
+			"hnsw_config": hnsw,
+			"quantization_config": quantization,
+		}
+
+	def search_params(self, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> Optional[SearchParams]:
+		"""Per-query HNSW ef and quantization oversampling; None leaves both to the server."""
+		hnsw_ef = hnsw_ef or qdrant_config.search_hnsw_ef or None
+		oversampling = oversampling or self.oversampling
+		if hnsw_ef is None and oversampling is None:
+			return None
+		quantization = QuantizationSearchParams(rescore=self.rescore, oversampling=oversampling) if oversampling else None
+		return SearchParams(hnsw_ef=hnsw_ef, quantization=quantization)
+
+
+PROFILES: Dict[str, CollectionProfile] = {
+	"default": CollectionProfile(),
+	# Full vectors and payloads on disk, memory-mapped; nothing compressed
+	"disk": CollectionProfile(on_disk_vectors=True, on_disk_payload=True),
+	# int8 vectors in RAM (4x smaller), originals on disk for rescoring
+	"scalar": CollectionProfile(quantization="scalar", on_disk_vectors=True, on_disk_payload=True, oversampling=2.0),
+	# 1-bit vectors in RAM (32x smaller); needs more oversampling to keep recall
+	"binary": CollectionProfile(quantization="binary", on_disk_vectors=True, on_disk_payload=True, oversampling=4.0),
+}
+
+
+def collection_profile(name: str | None = None) -> CollectionProfile:
+	"""Named profile (default: QDRANT_PROFILE) with the QDRANT_HNSW_* and QDRANT_OVERSAMPLING overrides applied."""
+	name = name or qdrant_config.profile
+	if name not in PROFILES:
+		raise ValueError(f"Unknown collection profile '{name}' (expected one of {', '.join(PROFILES)})")
+	overrides = {
+		"hnsw_m": qdrant_config.hnsw_m or None,
+		"hnsw_ef_construct": qdrant_config.hnsw_ef_construct or None,
+		"oversampling": qdrant_config.oversampling or None,
+	}
+	return replace(PROFILES[name], **{k: v for k, v in overrides.items() if v is not None})
+
+
+def _hybrid_requests(vector: List[float], sparse_vector: Tuple[List[int], List[float]], top_k: int, filter_: Optional[Filter], with_vectors: bool, params: Optional[SearchParams] = None) -> List[SearchRequest]:
+	with_vector = [DENSE_VECTOR] if with_vectors else False
+	indices, values = sparse_vector
+	return [
+		SearchRequest(vector=vector, filter=filter_, limit=top_k, with_payload=True, with_vector=with_vector, params=params),
+		SearchRequest(vector=NamedSparseVector(name=SPARSE_VECTOR, vector=SparseVector(indices=indices, values=values)), filter=filter_, limit=top_k, with_payload=True, with_vector=with_vector),
+	]
+
+def _payload_point_id(payload: Dict[str, Any]) -> str:
+	if "source" in payload and "chunk_index" in payload and "text" in payload:
+		return point_id(payload["source"], payload["chunk_index"], payload["text"])
+	return str(uuid4())
+
+def _points(embeddings: List[List[float]], payloads: List[Dict[str, Any]], ids: Optional[List[str]], sparse_vectors: Optional[List[Tuple[List[int], List[float]]]]) -> List[PointStruct]:
+	ids = ids or [_payload_point_id(p) for p in payloads]
+	points = []
+	for i, (pid, vec, payload) in enumerate(zip(ids, embeddings, payloads)):
+		if isinstance(vec, np.ndarray):
+			vec = vec.tolist()
+		if sparse_vectors is not None:
+			indices, values = sparse_vectors[i]
+			vec = {DENSE_VECTOR: vec, SPARSE_VECTOR: SparseVector(indices=indices, values=values)}
+		points.append(PointStruct(id=pid, vector=vec, payload=payload))
+	return points
+
+def _named_vectors(embeddings: Any, sparse_vectors: List[Tuple[List[int], List[float]]], step: int) -> Iterator[Dict[str, Any]]:
+	"""Dense+sparse named vectors for upload_collection, converting the dense array one batch slice at a time."""
+	dense = np.asarray(embeddings, dtype=np.float32)
+	for start in range(0, len(dense), step):
+		rows = dense[start:start + step].tolist()
+		for vec, (indices, values) in zip(rows, sparse_vectors[start:start + step]):
+			yield {DENSE_VECTOR: vec, SPARSE_VECTOR: SparseVector(indices=indices, values=values)}
+
+def _upload_batch_size(embeddings: Any, payloads: List[Dict[str, Any]], sparse_vectors: Optional[List[Tuple[List[int], List[float]]]], target_mb: float) -> int:
+	"""Points per request so that each carries about target_mb of vectors and payload (estimated from a sample)."""
+	sample = range(0, len(payloads), max(1, len(payloads) // 32))
+	point_bytes = len(embeddings[0]) * 4 + sum(len(json.dumps(payloads[i], default=str)) for i in sample) / len(sample)
+	if sparse_vectors is not None:
+		point_bytes += sum(len(sparse_vectors[i][0]) for i in sample) / len(sample) * 8
+	return max(1, int(target_mb * 1e6 / point_bytes))
+
+class VectorStore(ABC):
+	"""Interface shared by the vector-store backends.
+
+	Filters are expressed with Qdrant's Filter model (see build_filter), which
+	every backend translates; backends without sparse vectors report
+	has_sparse() == False and callers fall back to dense-only search.
+	"""
+
+	@abstractmethod
+	def ensure_collection(self, name: str, vector_size: int, distance: Distance = Distance.COSINE, sparse: bool = False, profile: Optional[CollectionProfile] = None, payload_schema: Optional[Dict[str, PayloadSchemaType]] = None) -> None: ...
+
+	def has_sparse(self, name: str) -> bool:
+		return False
+
+	@abstractmethod
+	def upsert(self, collection: str, embeddings: List[List[float]], payloads: List[Dict[str, Any]], ids: Optional[List[str]] = None, sparse_vectors: Optional[List[Tuple[List[int], List[float]]]] = None) -> None: ...
+
+	def upload(self, collection: str, embeddings: Any, payloads: List[Dict[str, Any]], ids: Optional[List[str]] = None, sparse_vectors: Optional[List[Tuple[List[int], List[float]]]] = None) -> None:
+		"""Bulk write for ingestion (embeddings may be a NumPy array). Points may only be readable after flush()."""
+		self.upsert(collection, embeddings, payloads, ids=ids, sparse_vectors=sparse_vectors)
+
+	@abstractmethod
+	def delete(self, collection: str, ids: List[str]) -> None: ...
+
+	@abstractmethod
+	def delete_where(self, collection: str, filter_: Filter) -> None:
+		"""Delete every point matching `filter_`."""
+
+	@abstractmethod
+	def existing_ids(self, collection: str, ids: List[str]) -> List[str]:
+		"""The subset of `ids` present in `collection`."""
+
+	@abstractmethod
+	def scroll(self, collection: str, filter_: Optional[Filter] = None) -> List[Dict[str, Any]]:
+		"""Every point matching `filter_` as {"id", "payload"}, without vectors."""
+
+	@abstractmethod
+	def query(self, collection: str, vector: List[float], top_k: int = 20, filter_: Optional[Filter] = None, with_vectors: bool = False, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> List[Dict[str, Any]]: ...
+
+	def hybrid_query(self, collection: str, vector: List[float], sparse_vector: Tuple[List[int], List[float]], top_k: int = 20, filter_: Optional[Filter] = None, with_vectors: bool = False, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+		raise NotImplementedError(f"{type(self).__name__} has no sparse vectors")
+
+	def flush(self) -> None:
+		"""Persist buffered writes and wait until uploads are applied."""
 
 	@staticmethod
 	def build_filter(field: str, value: Any) -> Filter:
-		return Filter(must=[FieldCondition(key=field, match=MatchValue(value=value))])
+		"""Single-field filter; see make_filter for several fields, ranges and any-of."""
+		return Filter(must=[field_condition(field, value)])
+
+
+class QdrantStore(VectorStore):
+	def __init__(self, url: str | None = None, api_key: Optional[str] = None):
+		# location accepts a URL or ":memory:" for a local in-process instance
+		location = url or qdrant_config.url
+		# Local mode applies every write before returning (no upload barrier) and has no payload indexes
+		self._remote = location != ":memory:"
+		self.client = QdrantClient(location=location, api_key=api_key or qdrant_config.api_key, prefer_grpc=qdrant_config.prefer_grpc, grpc_port=qdrant_config.grpc_port)
+		# Search-time defaults (oversampling, rescore) come from the configured profile
+		self.profile = collection_profile()
+		self._sparse_support: Dict[str, bool] = {}
+		# Collections known to exist; only drop_collection() through this store removes entries
+		self._collections: set = set()
+		self._indexed: Dict[str, Dict[str, PayloadSchemaType]] = {}
+		# Collections with un-waited uploads, awaiting the flush() barrier
+		self._pending: set = set()
+		self._pending_lock = threading.Lock()
+
+	def _exists(self, name: str) -> bool:
+		if name not in self._collections and self.client.collection_exists(name):
+			self._collections.add(name)
+		return name in self._collections
+
+	def ensure_collection(self, name: str, vector_size: int, distance: Distance = Distance.COSINE, sparse: bool = False, profile: Optional[CollectionProfile] = None, payload_schema: Optional[Dict[str, PayloadSchemaType]] = None) -> None:
+		"""Create `name` if missing and index the `payload_schema` fields.
+
+		`profile` only applies at creation; existing collections keep their
+		layout but get any declared payload index they lack.
+		"""
+		sparse_config = {SPARSE_VECTOR: SparseVectorParams()} if sparse else None
+		if not self._exists(name):
+			self.client.create_collection(collection_name=name, sparse_vectors_config=sparse_config, **(profile or PROFILES["default"]).create_kwargs(vector_size, distance))
+			self._collections.add(name)
+		elif sparse and not self.has_sparse(name):
+			# Existing points get sparse vectors when they are next re-ingested
+			try:
+				self.client.update_collection(collection_name=name, sparse_vectors_config=sparse_config)
+			except Exception as e:
+				print(f"Warning: Could not add sparse vectors to '{name}', recreate it for hybrid search: {e}")
+		self._sparse_support.pop(name, None)
+		if payload_schema and self._remote:
+			self._ensure_indexes(name, payload_schema)
+
+	def _ensure_indexes(self, name: str, payload_schema: Dict[str, PayloadSchemaType]) -> None:
+		indexed = self._indexed.get(name)
+		if indexed is None:
+			indexed = self._indexed[name] = {k: v.data_type for k, v in (self.client.get_collection(name).payload_schema or {}).items()}
+		for field, schema in payload_schema.items():
+			if field in indexed:
+				if indexed[field] != schema:
+					print(f"Warning: '{name}.{field}' is indexed as {indexed[field]}, not {schema}; drop the index to change it")
+				continue
+			# Built in the background by the server; searches use it once ready
+			self.client.create_payload_index(collection_name=name, field_name=field, field_schema=schema, wait=False)
+			indexed[field] = schema
+
+	def has_sparse(self, name: str) -> bool:
+		if name not in self._sparse_support:
+			sparse_vectors = self.client.get_collection(name).config.params.sparse_vectors or {}
+			self._sparse_support[name] = SPARSE_VECTOR in sparse_vectors
+		return self._sparse_support[name]
+
+	def upsert(self, collection: str, embeddings: List[List[float]], payloads: List[Dict[str, Any]], ids: Optional[List[str]] = None, sparse_vectors: Optional[List[Tuple[List[int], List[float]]]] = None) -> None:
+		with metrics.span("qdrant.upsert", items=len(payloads)):
+			self.client.upsert(collection_name=collection, points=_points(embeddings, payloads, ids, sparse_vectors))
+
+	def upload(self, collection: str, embeddings: Any, payloads: List[Dict[str, Any]], ids: Optional[List[str]] = None, sparse_vectors: Optional[List[Tuple[List[int], List[float]]]] = None) -> None:
+		"""Bulk write through the client's batch uploader.
+
+		Requests are sized by bytes (QDRANT_UPLOAD_BATCH_MB), spread over
+		QDRANT_UPLOAD_PARALLEL processes and, unless QDRANT_UPLOAD_WAIT,
+		acknowledged once queued rather than applied; flush() is the barrier.
+		Both dense-only and hybrid writes go through upload_collection as
+		columns; hybrid dense rows are converted one batch slice at a time
+		(the client only takes all-NumPy named vectors) and no PointStruct
+		is built per chunk.
+		"""
+		if not payloads:
+			return
+		ids = ids or [_payload_point_id(p) for p in payloads]
+		batch_size = _upload_batch_size(embeddings, payloads, sparse_vectors, qdrant_config.upload_batch_mb)
+		options = {
+			"batch_size": batch_size,
+			# Worker processes only pay off when there are several requests to spread
+			"parallel": max(1, min(qdrant_config.upload_parallel, ceil(len(payloads) / batch_size))),
+			"wait": qdrant_config.upload_wait,
+		}
+		with metrics.span("qdrant.upload", items=len(payloads)):
+			if sparse_vectors is None:
+				vectors = np.asarray(embeddings, dtype=np.float32)
+			else:
+				vectors = _named_vectors(embeddings, sparse_vectors, batch_size)
+			self.client.upload_collection(collection_name=collection, vectors=vectors, payload=payloads, ids=ids, **options)
+		if self._remote and not qdrant_config.upload_wait:
+			with self._pending_lock:
+				self._pending.add(collection)
+
+	def flush(self) -> None:
+		with self._pending_lock:
+			pending, self._pending = self._pending, set()
+		for name in pending:
+			# Updates are applied in order, so a waited no-op delete (a filter matching nothing,
+			# sent to every shard) returns only after all earlier un-waited uploads are applied
+			with metrics.span("qdrant.barrier"):
+				self.client.delete(collection_name=name, points_selector=FilterSelector(filter=Filter(must=[HasIdCondition(has_id=[])])), wait=True)
+
+	def drop_collection(self, name: str) -> None:
+		self.client.delete_collection(name)
+		self._collections.discard(name)
+		self._sparse_support.pop(name, None)
+		self._indexed.pop(name, None)
+		with self._pending_lock:
+			self._pending.discard(name)
+
+	def delete(self, collection: str, ids: List[str]) -> None:
+		if ids:
+			self.client.delete(collection_name=collection, points_selector=PointIdsList(points=list(ids)))
+
+	def delete_where(self, collection: str, filter_: Filter) -> None:
+		self.client.delete(collection_name=collection, points_selector=FilterSelector(filter=filter_))
+
+	def existing_ids(self, collection: str, ids: List[str]) -> List[str]:
+		if not ids:
+			return []
+		return [str(r.id) for r in self.client.retrieve(collection, ids=list(ids), with_payload=False, with_vectors=False)]
+
+	def scroll(self, collection: str, filter_: Optional[Filter] = None) -> List[Dict[str, Any]]:
+		items: List[Dict[str, Any]] = []
+		offset = None
+		while True:
+			records, offset = self.client.scroll(collection, scroll_filter=filter_, limit=256, offset=offset, with_payload=True, with_vectors=False)
+			items += [{"id": r.id, "payload": r.payload} for r in records]
+			if offset is None:
+				return items
+
+	@metrics.traced("qdrant.query")
+	def query(self, collection: str, vector: List[float], top_k: int = 20, filter_: Optional[Filter] = None, with_vectors: bool = False, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> List[Dict[str, Any]]:
+		"""Dense search. `hnsw_ef` and `oversampling` trade latency for recall per query (defaults: QDRANT_SEARCH_HNSW_EF, the profile)."""
+		search_result = self.client.search(collection_name=collection, query_vector=vector, limit=top_k, query_filter=filter_, with_vectors=with_vectors, search_params=self.profile.search_params(hnsw_ef, oversampling))
+		return [self._to_item(r, with_vectors) for r in search_result]
+
+	@metrics.traced("qdrant.hybrid_query")
+	def hybrid_query(self, collection: str, vector: List[float], sparse_vector: Tuple[List[int], List[float]], top_k: int = 20, filter_: Optional[Filter] = None, with_vectors: bool = False, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+		"""Dense and sparse searches in one batched request; returns (dense_hits, sparse_hits)."""
+		requests = _hybrid_requests(vector, sparse_vector, top_k, filter_, with_vectors, self.profile.search_params(hnsw_ef, oversampling))
+		dense, sparse = self.client.search_batch(collection_name=collection, requests=requests)
+		return [self._to_item(r, with_vectors) for r in dense], [self._to_item(r, with_vectors) for r in sparse]
+
+	@staticmethod
+	def _to_item(r: Any, with_vectors: bool) -> Dict[str, Any]:
+		item = {
+			"id": r.id,
+			"score": r.score,
+			"payload": r.payload,
+		}
+		if with_vectors:
+			# Collections with named/sparse vectors return a dict keyed by vector name
+			item["vector"] = r.vector.get(DENSE_VECTOR) if isinstance(r.vector, dict) else r.vector
+		return item
+
+
+class AsyncQdrantStore:
+	"""QdrantStore on the async client, for the HTTP API's event loop."""
+
+	def __init__(self, url: str | None = None, api_key: Optional[str] = None):
+		location = url or qdrant_config.url
+		self._remote = location != ":memory:"
+		self.client = AsyncQdrantClient(location=location, api_key=api_key or qdrant_config.api_key, prefer_grpc=qdrant_config.prefer_grpc, grpc_port=qdrant_config.grpc_port)
+		self.profile = collection_profile()
+		self._sparse_support: Dict[str, bool] = {}
+		self._collections: set = set()
+
+	async def ensure_collection(self, name: str, vector_size: int, distance: Distance = Distance.COSINE, sparse: bool = False, profile: Optional[CollectionProfile] = None, payload_schema: Optional[Dict[str, PayloadSchemaType]] = None) -> None:
+		if name in self._collections:
+			return
+		if not await self.client.collection_exists(name):
+			sparse_config = {SPARSE_VECTOR: SparseVectorParams()} if sparse else None
+			await self.client.create_collection(collection_name=name, sparse_vectors_config=sparse_config, **(profile or PROFILES["default"]).create_kwargs(vector_size, distance))
+		if payload_schema and self._remote:
+			indexed = (await self.client.get_collection(name)).payload_schema or {}
+			for field, schema in payload_schema.items():
+				if field not in indexed:
+					await self.client.create_payload_index(collection_name=name, field_name=field, field_schema=schema, wait=False)
+		self._collections.add(name)
+		self._sparse_support.pop(name, None)
+
+	async def upsert(self, collection: str, embeddings: List[List[float]], payloads: List[Dict[str, Any]], ids: Optional[List[str]] = None, sparse_vectors: Optional[List[Tuple[List[int], List[float]]]] = None) -> None:
+		await self.client.upsert(collection_name=collection, points=_points(embeddings, payloads, ids, sparse_vectors))
+
+	async def has_sparse(self, name: str) -> bool:
+		if name not in self._sparse_support:
+			sparse_vectors = (await self.client.get_collection(name)).config.params.sparse_vectors or {}
+			self._sparse_support[name] = SPARSE_VECTOR in sparse_vectors
+		return self._sparse_support[name]
+
+	@metrics.traced("qdrant.query")
+	async def query(self, collection: str, vector: List[float], top_k: int = 20, filter_: Optional[Filter] = None, with_vectors: bool = False, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> List[Dict[str, Any]]:
+		search_result = await self.client.search(collection_name=collection, query_vector=vector, limit=top_k, query_filter=filter_, with_vectors=with_vectors, search_params=self.profile.search_params(hnsw_ef, oversampling))
+		return [QdrantStore._to_item(r, with_vectors) for r in search_result]
+
+	@metrics.traced("qdrant.hybrid_query")
+	async def hybrid_query(self, collection: str, vector: List[float], sparse_vector: Tuple[List[int], List[float]], top_k: int = 20, filter_: Optional[Filter] = None, with_vectors: bool = False, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+		requests = _hybrid_requests(vector, sparse_vector, top_k, filter_, with_vectors, self.profile.search_params(hnsw_ef, oversampling))
+		dense, sparse = await self.client.search_batch(collection_name=collection, requests=requests)
+		return [QdrantStore._to_item(r, with_vectors) for r in dense], [QdrantStore._to_item(r, with_vectors) for r in sparse]
+
+	async def close(self) -> None:
+		await self.client.close()
+
+
+class ThreadedAsyncStore:
+	"""Async facade over an in-process VectorStore: each call runs on a worker thread."""
+
+	def __init__(self, store: VectorStore):
+		self.store = store
+
+	async def ensure_collection(self, name: str, vector_size: int, distance: Distance = Distance.COSINE, sparse: bool = False, profile: Optional[CollectionProfile] = None, payload_schema: Optional[Dict[str, PayloadSchemaType]] = None) -> None:
+		await asyncio.to_thread(self.store.ensure_collection, name, vector_size, distance, sparse, profile, payload_schema)
+
+	async def upsert(self, collection: str, embeddings: List[List[float]], payloads: List[Dict[str, Any]], ids: Optional[List[str]] = None, sparse_vectors: Optional[List[Tuple[List[int], List[float]]]] = None) -> None:
+		await asyncio.to_thread(self.store.upsert, collection, embeddings, payloads, ids, sparse_vectors)
+
+	async def has_sparse(self, name: str) -> bool:
+		return self.store.has_sparse(name)
+
+	async def query(self, collection: str, vector: List[float], top_k: int = 20, filter_: Optional[Filter] = None, with_vectors: bool = False, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> List[Dict[str, Any]]:
+		return await asyncio.to_thread(self.store.query, collection, vector, top_k, filter_, with_vectors, hnsw_ef, oversampling)
+
+	async def hybrid_query(self, collection: str, vector: List[float], sparse_vector: Tuple[List[int], List[float]], top_k: int = 20, filter_: Optional[Filter] = None, with_vectors: bool = False, hnsw_ef: Optional[int] = None, oversampling: Optional[float] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+		return await asyncio.to_thread(self.store.hybrid_query, collection, vector, sparse_vector, top_k, filter_, with_vectors, hnsw_ef, oversampling)
+
+	async def close(self) -> None:
+		await asyncio.to_thread(self.store.flush)
+
+
+def make_store() -> VectorStore:
+	"""The store selected by VECTOR_BACKEND."""
+	if app_config.vector_backend == "faiss":
+		from faiss_store import FaissStore
+		return FaissStore()
+	if app_config.vector_backend != "qdrant":
+		raise ValueError(f"Unknown VECTOR_BACKEND '{app_config.vector_backend}' (expected qdrant or faiss)")
+	return QdrantStore()
+
+
+def make_async_store(sync_store: Callable[[], VectorStore]) -> AsyncQdrantStore | ThreadedAsyncStore:
+	"""Async store for the API: the async Qdrant client, or the shared in-process store behind threads."""
+	if app_config.vector_backend == "qdrant":
+		return AsyncQdrantStore()
+	return ThreadedAsyncStore(sync_store())
 
 
-def init_default_collections(store: QdrantStore) -> None:
-	store.ensure_collection(qdrant_config.collection, embedding_config.dimension)
-	store.ensure_collection(qdrant_config.memory_collection, embedding_config.dimension)
+def init_default_collections(store: VectorStore) -> None:
+	store.ensure_collection(qdrant_config.collection, embedding_config.dimension, sparse=app_config.hybrid_search, profile=collection_profile(), payload_schema=DOCUMENT_SCHEMA)
+	store.ensure_collection(qdrant_config.memory_collection, embedding_config.dimension, payload_schema=MEMORY_SCHEMA)